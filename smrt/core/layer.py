@@ -19,11 +19,17 @@ to create a snowpack using :py:func:`~smrt.inputs.make_medium.make_snowpack`.
 """
 
 from functools import wraps
+from collections import OrderedDict
 import copy
+import os
+import threading
+
+import numpy as np
 
 # local import
 from .error import SMRTError
 from .plugin import import_class
+from .lib import key_of
 
 from .globalconstants import FREEZING_POINT
 
@@ -208,7 +214,16 @@ To import the StickyHardSpheres class with spheres radius of 1mm, stickiness of
 
 def layer_properties(*required_arguments, **kwargs):   #### requires pyhton 3: , optional_arguments=None):
     """This decorator is used for the permittivity functions. It declares the layer properties needed to call
-the function and the optiona once. This allows permittivity functions to use any properties of the layer, as long as it is defined. """
+the function and the optiona once. This allows permittivity functions to use any properties of the layer, as long as it is defined.
+
+The decorated function can also be called with a list of layers, a snowpack or a list of snowpacks instead of a single layer. In this
+bulk mode, the layer properties are gathered in arrays and the function is called only once for all the layers. It returns an
+array with the layers along the last dimension (or a list of arrays, one per snowpack). The frequency can be an array, e.g.
+frequency[:, np.newaxis] returns an array of shape (nfrequency, nlayer). If the properties can not be gathered in arrays, the
+function is called for each layer.
+
+The results can be memoized (see :py:func:`set_permittivity_cache_size`). This is disabled by default.
+"""
 
     optional_arguments = kwargs.get('optional_arguments', None)
 
@@ -231,8 +246,142 @@ the function and the optiona once. This allows permittivity functions to use any
                         if hasattr(layer, ra):
                             kwargs[ra] = getattr(layer, ra)
 
-                return f(frequency, *newargs, **kwargs)
+                return memoized_call(f, frequency, newargs, kwargs)
+            elif len(args) == 1 and is_layer_collection(args[0]):
+                return bulk(frequency, args[0])
             else:
-                return f(frequency, *args, **kwargs)
+                return memoized_call(f, frequency, args, kwargs)
+
+        def bulk(frequency, layers):
+            # call f once for all the layers of a list of layers, a snowpack or a list of snowpacks
+
+            if hasattr(layers, "layers"):  # a snowpack
+                layers = layers.layers
+            elif all(hasattr(sp, "layers") for sp in layers):  # a list of snowpacks
+                snowpacks = layers
+                res = bulk(frequency, [layer for sp in snowpacks for layer in sp.layers])
+                split = np.cumsum([len(sp.layers) for sp in snowpacks])[:-1]
+                return np.split(res, split, axis=-1)
+
+            newargs = []
+            for ra in required_arguments:
+                if not all(hasattr(layer, ra) for layer in layers):
+                    raise Exception("The layer must have the '%s' attribute to call the function %s " % (ra, str(f)))
+                newargs.append(gather_layer_property(layers, ra))
+
+            kwargs = {}
+            for ra in optional_arguments or []:
+                n = sum(hasattr(layer, ra) for layer in layers)
+                if n == len(layers):
+                    kwargs[ra] = gather_layer_property(layers, ra)
+                elif n > 0:
+                    kwargs[ra] = None  # the optional argument is set for some layers only
+
+            if any(arg is None for arg in newargs + list(kwargs.values())):
+                # the properties can not be gathered in arrays
+                return np.stack(np.broadcast_arrays(*[newf(frequency, layer) for layer in layers]), axis=-1)
+
+            res = memoized_call(f, frequency, newargs, kwargs)
+            return np.broadcast_to(res, np.broadcast(res, np.empty(len(layers))).shape).copy()
+
+        newf.bulk = bulk
         return newf
     return wrapper
+
+
+def is_layer_collection(obj):
+    """return True if obj is a snowpack, a list of layers or a list of snowpacks"""
+    if hasattr(obj, "layers"):
+        return True
+    return isinstance(obj, (list, tuple)) and len(obj) > 0 and \
+        (all(isinstance(x, Layer) for x in obj) or all(hasattr(x, "layers") for x in obj))
+
+
+def gather_layer_property(layers, name):
+    # return the values of the property of the layers, as a single value if it is the same for all the layers, as an array if
+    # it is numerical and None otherwise.
+
+    values = [getattr(layer, name) for layer in layers]
+    if all(v is values[0] for v in values):
+        return values[0]
+    values = np.array(values)
+    return values if values.dtype != object and values.ndim == 1 else None
+
+
+_permittivity_cache = OrderedDict()
+_permittivity_cache_size = 0
+_permittivity_cache_lock = threading.Lock()
+_permittivity_cache_stats = {'hits': 0, 'misses': 0, 'pid': os.getpid()}
+
+
+def set_permittivity_cache_size(size):
+    """set the maximum number of results of the permittivity functions (decorated with :py:func:`layer_properties`) kept in memory.
+    The results are memoized by function and values of the arguments, which avoids recomputing the permittivity of the layers
+    with the same temperature, liquid water, salinity, ... for every layer, emmodel and solver call. Use 0 (the default) to
+    disable the memoization. The cache is local to each process.
+    """
+    global _permittivity_cache_size
+
+    with _permittivity_cache_lock:
+        _permittivity_cache_size = int(size)
+        while len(_permittivity_cache) > _permittivity_cache_size:
+            _permittivity_cache.popitem(last=False)
+
+
+def clear_permittivity_cache():
+    """clear the memoized results of the permittivity functions and reset the statistics"""
+
+    with _permittivity_cache_lock:
+        _permittivity_cache.clear()
+        _permittivity_cache_stats.update(hits=0, misses=0)
+
+
+def permittivity_cache_info():
+    """return the statistics of the memoization of the permittivity functions in this process (hits, misses, hit_rate, size and
+    maxsize)"""
+
+    with _permittivity_cache_lock:
+        _check_permittivity_cache_process()
+        hits, misses = _permittivity_cache_stats['hits'], _permittivity_cache_stats['misses']
+        return {'hits': hits, 'misses': misses, 'hit_rate': hits / (hits + misses) if hits + misses > 0 else 0.,
+                'size': len(_permittivity_cache), 'maxsize': _permittivity_cache_size}
+
+
+def _check_permittivity_cache_process():
+    # the cache and statistics inherited from the parent process (fork) are discarded
+    if _permittivity_cache_stats['pid'] != os.getpid():
+        _permittivity_cache.clear()
+        _permittivity_cache_stats.update(hits=0, misses=0, pid=os.getpid())
+
+
+def memoized_call(f, frequency, args, kwargs):
+    """call f(frequency, *args, **kwargs), using the memoized result if the permittivity cache is enabled"""
+
+    if _permittivity_cache_size <= 0:
+        return f(frequency, *args, **kwargs)
+
+    key = (f, key_of(frequency), tuple(key_of(x) for x in args),
+           tuple(sorted((k, key_of(v)) for k, v in kwargs.items())))
+    try:
+        hash(key)
+    except TypeError:
+        return f(frequency, *args, **kwargs)  # unhashable arguments, no memoization
+
+    with _permittivity_cache_lock:
+        _check_permittivity_cache_process()
+        if key in _permittivity_cache:
+            _permittivity_cache.move_to_end(key)
+            _permittivity_cache_stats['hits'] += 1
+            return _permittivity_cache[key]
+        _permittivity_cache_stats['misses'] += 1
+
+    res = f(frequency, *args, **kwargs)
+    if isinstance(res, np.ndarray):
+        res.flags.writeable = False  # shared between the callers
+
+    with _permittivity_cache_lock:
+        if _permittivity_cache_size > 0:
+            _permittivity_cache[key] = res
+            while len(_permittivity_cache) > _permittivity_cache_size:
+                _permittivity_cache.popitem(last=False)
+    return res
@@ -1,5 +1,8 @@
 
 import os
+import collections
+import functools
+import threading
 
 from collections.abc import Sequence
 import numpy as np
@@ -163,6 +166,11 @@ class smrt_matrix(object):
     for DORT computation where stream and polarization are collapsed in one dimension to allow matrix operation. In addition, the reflection and transmission matrix
     are often diagonal matrix, which needs to be handled because it saves space and allow much faster operations. This class implemented all these features.
 
+    The "blockdiagonal5" and "blockdiagonal4" types are block diagonal in polarization: V and H are coupled together but not with the third
+    Stokes component U, as in the mode m=0 of the phase matrix of isotropic media. The values are a tuple (vh, u) where vh has the shape
+    (2, 2, m, mu_s, mu_i) (resp. (2, 2, mu_s, mu_i)) and u the shape (m, mu_s, mu_i) (resp. (mu_s, mu_i)). These types can not be inferred
+    from the values and must be given with `mtype`.
+
     """
 
     def __init__(self, mat, mtype=None):
@@ -173,6 +181,9 @@ class smrt_matrix(object):
         else:
             self.values = mat
 
+            if mtype is not None and mtype.startswith("blockdiagonal") and not (isinstance(mat, tuple) and len(mat) == 2):
+                raise SMRTError("The values of a %s matrix must be a tuple (vh, u)" % mtype)
+
             if mtype is None:
                 if isinstance(mat, list) and len(mat) in [2, 3]:
                     # diagonal matrix
@@ -214,11 +225,32 @@ class smrt_matrix(object):
 
     @property
     def npol(self):
-        return self.values.shape[0]
+        return 3 if self.is_blockdiagonal() else self.values.shape[0]
 
     def isnull(self):
         return isnull(self)
 
+    def is_blockdiagonal(self):
+        return self.mtype.startswith("blockdiagonal")
+
+    def todense(self):
+        """return the equivalent dense5 or dense4 matrix of a blockdiagonal matrix. The other types are returned unchanged."""
+
+        if not self.is_blockdiagonal():
+            return self
+
+        vh, u = self.values
+        mat = np.zeros((3, 3) + u.shape, dtype=np.result_type(vh, u))
+        mat[0:2, 0:2] = vh
+        mat[2, 2] = u
+        return smrt_matrix(mat, mtype="dense" + self.mtype[-1])
+
+    def _map(self, func):
+        # apply func to the values, or to both blocks of a blockdiagonal matrix
+        if self.is_blockdiagonal():
+            return smrt_matrix(tuple(func(x) for x in self.values), mtype=self.mtype)
+        return smrt_matrix(func(self.values))
+
     def compress(self, mode=None, auto_reduce_npol=False):
         """compress a matrix. This comprises several actions:
         1) select one mode, if relevant (dense5, and diagonal5).
@@ -254,12 +286,20 @@ class smrt_matrix(object):
             # merge mu_s * pola_s and mu_i * pola_i
             return np.reshape(mat, (mat.shape[0] * mat.shape[1], mat.shape[2] * mat.shape[3]))  # return an 2x2 array !
 
-        elif self.mtype == "diagonal5":
+        elif self.mtype in ["diagonal5", "blockdiagonal5"]:
             if mode is not None:
                 return self.sel(mode=mode, auto_reduce_npol=auto_reduce_npol).compress()
             else:
                 raise NotImplementedError
 
+        elif self.mtype == "blockdiagonal4":
+            if auto_reduce_npol and mode == 0:
+                # 3pol->2pol, the U block is dropped
+                return smrt_matrix(self.values[0], mtype="dense4").compress()
+            else:
+                # U is interleaved with V and H in the compressed format, the null blocks are filled
+                return self.todense().compress()
+
         elif self.mtype == "diagonal4":
             if self.values.shape[0] == 3 and auto_reduce_npol and mode == 0:
                 ## 3pol->2pol
@@ -274,37 +314,48 @@ class smrt_matrix(object):
             raise NotImplementedError
 
     def __rmul__(self, other):
-        return smrt_matrix(other * self.values)
+        return self._map(lambda x: other * x)
 
     def __mul__(self, other):
-        return smrt_matrix(self.values * other)
+        return self._map(lambda x: x * other)
 
     def __truediv__(self, other):
-        return smrt_matrix(self.values / other)
+        return self._map(lambda x: x / other)
 
     def __add__(self, other):
         if isinstance(other, smrt_matrix):
-            return smrt_matrix(other.values + self.values)
+            if self.is_blockdiagonal() or other.is_blockdiagonal():
+                if self.mtype == other.mtype:
+                    return smrt_matrix((self.values[0] + other.values[0], self.values[1] + other.values[1]), mtype=self.mtype)
+                elif other.mtype == "0":
+                    return self
+                elif self.mtype == "0":
+                    return other
+            return smrt_matrix(other.todense().values + self.todense().values)
         else:
             raise NotImplementedError
 
     def __sub__(self, other):
         if isinstance(other, smrt_matrix):
-            return smrt_matrix(other.values - self.values)
+            if self.is_blockdiagonal() or other.is_blockdiagonal():
+                return self if other.mtype == "0" else self + (-1 * other)
+            return smrt_matrix(self.values - other.values)
         else:
             raise NotImplementedError
 
     def __abs__(self):
-        return np.abs(self.values)
+        return np.abs(self.todense().values)
 
     def __getitem__(self, key):
         if self.mtype == "0":
             return np.float64(0.)  # 0, but can be used as a numpy thing
 
         else:
-            return self.values[key]
+            return self.todense().values[key]
 
     def __setitem__(self, key, v):
+        if self.is_blockdiagonal():
+            raise SMRTError("Item assignment is not supported for %s matrix, set the blocks in values" % self.mtype)
         self.values[key] = v
 
     @property
@@ -313,6 +364,11 @@ class smrt_matrix(object):
             return np.array([[0.]])
         if self.mtype.startswith("diagonal"):
             return self.values
+        if self.is_blockdiagonal():
+            vh, u = self.values
+            # diagonal in incidence angle and pola
+            return np.concatenate((np.moveaxis(np.diagonal(np.diagonal(vh, axis1=-2, axis2=-1)), -1, 0),
+                                   np.diagonal(u, axis1=-2, axis2=-1)[np.newaxis]))
         else:
             return np.moveaxis(np.diagonal(np.diagonal(self.values, axis1=-2, axis2=-1)), -1, 0)  # diagonal in incidence angle and pola
             # the moveaxis is necessary to put back the pola indice at the first position because diagonal move the diagonale "index" to the end of the array.
@@ -322,7 +378,7 @@ class smrt_matrix(object):
         if 'mode' in kwargs:
             mode = kwargs['mode']
             # 3pol->2pol
-            if self.values.shape[0] == 3 and kwargs['auto_reduce_npol'] and mode == 0:
+            if self.npol == 3 and kwargs['auto_reduce_npol'] and mode == 0:
                 pola = slice(0, 2)
             else:
                 pola = slice(None)
@@ -330,12 +386,20 @@ class smrt_matrix(object):
                 return smrt_matrix(self.values[pola, pola, mode, :, :], mtype='dense4')
             elif self.mtype == "diagonal5":
                 return smrt_matrix(self.values[pola, mode, :], mtype='diagonal4')
+            elif self.mtype == "blockdiagonal5":
+                vh, u = self.values
+                if pola == slice(0, 2):
+                    return smrt_matrix(vh[:, :, mode], mtype='dense4')  # the U block is dropped
+                return smrt_matrix((vh[:, :, mode], u[mode]), mtype='blockdiagonal4')
 
             elif self.mtype == "dense4":
                 raise SMRTError("Dense4 matrix can not be selected by mode")
 
             elif self.mtype == "diagonal4":
                 raise SMRTError("Diagonal4 matrix can not be selected by mode")
+
+            elif self.mtype == "blockdiagonal4":
+                raise SMRTError("Blockdiagonal4 matrix can not be selected by mode")
             else:
                 raise NotImplementedError
         else:
@@ -343,7 +407,10 @@ class smrt_matrix(object):
 
     def __repr__(self):
 
-        shape = getattr(self.values, "shape", "")
+        if self.is_blockdiagonal():
+            shape = tuple(x.shape for x in self.values)
+        else:
+            shape = getattr(self.values, "shape", "")
         return str("smrt_matrix %s %s" % (self.mtype, shape)) + "\n" + str(self.values)
 
 
@@ -401,44 +468,146 @@ def generic_ft_even_matrix(phase_function, m_max, nsamples=None):
 
     npol = p.npol
 
-    # mirror the phase function
     assert len(p.values.shape) == 5
-    p_mirror = p.values[:, :, -2:0:-1, :, :].copy()
-    if npol >= 3:
-        p_mirror[0:2, 2] = -p_mirror[0:2, 2]
-        p_mirror[2, 0:2] = -p_mirror[2, 0:2]
 
-    # concatenate the two mirrored phase function
-    p = np.concatenate((p.values, p_mirror), axis=2)
-    assert(p.shape[2] == nsamples)
+    # the Fourier Transform along phi axis (axis=2) is computed from the samples between 0 and pi by projection on the cos and sin
+    # of the modes. This is equivalent to the FFT of the phase function mirrored on pi to 2*pi (with the sign change of the U
+    # components) but only the m_max + 1 modes are computed.
+    cos_basis, sin_basis = ft_even_basis(m_max, int(nsamples))
 
-    # compute the Fourier Transform of the phase function along phi axis (axis=2)
-    ft_p = np.fft.fft(p, axis=2)
+    def project(basis, x):
+        return np.moveaxis(np.tensordot(basis, x, axes=(1, 2)), 0, 2).real
 
-    ft_even_p = smrt_matrix.empty((npol, npol, m_max + 1, p.shape[-2], p.shape[-1]))
+    ft_even_p = smrt_matrix.empty((npol, npol, m_max + 1, p.values.shape[-2], p.values.shape[-1]))
 
-    # m=0 mode
-    ft_even_p[:, :, 0] = ft_p[:, :, 0].real * (1.0 / nsamples)
+    # the factor 2 for m>=1 comes from the change exp -> cos, i.e. exp(-ix) + exp(+ix)= 2 cos(x)
+    delta = np.full((m_max + 1, 1, 1), 2.0 / nsamples)
+    delta[0] = 1.0 / nsamples
 
-    # m>=1 modes
     if npol == 2:
-        # the factor 2 comes from the change exp -> cos, i.e. exp(-ix) + exp(+ix)= 2 cos(x)
-        ft_even_p[:, :, 1:] = ft_p[:, :, 1:m_max + 1].real * (2.0 / nsamples)
+        ft_even_p.values[:] = project(cos_basis, p.values) * delta
 
     else:
-        delta = 2.0 / nsamples
-        ft_even_p[0:2, 0:2, 1:] = ft_p[0:2, 0:2, 1:m_max + 1].real * delta
+        ft_even_p[0:2, 0:2] = project(cos_basis, p.values[0:2, 0:2]) * delta
+        ft_even_p[2, 2] = project(cos_basis, p.values[2:3, 2:3])[0, 0] * delta
 
         # For the even matrix:
         # Sin components needed for p31, p32. Negative sin components needed for p13, p23. Cos for p33
         # The sign for 0:2, 2 and 2, 0:2 have been double check with Rayleigh and Mazter 2006 formulation of the Rayeligh Matrix (p111-112)
-        ft_even_p[0:2, 2, 1:] = ft_p[0:2, 2, 1:m_max + 1].imag * delta
-        ft_even_p[2, 0:2, 1:] = - ft_p[2, 0:2, 1:m_max + 1].imag * delta
-        ft_even_p[2, 2, 1:] = ft_p[2, 2, 1:m_max + 1].real * delta
+        ft_even_p[0:2, 2, 1:] = - project(sin_basis[1:], p.values[0:2, 2:3])[:, 0] * delta[1:]
+        ft_even_p[2, 0:2, 1:] = project(sin_basis[1:], p.values[2:3, 0:2])[0] * delta[1:]
+
+        # the m=0 mode of the mirrored U components only retains the samples at 0 and pi
+        ft_even_p[0:2, 2, 0] = (p.values[0:2, 2, 0] + p.values[0:2, 2, -1]).real * delta[0]
+        ft_even_p[2, 0:2, 0] = (p.values[2, 0:2, 0] + p.values[2, 0:2, -1]).real * delta[0]
 
     return ft_even_p  # order is pola_s, pola_i, m, mu_s, mu_i
 
 
+def generic_ft_even_mode(phase_function, m, m_max, nsamples=None):
+    """Calculation of the single mode m of the Fourier decomposition computed by :py:func:`generic_ft_even_matrix`, with the same
+    sampling in dphi. The phase function is evaluated one sample of dphi at a time so that the memory is bounded to the size of a
+    single mode.
+
+    :param phase_function: must be a function taking dphi as input. It is assumed that phi is symmetrical (it is in cos(phi))
+    :param m: mode to compute
+    :param m_max: maximum Fourier decomposition mode, used to set the number of samples in dphi as in
+        :py:func:`generic_ft_even_matrix`
+
+    :returns: dense4 smrt_matrix with dimensions pola_s, pola_i, mu_s, mu_i
+    """
+
+    if nsamples is None:
+        nsamples = 2**np.ceil(3 + np.log(m_max + 1) / np.log(2))
+
+    assert nsamples > 2 * m_max
+
+    dphi = np.linspace(0, np.pi, int(nsamples // 2 + 1))
+    cos_basis, sin_basis = ft_even_basis(m_max, int(nsamples))
+    delta = (1.0 if m == 0 else 2.0) / nsamples
+
+    ft_even_p = None
+
+    for j in range(len(dphi)):
+        p = phase_function(dphi[j:j + 1]).values[:, :, 0].real
+
+        if ft_even_p is None:
+            ft_even_p = smrt_matrix.zeros(p.shape, mtype="dense4")
+            npol = p.shape[0]
+        values = ft_even_p.values
+
+        if npol == 2:
+            values += cos_basis[m, j] * delta * p
+        else:
+            values[0:2, 0:2] += cos_basis[m, j] * delta * p[0:2, 0:2]
+            values[2, 2] += cos_basis[m, j] * delta * p[2, 2]
+
+            if m > 0:
+                values[0:2, 2] -= sin_basis[m, j] * delta * p[0:2, 2]
+                values[2, 0:2] += sin_basis[m, j] * delta * p[2, 0:2]
+            elif j == 0 or j == len(dphi) - 1:
+                # the m=0 mode of the mirrored U components only retains the samples at 0 and pi
+                values[0:2, 2] += delta * p[0:2, 2]
+                values[2, 0:2] += delta * p[2, 0:2]
+
+    return ft_even_p  # order is pola_s, pola_i, mu_s, mu_i
+
+
+@functools.lru_cache(maxsize=16)
+def ft_even_basis(m_max, nsamples):
+    """return the cos and sin basis to compute the modes 0 to m_max of the Fourier Transform of an even (resp. odd) function of phi
+    sampled with nsamples // 2 + 1 points from 0 to pi included. The weights account for the mirrored samples between pi and 2*pi.
+"""
+    dphi = np.linspace(0, np.pi, nsamples // 2 + 1)
+    weight = np.full(len(dphi), 2.)
+    weight[0] = weight[-1] = 1.
+
+    m = np.arange(m_max + 1)[:, np.newaxis]
+    cos_basis = weight * np.cos(m * dphi)
+    sin_basis = weight * np.sin(m * dphi)
+    cos_basis.flags.writeable = False
+    sin_basis.flags.writeable = False
+    return cos_basis, sin_basis
+
+
+def key_of(x):
+    """return a hashable key for x, comparing the arrays by value"""
+    if isinstance(x, np.ndarray):
+        return (x.dtype.str, x.shape, x.tobytes())
+    return x
+
+
+def array_lru_cache(maxsize=8):
+    """decorator to cache the result of a function whose arguments are arrays (e.g. stream cosines) or hashable objects.
+    The arrays are compared by value. The returned arrays are made read-only because they are shared between the callers.
+"""
+    def decorator(func):
+        cache = collections.OrderedDict()
+        lock = threading.Lock()
+
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = tuple(key_of(x) for x in args)
+            with lock:
+                if key in cache:
+                    cache.move_to_end(key)
+                    return cache[key]
+            res = func(*args)
+            for x in (res if isinstance(res, tuple) else (res, )):
+                if isinstance(x, np.ndarray):
+                    x.flags.writeable = False
+            with lock:
+                cache[key] = res
+                if len(cache) > maxsize:
+                    cache.popitem(last=False)
+            return res
+
+        wrapper.cache_clear = cache.clear
+        return wrapper
+
+    return decorator
+
+
 def set_max_numerical_threads(nthreads):
     """set the maximum number of threads for a few known library. This is useful to disable parallel computing in 
 SMRT when using parallel computing to call multiple // SMRT runs. This avoid over-committing the CPUs and results 
@@ -41,6 +41,17 @@ Example::
 
 The `res` variable has now a coordinate `time` and res.TbV() returns a timeseries.
 
+When the rtsolver is None, the model only computes the electromagnetic properties of the layers. The :py:meth:`~Model.run` method
+returns an xarray Dataset with the scattering (`ks`), absorption (`ka`) and extinction (`ke`) coefficients, the effective
+permittivity and the single scattering albedo (`ssalb`) of each layer, for each frequency and snowpack.
+
+Example::
+
+    m = make_model("iba", None)
+    properties = m.run(sensor, snowpacks)
+
+    properties.ks.sel(frequency=37e9)
+
 """
 
 from collections.abc import Sequence
@@ -50,6 +61,7 @@ import copy
 
 import numpy as np
 import pandas as pd
+import xarray as xr
 
 from .error import SMRTError
 from .result import concat_results
@@ -170,7 +182,8 @@ class Model(object):
                 list/generator of simulations, executes the function on each simulation and returns a list of results.
                 'parallel_computation' allows to select between two default (basic) runners (sequential and joblib).
                 Use 'runner' for more advanced parallel distributed computations.
-            :returns: result of the calculation(s) as a :py:class:`Results` instance
+            :returns: result of the calculation(s) as a :py:class:`Results` instance, or as a xarray Dataset of the layer
+                electromagnetic properties if the model has no rtsolver.
         """
 
         if atmosphere is not None:
@@ -201,6 +214,9 @@ class Model(object):
             results = [concat_results(results[i: i + n], dimension) for i in range(0, len(results), n)]
 
         assert len(results) == 1
+
+        if self.rtsolver is None and results[0].frequency.ndim == 0:
+            return results[0].expand_dims('frequency')
         return results[0]
 
     def prepare_simulations(self, sensor, snowpack, snowpack_dimension):
@@ -238,7 +254,11 @@ class Model(object):
 
         # the sensor object is split in its basic sensors (config). How deep the sensor is split depends on the
         # radiative transfer solver's broadcast capability.
-        rt_solver_broadcast_capability = getattr(self.rtsolver, "_broadcast_capability", [])
+        if self.rtsolver is None:
+            # the layer electromagnetic properties only depend on the frequency
+            rt_solver_broadcast_capability = ["theta_inc", "polarization_inc", "theta", "phi", "polarization"]
+        else:
+            rt_solver_broadcast_capability = getattr(self.rtsolver, "_broadcast_capability", [])
 
         sensor_configurations = [(axis, values) for (axis, values) in sensor.configurations() if axis not in rt_solver_broadcast_capability]
 
@@ -280,15 +300,22 @@ class Model(object):
             # the same model for all layers
             emmodel_list = itertools.cycle([self.emmodel])
 
-        for i, (emmodel, layer) in enumerate(zip(emmodel_list, snowpack.layers)):
-            if isinstance(self.emmodel_options, Sequence):
-                emmodel_options = self.emmodel_options[i]
-            else:
-                emmodel_options = self.emmodel_options
-            em = make_emmodel(emmodel, sensor, layer, **emmodel_options)
-            emmodel_instances.append(em)
+        if not lib.is_sequence(self.emmodel) and not isinstance(self.emmodel_options, Sequence) \
+                and hasattr(self.emmodel, "batch"):
+            # the emmodel is able to process all the layers at once
+            emmodel_instances = self.emmodel.batch(sensor, snowpack.layers, **self.emmodel_options)
+        else:
+            for i, (emmodel, layer) in enumerate(zip(emmodel_list, snowpack.layers)):
+                if isinstance(self.emmodel_options, Sequence):
+                    emmodel_options = self.emmodel_options[i]
+                else:
+                    emmodel_options = self.emmodel_options
+                em = make_emmodel(emmodel, sensor, layer, **emmodel_options)
+                emmodel_instances.append(em)
 
-        if self.rtsolver is not None:
+        if self.rtsolver is None:
+            return emmodel_properties(sensor, emmodel_instances)
+        else:
             # need to create the rtsolver ?
             if inspect.isclass(self.rtsolver):
                 rtsolver = self.rtsolver(**self.rtsolver_options)  # create with arguments
@@ -312,6 +339,25 @@ class Model(object):
         return RunPromise(self, sensor, snowpack, kwargs)
 
 
+def emmodel_properties(sensor, emmodel_instances):
+    """return the electromagnetic properties of the emmodel instances of the layers as a xarray Dataset."""
+
+    ks = np.array([em.ks for em in emmodel_instances], dtype=float)
+    ka = np.array([em.ka for em in emmodel_instances], dtype=float)
+    ke = ks + ka
+    effective_permittivity = np.array([em.effective_permittivity() for em in emmodel_instances], dtype=complex)
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        ssalb = np.where(ke > 0, ks / ke, 0.)
+
+    return xr.Dataset({'ks': ('layer', ks),
+                       'ka': ('layer', ka),
+                       'ke': ('layer', ke),
+                       'effective_permittivity': ('layer', effective_permittivity),
+                       'ssalb': ('layer', ssalb)},
+                      coords={'layer': np.arange(len(emmodel_instances)), 'frequency': sensor.frequency})
+
+
 class SequentialRunner(object):
     """Run the simulations sequentially on a single (local) core. This is the most simple, but inefficient way to run smrt simulations."""
 
@@ -420,6 +420,10 @@ def concat_results(result_list, coord):
     else:
         raise SMRTError('unknown type for the coord argument')
 
+    if isinstance(result_list[0], xr.Dataset):
+        # layer electromagnetic properties computed without rtsolver
+        return xr.concat(result_list, index, join="outer")
+
     ResultClass = type(result_list[0])
     if not all([type(result) == ResultClass for result in result_list]):
         raise SMRTError("The results are not all of the same type")
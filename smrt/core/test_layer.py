@@ -1,9 +1,78 @@
 
+import numpy as np
 
 from .layer import make_microstructure_model
+from smrt import make_snowpack
+from smrt.permittivity.wetsnow import wetsnow_permittivity
 
 
 def test_microstructure_model():
     shs = make_microstructure_model("sticky_hard_spheres", radius=1.0, stickiness=0.5, frac_volume=0.3)
 
 
+
+
+def test_layer_properties_bulk():
+    sp = make_snowpack([0.1, 0.2, 0.3], "exponential", density=300, temperature=[250, 265, 273],
+                       liquid_water=[0, 0.01, 0.05], corr_length=1e-4)
+
+    eps = wetsnow_permittivity(37e9, sp)
+    np.testing.assert_allclose(eps, [wetsnow_permittivity(37e9, layer) for layer in sp.layers])
+
+    eps = wetsnow_permittivity(np.array([19e9, 37e9])[:, np.newaxis], sp.layers)
+    assert eps.shape == (2, 3)
+    np.testing.assert_allclose(eps[0], [wetsnow_permittivity(19e9, layer) for layer in sp.layers])
+
+    eps = wetsnow_permittivity.bulk(37e9, [sp, make_snowpack([1], "exponential", density=300, temperature=260,
+                                                             liquid_water=0, corr_length=1e-4)])
+    assert [len(e) for e in eps] == [3, 1]
+
+
+def test_permittivity_cache():
+    from .layer import set_permittivity_cache_size, clear_permittivity_cache, permittivity_cache_info
+    from smrt import make_model, sensor_list
+
+    sp = make_snowpack([0.1, 0.2, 0.3, 10], "exponential", density=300, temperature=[260, 260, 265, 265],
+                       liquid_water=[0, 0, 0.01, 0.01], corr_length=1e-4)
+    sensor = sensor_list.amsre('37V')
+    m = make_model("iba", "dort")
+    tb = m.run(sensor, sp).TbV()
+
+    try:
+        set_permittivity_cache_size(16)
+        clear_permittivity_cache()
+        assert m.run(sensor, sp).TbV() == tb
+
+        info = permittivity_cache_info()
+        assert info['hits'] > 0 and info['misses'] > 0
+        assert 0 < info['hit_rate'] < 1
+        assert info['size'] <= info['maxsize'] == 16
+
+        set_permittivity_cache_size(1)
+        assert permittivity_cache_info()['size'] == 1
+    finally:
+        set_permittivity_cache_size(0)
+        clear_permittivity_cache()
+
+    assert permittivity_cache_info()['size'] == 0
+
+
+def test_permittivity_cache_distinguishes_functions():
+    from .layer import layer_properties, set_permittivity_cache_size, clear_permittivity_cache
+
+    def factory(c):
+        @layer_properties("temperature")
+        def perm(frequency, temperature):
+            return c + 0j
+        return perm
+
+    perm3, perm5 = factory(3.), factory(5.)
+    assert perm3.__qualname__ == perm5.__qualname__
+
+    try:
+        set_permittivity_cache_size(100)
+        assert perm3(10e9, 260.) == 3
+        assert perm5(10e9, 260.) == 5
+    finally:
+        set_permittivity_cache_size(0)
+        clear_permittivity_cache()
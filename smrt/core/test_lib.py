@@ -4,7 +4,7 @@ import numpy as np
 
 from smrt.inputs.make_medium import make_snow_layer
 from smrt.inputs.sensor_list import amsre
-from smrt.core.lib import generic_ft_even_matrix
+from smrt.core.lib import generic_ft_even_matrix, generic_ft_even_mode, smrt_matrix
 from smrt.emmodel.rayleigh import Rayleigh
 
 from smrt.microstructure_model.independent_sphere import IndependentSphere
@@ -41,4 +41,76 @@ def test_generic_ft_even_matrix():
 
     for m in [0, 1, 2]:
         print("mode=", m)
-        assert np.allclose(ft_even_p[:, :, m, :, :], ft_even_p2[:, :, m, :, :])
\ No newline at end of file
+        assert np.allclose(ft_even_p[:, :, m, :, :], ft_even_p2[:, :, m, :, :])
+
+
+def test_smrt_matrix_sub():
+
+    a = smrt_matrix(np.full((2, 2, 3), 3.))
+    b = smrt_matrix(np.ones((2, 2, 3)))
+
+    assert np.all((a - b).values == 2)
+
+
+def test_blockdiagonal_matrix():
+
+    rng = np.random.default_rng(0)
+    mat = smrt_matrix((rng.random((2, 2, 1, 4, 5)), rng.random((1, 4, 5))), mtype="blockdiagonal5")
+    dense = mat.todense()
+
+    assert mat.npol == 3
+    assert dense.mtype == "dense5"
+    assert np.all(dense.values[0:2, 2] == 0) and np.all(dense.values[2, 0:2] == 0)
+    np.testing.assert_allclose(mat.diagonal, dense.diagonal)
+    np.testing.assert_allclose(mat[1, 2], dense[1, 2])
+
+    for auto_reduce_npol in [True, False]:
+        np.testing.assert_allclose(mat.compress(mode=0, auto_reduce_npol=auto_reduce_npol),
+                                   dense.compress(mode=0, auto_reduce_npol=auto_reduce_npol))
+
+    # selecting the mode m=0 with the reduction to 2 polarizations drops the U block
+    assert mat.sel(mode=0, auto_reduce_npol=True).mtype == "dense4"
+    assert mat.sel(mode=0, auto_reduce_npol=False).mtype == "blockdiagonal4"
+
+    assert (2 * mat).mtype == (mat / 2).mtype == (mat + mat).mtype == "blockdiagonal5"
+    np.testing.assert_allclose((mat * 2 + mat / 2 - mat).todense().values, 1.5 * dense.values)
+    np.testing.assert_allclose(abs(mat - dense), 0)
+    assert mat + smrt_matrix(0) is mat
+
+
+def test_generic_ft_even_matrix_vs_fft():
+
+    em = setup_func_em()
+    mu = np.cos(np.linspace(0.1, 3, 7))
+    npol, m_max, nsamples = 3, 3, 16
+
+    def phase_function(dphi):
+        return em.phase(mu, mu, dphi, npol=npol)
+
+    ft_even_p = generic_ft_even_matrix(phase_function, m_max=m_max, nsamples=nsamples)
+
+    # reference: FFT on the full period
+    dphi = np.arange(nsamples) * 2 * np.pi / nsamples
+    ft_p = np.fft.fft(em.phase(mu, mu, dphi, npol=npol).values, axis=2)[:, :, :m_max + 1] / nsamples
+
+    assert np.allclose(ft_even_p[:, :, 0], ft_p[:, :, 0].real)
+    assert np.allclose(ft_even_p[0:2, 0:2, 1:], 2 * ft_p[0:2, 0:2, 1:].real)
+    assert np.allclose(ft_even_p[0:2, 2, 1:], 2 * ft_p[0:2, 2, 1:].imag)
+    assert np.allclose(ft_even_p[2, 0:2, 1:], -2 * ft_p[2, 0:2, 1:].imag)
+    assert np.allclose(ft_even_p[2, 2, 1:], 2 * ft_p[2, 2, 1:].real)
+
+
+def test_generic_ft_even_mode():
+
+    em = setup_func_em()
+    mu = np.cos(np.linspace(0.1, 3, 7))
+
+    def phase_function(dphi):
+        return em.phase(mu, mu, dphi, npol=3)
+
+    ft_even_p = generic_ft_even_matrix(phase_function, m_max=3)
+
+    for m in range(4):
+        mode = generic_ft_even_mode(phase_function, m, m_max=3)
+        assert mode.mtype == "dense4"
+        np.testing.assert_allclose(mode.values, ft_even_p.values[:, :, m], atol=1e-12 * np.max(np.abs(ft_even_p.values)))
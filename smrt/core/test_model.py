@@ -0,0 +1,38 @@
+# coding: utf-8
+
+import numpy as np
+
+from smrt import make_snowpack, make_model, make_emmodel, sensor_list
+from smrt.core.sensor import passive
+
+
+def test_emmodel_properties():
+
+    sensor = passive([19e9, 37e9], [40, 55])
+    snowpacks = [make_snowpack([0.3, 1], "exponential", density=[250, 300], temperature=265, corr_length=[1e-4, 2e-4]),
+                 make_snowpack([0.3, 1, 2], "exponential", density=[200, 300, 350], temperature=260, corr_length=1.5e-4)]
+
+    properties = make_model("iba", None).run(sensor, snowpacks)
+
+    assert dict(properties.sizes) == {'frequency': 2, 'snowpack': 2, 'layer': 3}
+
+    em = make_emmodel("iba", passive(37e9, 40), snowpacks[1].layers[2])
+    prop = properties.sel(frequency=37e9, snowpack=1, layer=2)
+    np.testing.assert_allclose(prop.ks, em.ks)
+    np.testing.assert_allclose(prop.ka, em.ka)
+    np.testing.assert_allclose(prop.ke, em.ks + em.ka)
+    np.testing.assert_allclose(prop.ssalb, em.ks / (em.ks + em.ka))
+    np.testing.assert_allclose(prop.effective_permittivity, em.effective_permittivity())
+
+    # the first snowpack has only two layers
+    assert np.isnan(properties.ks.sel(snowpack=0, layer=2)).all()
+
+
+def test_emmodel_properties_single_frequency():
+
+    sp = make_snowpack([0.3, 1], "exponential", density=[250, 300], temperature=265, corr_length=[1e-4, 2e-4])
+
+    properties = make_model("iba", None).run(sensor_list.amsre('37V'), sp)
+
+    assert properties.ks.dims == ('frequency', 'layer')
+    assert properties.ks.shape == (1, 2)
@@ -32,10 +32,6 @@ Examples:
 
 """
 
-# Stdlib import
-import math
-import cmath
-
 # other import
 import numpy as np
 
@@ -43,6 +39,7 @@ import numpy as np
 # local import
 from ..core.error import SMRTError
 from ..core.globalconstants import C_SPEED
+from ..microstructure_model.autocorrelation import stack_microstructures
 from .rayleigh import Rayleigh
 
 #
@@ -69,36 +66,34 @@ class DMRT_QCA_ShortRange(Rayleigh):
         if layer.frac_volume > 0.5 and dense_snow_correction == "auto":
             layer = layer.inverted_medium()
 
-        f = layer.frac_volume
-
         e0 = layer.permittivity(0, sensor.frequency)  # background permittivity
         es = layer.permittivity(1, sensor.frequency)  # scatterer permittivity
 
-        lmda = C_SPEED / sensor.frequency
-
         if not hasattr(layer.microstructure, "stickiness") or not hasattr(layer.microstructure, "compute_t"):
             raise SMRTError("DMRT_ShortRange is only compatible with SHS microstructure model")
 
-        radius = layer.microstructure.radius
-        t = layer.microstructure.compute_t()
+        self._effective_permittivity, self.ks, self.ka = qca_shortrange(sensor.frequency, layer.frac_volume, e0, es,
+                                                                        layer.microstructure.radius, layer.microstructure.compute_t())
 
-        y = (es - e0) / (es + 2*e0)
+    @classmethod
+    def batch(cls, sensor, layers, dense_snow_correction="auto"):
+        """create the emmodel instances for all the layers at once. The dense snow inversion, the effective permittivity, ks and ka
+        are computed for all the layers in a single vectorized pass.
 
-        fy = f*y
-
-        k0 = (2 * math.pi / lmda) * cmath.sqrt(e0).real
-        Eeff = e0 + 3*fy*e0/(1-fy) * (1 + 2j/3* (k0 * radius)**3 * y * (1-f)**4 / ((1-fy)*(1+2*f-t*f*(1-f))**2) )
-        Ks =   2/(9*f) * k0 * (k0 * radius)**3 * abs(Eeff/e0 - 1)**2  * (1-f)**4 / (1+2*f-t*f*(1-f))**2  #  TODO: to further double check
-
-        beta = 2 * k0 * cmath.sqrt(Eeff).imag
+        :param sensor: sensor instance
+        :param layers: list of layers
+        :param dense_snow_correction: see :py:class:`DMRT_QCA_ShortRange`.
 
-        if Ks >= beta:
-            raise SMRTError("Grain diameter is too large for DMRT_ShortRange resulting in single scattering albedo larger than 1."
-                            "It is recommended to decrease the size or used an alternative emmodel able to do Mie calculations.")
+        :returns: list of emmodel instances, one for each layer
+        """
+        properties = None
+        if cls.__init__ is DMRT_QCA_ShortRange.__init__:  # a subclass with its own __init__ is created layer by layer
+            properties = shortrange_layer_properties(sensor, layers, dense_snow_correction)
+        if properties is None:
+            return [cls(sensor, layer, dense_snow_correction=dense_snow_correction) for layer in layers]
 
-        self._effective_permittivity = Eeff
-        self.ks = Ks
-        self.ka = beta - self.ks
+        Eeff, ks, ka = qca_shortrange(sensor.frequency, *properties)
+        return [cls.from_properties(ks[i], ka[i], Eeff[i]) for i in range(len(ks))]
 
     def basic_check(self):
         # TODO Ghi: check the microstructure model is compatible.
@@ -117,3 +112,56 @@ class DMRT_QCA_ShortRange(Rayleigh):
     # The effective_permittivity is inherited from Rayleigh  // Don't remove the commented code
     # def effective_permittivity(self):
     #    return self._effective_permittivity
+
+
+def qca_shortrange(frequency, f, e0, es, radius, t):
+    """compute the effective permittivity, the scattering and the absorption coefficients of DMRT QCA in the short range limit.
+    All the arguments except the frequency can be arrays over the layers."""
+
+    lmda = C_SPEED / frequency
+
+    y = (es - e0) / (es + 2*e0)
+
+    fy = f*y
+
+    k0 = (2 * np.pi / lmda) * np.emath.sqrt(e0).real
+    Eeff = e0 + 3*fy*e0/(1-fy) * (1 + 2j/3* (k0 * radius)**3 * y * (1-f)**4 / ((1-fy)*(1+2*f-t*f*(1-f))**2) )
+    Ks =   2/(9*f) * k0 * (k0 * radius)**3 * abs(Eeff/e0 - 1)**2  * (1-f)**4 / (1+2*f-t*f*(1-f))**2  #  TODO: to further double check
+
+    beta = 2 * k0 * np.emath.sqrt(Eeff).imag
+
+    check_single_scattering_albedo(Ks >= beta)
+
+    return Eeff, Ks, beta - Ks
+
+
+def shortrange_layer_properties(sensor, layers, dense_snow_correction):
+    """return the fractional volume, the permittivities, the radius and the t parameter as arrays over the layers, after the dense snow
+    inversion. Return None if the microstructures of the layers can not be stacked."""
+
+    microstructure = stack_microstructures([getattr(layer, "microstructure", None) for layer in layers])
+    if microstructure is None or not hasattr(microstructure, "stickiness") or not hasattr(microstructure, "compute_t"):
+        return None
+
+    f = np.array([layer.frac_volume for layer in layers], dtype=float)
+    e0 = np.array([layer.permittivity(0, sensor.frequency) for layer in layers])  # background permittivity
+    es = np.array([layer.permittivity(1, sensor.frequency) for layer in layers])  # scatterer permittivity
+
+    if dense_snow_correction == "auto":
+        # snow is modeled as air bubble in ice instead of ice spheres in air
+        dense = f > 0.5
+        f = np.where(dense, 1 - f, f)
+        e0, es = np.where(dense, es, e0), np.where(dense, e0, es)
+        microstructure.frac_volume = f
+
+    return f, e0, es, microstructure.radius, microstructure.compute_t()
+
+
+def check_single_scattering_albedo(invalid):
+    # raise an error if the single scattering albedo is larger than 1 in any layer
+    if np.any(invalid):
+        msg = "Grain diameter is too large for DMRT_ShortRange resulting in single scattering albedo larger than 1." \
+              "It is recommended to decrease the size or used an alternative emmodel able to do Mie calculations."
+        if np.ndim(invalid) > 0:
+            msg += " Invalid layers: %s" % ", ".join(str(i) for i in np.flatnonzero(invalid))
+        raise SMRTError(msg)
@@ -32,10 +32,6 @@ Examples:
 
 """
 
-# Stdlib import
-import math
-import cmath
-
 # other import
 import numpy as np
 
@@ -44,6 +40,7 @@ import numpy as np
 from ..core.error import SMRTError
 from ..core.globalconstants import C_SPEED
 from .rayleigh import Rayleigh
+from .dmrt_qca_shortrange import shortrange_layer_properties, check_single_scattering_albedo
 
 #
 # DMRT short range derives from Rayleigh because it has the same phase matrix
@@ -69,53 +66,34 @@ class DMRT_QCACP_ShortRange(Rayleigh):
         if layer.frac_volume > 0.5 and dense_snow_correction == "auto":
             layer = layer.inverted_medium()
 
-        f = layer.frac_volume
-
         e0 = layer.permittivity(0, sensor.frequency)  # background permittivity
         es = layer.permittivity(1, sensor.frequency)  # scatterer permittivity
 
-        lmda = C_SPEED / sensor.frequency
-
         if not hasattr(layer.microstructure, "stickiness") or not hasattr(layer.microstructure, "compute_t"):
             raise SMRTError("DMRT_ShortRange is only compatible with SHS microstructure model")
 
-        radius = layer.microstructure.radius
-        t = layer.microstructure.compute_t()
-
-        # these formulations are taken from DMRT-ML Picard et al. 2013
-        #
-        # Solve the 0th-order solution: Eeff0
-        # Eeff0^2 + Eeff0 *[ (Ei-eo)/3*(1-4f)-eo] - eo (Ei-1)/3*(1-f) = 0
-
-        b = (es - e0) * (1.0 - 4.0 * f) / 3.0 - e0
-        c = -e0 * (es - e0) * (1.0 - f) / 3.0
-
-        discriminant = b**2 - 4 * c
+        self._effective_permittivity, self.ks, self.ka = qcacp_shortrange(sensor.frequency, layer.frac_volume, e0, es,
+                                                                          layer.microstructure.radius, layer.microstructure.compute_t())
 
-        # solution
-        Eeff0 = 0.5 * (-b + cmath.sqrt(discriminant))
+    @classmethod
+    def batch(cls, sensor, layers, dense_snow_correction="auto"):
+        """create the emmodel instances for all the layers at once. The dense snow inversion, the effective permittivity, ks and ka
+        are computed for all the layers in a single vectorized pass.
 
-        if Eeff0.real < 1:
-            Eeff0 = 0.5 * (-b - cmath.sqrt(discriminant))
-
-        # Solve 1st-order solution: E
-        Eeff = e0 + (Eeff0 - e0) * (1 + 2.0j / 9.0 * (2 * math.pi * radius / lmda)**3 *
-                                    cmath.sqrt(Eeff0) * (es - e0) / (1.0 + (es - e0) / (3 * Eeff0) * (1.0 - f)) *
-                                    (1.0 - f)**4 / (1.0 + 2 * f - t * f * (1.0 - f))**2)
-
-        albedo = 2.0 / 9.0 * (2 * np.pi * radius / lmda)**3 * f / (2 * cmath.sqrt(Eeff).imag) *  \
-            abs((es - e0) / (1 + (es - e0) / (3 * Eeff0) * (1.0 - f)))**2 * \
-            (1.0 - f)**4 / (1.0 + 2 * f - t * f * (1.0 - f))**2
-        
-        if albedo >= 1:
-            raise SMRTError("Grain diameter is too large for DMRT_ShortRange resulting in single scattering albedo larger than 1."
-                            "It is recommended to decrease the size or used an alternative emmodel able to do Mie calculations.")
+        :param sensor: sensor instance
+        :param layers: list of layers
+        :param dense_snow_correction: see :py:class:`DMRT_QCACP_ShortRange`.
 
-        beta = 2 * math.pi / lmda * 2 * cmath.sqrt(Eeff).imag
+        :returns: list of emmodel instances, one for each layer
+        """
+        properties = None
+        if cls.__init__ is DMRT_QCACP_ShortRange.__init__:  # a subclass with its own __init__ is created layer by layer
+            properties = shortrange_layer_properties(sensor, layers, dense_snow_correction)
+        if properties is None:
+            return [cls(sensor, layer, dense_snow_correction=dense_snow_correction) for layer in layers]
 
-        self._effective_permittivity = Eeff
-        self.ks = albedo * beta
-        self.ka = beta - self.ks
+        Eeff, ks, ka = qcacp_shortrange(sensor.frequency, *properties)
+        return [cls.from_properties(ks[i], ka[i], Eeff[i]) for i in range(len(ks))]
 
     def basic_check(self):
         # TODO Ghi: check the microstructure model is compatible.
@@ -134,3 +112,40 @@ class DMRT_QCACP_ShortRange(Rayleigh):
     # The effective_permittivity is inherited from Rayleigh  // Don't remove the commented code
     # def effective_permittivity(self):
     #    return self._effective_permittivity
+
+
+def qcacp_shortrange(frequency, f, e0, es, radius, t):
+    """compute the effective permittivity, the scattering and the absorption coefficients of DMRT QCA-CP in the short range limit.
+    All the arguments except the frequency can be arrays over the layers."""
+
+    lmda = C_SPEED / frequency
+
+    # these formulations are taken from DMRT-ML Picard et al. 2013
+    #
+    # Solve the 0th-order solution: Eeff0
+    # Eeff0^2 + Eeff0 *[ (Ei-eo)/3*(1-4f)-eo] - eo (Ei-1)/3*(1-f) = 0
+
+    b = (es - e0) * (1.0 - 4.0 * f) / 3.0 - e0
+    c = -e0 * (es - e0) * (1.0 - f) / 3.0
+
+    discriminant = b**2 - 4 * c
+
+    # solution
+    Eeff0 = 0.5 * (-b + np.emath.sqrt(discriminant))
+    Eeff0 = np.where(Eeff0.real < 1, 0.5 * (-b - np.emath.sqrt(discriminant)), Eeff0)[()]
+
+    # Solve 1st-order solution: E
+    Eeff = e0 + (Eeff0 - e0) * (1 + 2.0j / 9.0 * (2 * np.pi * radius / lmda)**3 *
+                                np.emath.sqrt(Eeff0) * (es - e0) / (1.0 + (es - e0) / (3 * Eeff0) * (1.0 - f)) *
+                                (1.0 - f)**4 / (1.0 + 2 * f - t * f * (1.0 - f))**2)
+
+    albedo = 2.0 / 9.0 * (2 * np.pi * radius / lmda)**3 * f / (2 * np.emath.sqrt(Eeff).imag) *  \
+        abs((es - e0) / (1 + (es - e0) / (3 * Eeff0) * (1.0 - f)))**2 * \
+        (1.0 - f)**4 / (1.0 + 2 * f - t * f * (1.0 - f))**2
+
+    check_single_scattering_albedo(albedo >= 1)
+
+    beta = 2 * np.pi / lmda * 2 * np.emath.sqrt(Eeff).imag
+
+    ks = albedo * beta
+    return Eeff, ks, beta - ks
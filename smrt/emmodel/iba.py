@@ -9,6 +9,7 @@ may be performed. All properties relate to a single layer.
 """
 
 # Stdlib import
+import math
 
 # other import
 import numpy as np
@@ -18,8 +19,10 @@ import scipy.fftpack
 # local import
 from ..core.error import SMRTError
 from ..core.globalconstants import C_SPEED
+from ..core.optional_numba import numba
 from .effective_permittivity import depolarization_factors, polder_van_santen
-from ..core.lib import smrt_matrix, generic_ft_even_matrix, len_atleast_1d
+from ..core.lib import smrt_matrix, generic_ft_even_matrix, len_atleast_1d, array_lru_cache
+from ..microstructure_model.autocorrelation import stack_microstructures
 
 #
 # For developers: all emmodel must implement the `effective_permittivity`, `ke` and `phase` functions with the same arguments as here
@@ -99,15 +102,90 @@ class IBA(object):
         self.ka = self.compute_ka()
 
         # Calculate scattering coefficient: integrate p11+p12 over mu
-        k = 6  # number of samples. This should be adaptative depending on the size/wavelength
-        mu = np.linspace(1, -1, 2**k + 1)
-        y = self.ks_integrand(mu)
-        ks_int = scipy.integrate.romb(y, mu[0] - mu[1])  # integrate between 0 and pi (i.e. mu between -1 and 1)
-        self.ks = ks_int / 4.  # Ding et al. (2010), normalised by (1/4pi)
+        self.ks = self.compute_ks()
 
         if not (self.ks >= 0):
             print("ks, the scattering coefficient has an invalid value '%g' in layer nb '%i'" % (self.ks, getattr(layer, 'number', 0)))
 
+    @classmethod
+    def batch(cls, sensor, layers, **emmodel_options):
+        """create the emmodel instances for all the layers at once. The effective permittivity, the IBA coefficient, ka and ks are
+        computed for all the layers in a single vectorized pass when the microstructures of the layers can be stacked
+        (see :py:func:`~smrt.microstructure_model.autocorrelation.stack_microstructures`). Otherwise, the layers are processed one by one.
+
+        :param sensor: object containing sensor characteristics
+        :param layers: list of layers
+
+        :returns: list of emmodel instances, one for each layer, equivalent to those created with `cls(sensor, layer)`.
+        """
+
+        layers = list(layers)
+
+        microstructure = None
+        if (not emmodel_options and cls.__init__ is IBA.__init__
+                and cls.effective_permittivity_model is polder_van_santen
+                and all(layer.inclusion_shape == layers[0].inclusion_shape for layer in layers)):
+            microstructure = stack_microstructures([getattr(layer, "microstructure", None) for layer in layers])
+
+        if microstructure is None:
+            return [cls(sensor, layer, **emmodel_options) for layer in layers]
+
+        # an instance whose properties are arrays over the layers
+        em = cls.__new__(cls)
+        em.npol = 2 if sensor.mode == 'P' else 3
+        em.frac_volume = np.array([layer.frac_volume for layer in layers])
+        em.microstructure = microstructure
+        em.e0 = np.array([layer.permittivity(0, sensor.frequency) for layer in layers])
+        em.eps = np.array([layer.permittivity(1, sensor.frequency) for layer in layers])
+        em.k0 = 2 * np.pi * sensor.frequency / C_SPEED
+        em.inclusion_shape = layers[0].inclusion_shape
+
+        em.depol_xyz = depolarization_factors()
+        em._effective_permittivity = em.effective_permittivity()
+        em.iba_coeff = em.compute_iba_coeff()
+        em.ka = em.compute_ka()
+        em.ks = em.compute_ks()
+
+        # split in one instance per layer
+        instances = []
+        for i, layer in enumerate(layers):
+            layer_em = cls.__new__(cls)
+            layer_em.__dict__.update(em.__dict__)
+            for name in ['frac_volume', 'e0', 'eps', '_effective_permittivity', 'iba_coeff', 'ka', 'ks']:
+                setattr(layer_em, name, getattr(em, name)[i])
+            layer_em.microstructure = layer.microstructure
+
+            if not (layer_em.ks >= 0):
+                print("ks, the scattering coefficient has an invalid value '%g' in layer nb '%i'" % (layer_em.ks, getattr(layer, 'number', 0)))
+            instances.append(layer_em)
+
+        return instances
+
+    def compute_ks(self):
+        """ Calculate the scattering coefficient by integration of p11 + p22 over the scattering angle. The integral is analytic when the
+        microstructure provides the moments of the Fourier transform of its autocorrelation function
+        (`ft_autocorrelation_function_moment`). Otherwise it is computed numerically with the Romberg method.
+
+        """
+        if hasattr(self.microstructure, 'ft_autocorrelation_function_moment'):
+            # with x = sin(Theta / 2), k_diff = kmax * x and the integral over mu of (1 + mu**2) * ft(k_diff) is
+            # 4 * int_0^1 ft(kmax * x) * (2 - 4 x**2 + 4 x**4) * x dx, that is a combination of the moments of order 1, 3 and 5 of ft
+            kmax = _layer_column(2. * self.k0 * abs(np.sqrt(self._effective_permittivity)))
+
+            def moment(n):
+                return self.microstructure.ft_autocorrelation_function_moment(kmax, n) / kmax**(n + 1)
+
+            ks_int = (_layer_column(self.iba_coeff) * 4 * (2 * moment(1) - 4 * moment(3) + 4 * moment(5))).real
+            if np.ndim(ks_int) > 0:
+                ks_int = ks_int[..., 0]
+        else:
+            k = 6  # number of samples. This should be adaptative depending on the size/wavelength
+            mu = np.linspace(1, -1, 2**k + 1)
+            y = self.ks_integrand(mu)
+            ks_int = scipy.integrate.romb(y, mu[0] - mu[1])  # integrate between 0 and pi (i.e. mu between -1 and 1)
+
+        return ks_int / 4.  # Ding et al. (2010), normalised by (1/4pi)
+
     def compute_iba_coeff(self):
         """ Calculate angular independent IBA coefficient: used in both scattering coefficient and phase function calculations
 
@@ -129,8 +207,9 @@ class IBA(object):
             :param eps: scattering constituent relative permittivity
 
         """
-        quasi_permittivity = (2. * self._effective_permittivity + e0) / 3.
-        y2 = (1. / 3.) * np.sum(np.absolute(quasi_permittivity / (quasi_permittivity + (eps - e0) * self.depol_xyz))**2.)
+        quasi_permittivity = _layer_column((2. * self._effective_permittivity + e0) / 3.)
+        y2 = (1. / 3.) * np.sum(np.absolute(quasi_permittivity / (quasi_permittivity + _layer_column(eps - e0) * self.depol_xyz))**2.,
+                                axis=-1)
         return y2
 
     def basic_check(self):
@@ -167,7 +246,7 @@ class IBA(object):
         # Calculate wavevector difference
         sintheta_2 = np.sqrt((1. - mu) / 2.)  # = np.sin(theta / 2.)
 
-        k_diff = np.asarray(2. * self.k0 * sintheta_2 * abs(np.sqrt(self._effective_permittivity)))
+        k_diff = np.asarray(2. * self.k0 * sintheta_2 * abs(np.sqrt(_layer_column(self._effective_permittivity))))
 
         # Calculate microstructure term
         if hasattr(self.microstructure, 'ft_autocorrelation_function'):
@@ -175,8 +254,8 @@ class IBA(object):
         else:
             raise SMRTError("Fourier Transform of this microstructure model has not been defined, or there is a problem with its calculation")
 
-        p11 = (self.iba_coeff * ft_corr_fn).real * mu**2
-        p22 = (self.iba_coeff * ft_corr_fn).real * 1.
+        p11 = (_layer_column(self.iba_coeff) * ft_corr_fn).real * mu**2
+        p22 = (_layer_column(self.iba_coeff) * ft_corr_fn).real * 1.
 
         ks_int = (p11 + p22)
 
@@ -186,63 +265,11 @@ class IBA(object):
         """ IBA Phase function (not decomposed).
 
 """
-        # cos and sin of scattering and incident angles in the main frame
-        cos_ti = np.atleast_1d(mu_i)[np.newaxis, np.newaxis, :]
-        sin_ti = np.sqrt(1. - cos_ti**2)
-
-        cos_t = np.atleast_1d(mu_s)[np.newaxis, :, np.newaxis]
-        sin_t = np.sqrt(1. - cos_t**2)
-
-        dphi = np.atleast_1d(dphi)
-        cos_pd = np.cos(dphi)[:, np.newaxis, np.newaxis]
-        sin_pd_sign = np.where(dphi >= np.pi, -1, 1)[:, np.newaxis, np.newaxis]
-
-        # Scattering angle in the 1-2 frame
-        cosT = np.clip(cos_t * cos_ti + sin_t * sin_ti * cos_pd, -1.0, 1.0)  # Prevents occasional numerical error
-        cosT2 = cosT**2  # cos^2 (Theta)
-        sinT = np.sqrt(1. - cosT2)
-
-        # Apply non-zero scattering denominator
-        nonnullsinT = sinT >= 1e-6
-
-        # Create arrays of rotation angles
-        cost_sinti = cos_t * sin_ti
-        costi_sint = cos_ti * sin_t
-
-        cos_i1 = cost_sinti - costi_sint * cos_pd
-        np.divide(cos_i1, sinT, where=nonnullsinT, out=cos_i1)
-        np.clip(cos_i1, -1.0, 1.0, out=cos_i1)
-
-        cos_i2 = costi_sint - cost_sinti * cos_pd
-        np.divide(cos_i2, sinT, where=nonnullsinT, out=cos_i2)
-        np.clip(cos_i2, -1.0, 1.0, out=cos_i2)
-
-        # Special condition if theta and theta_i = 0 to preserve azimuth dependency
-        dege_dphi = np.broadcast_to((sin_t < 1e-6) & (sin_ti < 1e-6), cos_i1.shape)
-        cos_i1[dege_dphi] = 1.
-        cos_i2[dege_dphi] = np.broadcast_to(cos_pd, cos_i2.shape)[dege_dphi]
-
-        # # See Matzler 2006 pg 111 Eq. 3.20
-        # # Calculate rotation angles alpha, alpha_i
-        # # Convention follows Matzler 2006, Thermal Microwave Radiation, p111, eqn 3.20
-
-        Li = Lmatrix(cos_i1, -sin_pd_sign, (3, npol))    # L (-i1)
-
-        if npol == 2:
-            RLi = np.array([[cosT2 * Li[0][0], cosT2 * Li[0][1]],
-                            Li[1], [cosT * Li[2][0], cosT * Li[2][1]]])
-
-        elif npol == 3:
-            RLi = np.array([[cosT2 * Li[0][0], cosT2 * Li[0][1], cosT2 * Li[0][2]],
-                            Li[1], [cosT * Li[2][0], cosT * Li[2][1], cosT * Li[2][2]]])
-        else:
-            raise RuntimeError("invalid value of npol")
-
-        Ls = Lmatrix(-cos_i2, sin_pd_sign, (npol, 3))    # L (pi - i2)
-        p = np.einsum('ij...,jk...->ik...', Ls, RLi)   # multiply the outer dimension (=polarization)
+        # the angular part only depends on the geometry and is shared between the layers
+        p, sin_half_T = rotated_rayleigh_phase(np.atleast_1d(mu_s), np.atleast_1d(mu_i), np.atleast_1d(dphi), npol)
 
         # IBA phase function = rayleigh phase function * angular part of microstructure term
-        k_diff = 2. * self.k0 * np.sqrt(self._effective_permittivity) * np.sqrt(0.5 - 0.5 * cosT)
+        k_diff = 2. * self.k0 * np.sqrt(self._effective_permittivity) * sin_half_T
 
         # Calculate microstructure term
         if hasattr(self.microstructure, 'ft_autocorrelation_function'):
@@ -251,7 +278,7 @@ class IBA(object):
             raise SMRTError("Fourier Transform of this microstructure model has not been defined, or there is a problem with its calculation")
 
         return smrt_matrix(ft_corr_fn * self.iba_coeff * p)
-        
+
     def ft_even_phase(self, mu_s, mu_i, m_max, npol=None):
         """ Calculation of the Fourier decomposed IBA phase function.
 
@@ -297,7 +324,13 @@ class IBA(object):
         def phase_function(dphi):
             return self.phase(mu_s, mu_i, dphi, npol)
 
-        return generic_ft_even_matrix(phase_function, m_max)  # order is pola_s, pola_i, m, mu_s, mu_i
+        ft_even_p = generic_ft_even_matrix(phase_function, m_max)  # order is pola_s, pola_i, m, mu_s, mu_i
+
+        if m_max == 0 and npol == 3:
+            # the mode m=0 does not couple V and H with U, only the non-null blocks are kept
+            return smrt_matrix((ft_even_p.values[0:2, 0:2], ft_even_p.values[2, 2]), mtype="blockdiagonal5")
+
+        return ft_even_p
 
     def compute_ka(self):
         """ IBA absorption coefficient calculated from the low-loss assumption of a general lossy medium.
@@ -351,7 +384,7 @@ class IBA(object):
         eps = type(self).effective_permittivity_model(
             self.frac_volume, self.e0, self.eps, self.depol_xyz, self.inclusion_shape)
 
-        if eps.imag < 0:
+        if np.any(eps.imag < 0):
             raise SMRTError("the imaginary part of the permittivity must be positive, by convention, in SMRT")
         return eps
 
@@ -393,6 +426,149 @@ class IBA_MM(IBA):
         return ks_int.real
 
 
+def _layer_column(x):
+    # add a trailing axis to the properties of IBA.batch that are arrays over the layers, so that they broadcast against the angles
+    return x if np.ndim(x) == 0 else np.asarray(x)[..., np.newaxis]
+
+
+@array_lru_cache(maxsize=4)
+def rotated_rayleigh_phase(mu_s, mu_i, dphi, npol):
+    """return the Rayleigh phase matrix rotated in the main frame and sin(Theta/2) where Theta is the scattering angle.
+    This part of the IBA phase function only depends on the geometry and is cached because the same streams are often used
+    in several layers. When numba is available, the compiled :py:func:`rotated_rayleigh_phase_loop` is used instead of the
+    vectorized version.
+
+"""
+    if numba:
+        p = np.empty((npol, npol, len(dphi), len(mu_s), len(mu_i)))
+        sin_half_T = np.empty((len(dphi), len(mu_s), len(mu_i)))
+        compiled_rotated_rayleigh_phase_loop(np.asarray(mu_s, dtype=float), np.asarray(mu_i, dtype=float),
+                                             np.asarray(dphi, dtype=float), npol, p, sin_half_T)
+        return p, sin_half_T
+
+    # cos and sin of scattering and incident angles in the main frame
+    cos_ti = mu_i[np.newaxis, np.newaxis, :]
+    sin_ti = np.sqrt(1. - cos_ti**2)
+
+    cos_t = mu_s[np.newaxis, :, np.newaxis]
+    sin_t = np.sqrt(1. - cos_t**2)
+
+    cos_pd = np.cos(dphi)[:, np.newaxis, np.newaxis]
+    sin_pd_sign = np.where(dphi >= np.pi, -1, 1)[:, np.newaxis, np.newaxis]
+
+    # Scattering angle in the 1-2 frame
+    cosT = np.clip(cos_t * cos_ti + sin_t * sin_ti * cos_pd, -1.0, 1.0)  # Prevents occasional numerical error
+    cosT2 = cosT**2  # cos^2 (Theta)
+    sinT = np.sqrt(1. - cosT2)
+
+    # Apply non-zero scattering denominator
+    nonnullsinT = sinT >= 1e-6
+
+    # Create arrays of rotation angles
+    cost_sinti = cos_t * sin_ti
+    costi_sint = cos_ti * sin_t
+
+    cos_i1 = cost_sinti - costi_sint * cos_pd
+    np.divide(cos_i1, sinT, where=nonnullsinT, out=cos_i1)
+    np.clip(cos_i1, -1.0, 1.0, out=cos_i1)
+
+    cos_i2 = costi_sint - cost_sinti * cos_pd
+    np.divide(cos_i2, sinT, where=nonnullsinT, out=cos_i2)
+    np.clip(cos_i2, -1.0, 1.0, out=cos_i2)
+
+    # Special condition if theta and theta_i = 0 to preserve azimuth dependency
+    dege_dphi = np.broadcast_to((sin_t < 1e-6) & (sin_ti < 1e-6), cos_i1.shape)
+    cos_i1[dege_dphi] = 1.
+    cos_i2[dege_dphi] = np.broadcast_to(cos_pd, cos_i2.shape)[dege_dphi]
+
+    # # See Matzler 2006 pg 111 Eq. 3.20
+    # # Calculate rotation angles alpha, alpha_i
+    # # Convention follows Matzler 2006, Thermal Microwave Radiation, p111, eqn 3.20
+
+    Li = Lmatrix(cos_i1, -sin_pd_sign, (3, npol))    # L (-i1)
+
+    if npol == 2:
+        RLi = np.array([[cosT2 * Li[0][0], cosT2 * Li[0][1]],
+                        Li[1], [cosT * Li[2][0], cosT * Li[2][1]]])
+
+    elif npol == 3:
+        RLi = np.array([[cosT2 * Li[0][0], cosT2 * Li[0][1], cosT2 * Li[0][2]],
+                        Li[1], [cosT * Li[2][0], cosT * Li[2][1], cosT * Li[2][2]]])
+    else:
+        raise RuntimeError("invalid value of npol")
+
+    Ls = Lmatrix(-cos_i2, sin_pd_sign, (npol, 3))    # L (pi - i2)
+    p = np.einsum('ij...,jk...->ik...', Ls, RLi)   # multiply the outer dimension (=polarization)
+
+    return p, np.sqrt(0.5 - 0.5 * cosT)
+
+
+def rotated_rayleigh_phase_loop(mu_s, mu_i, dphi, npol, p, sin_half_T):
+    """compute the same as :py:func:`rotated_rayleigh_phase` in a single loop over the angles, without temporary arrays.
+    The results are written in p with shape (npol, npol, len(dphi), len(mu_s), len(mu_i)) and sin_half_T with shape
+    (len(dphi), len(mu_s), len(mu_i)). This function is compiled with numba when available.
+"""
+
+    Li = np.zeros((3, 3))  # L(-i1), 3 x npol used
+    Ls = np.zeros((3, 3))  # L(pi - i2), npol x 3 used
+
+    for k in range(len(dphi)):
+        cos_pd = math.cos(dphi[k])
+        sin_pd_sign = -1. if dphi[k] >= math.pi else 1.
+
+        for i in range(len(mu_s)):
+            cos_t = mu_s[i]
+            sin_t = math.sqrt(1. - cos_t**2)
+
+            for j in range(len(mu_i)):
+                cos_ti = mu_i[j]
+                sin_ti = math.sqrt(1. - cos_ti**2)
+
+                # Scattering angle in the 1-2 frame
+                cosT = min(max(cos_t * cos_ti + sin_t * sin_ti * cos_pd, -1.0), 1.0)
+                cosT2 = cosT**2
+                sinT = math.sqrt(1. - cosT2)
+
+                # rotation angles
+                cos_i1 = cos_t * sin_ti - cos_ti * sin_t * cos_pd
+                cos_i2 = cos_ti * sin_t - cos_t * sin_ti * cos_pd
+                if sinT >= 1e-6:
+                    cos_i1 /= sinT
+                    cos_i2 /= sinT
+                cos_i1 = min(max(cos_i1, -1.0), 1.0)
+                cos_i2 = min(max(cos_i2, -1.0), 1.0)
+
+                # Special condition if theta and theta_i = 0 to preserve azimuth dependency
+                if sin_t < 1e-6 and sin_ti < 1e-6:
+                    cos_i1 = 1.
+                    cos_i2 = cos_pd
+
+                # rotation matrices, see Lmatrix
+                c2 = cos_i1**2
+                s2 = 1 - c2
+                s_2 = -2 * cos_i1 * math.sqrt(s2) * sin_pd_sign
+                Li[0, 0], Li[0, 1], Li[0, 2] = c2 * cosT2, s2 * cosT2, 0.5 * s_2 * cosT2   # multiplied by the Rayleigh matrix
+                Li[1, 0], Li[1, 1], Li[1, 2] = s2, c2, -0.5 * s_2
+                Li[2, 0], Li[2, 1], Li[2, 2] = -s_2 * cosT, s_2 * cosT, (2 * c2 - 1) * cosT
+
+                c2 = cos_i2**2
+                s2 = 1 - c2
+                s_2 = -2 * cos_i2 * math.sqrt(s2) * sin_pd_sign
+                Ls[0, 0], Ls[0, 1], Ls[0, 2] = c2, s2, 0.5 * s_2
+                Ls[1, 0], Ls[1, 1], Ls[1, 2] = s2, c2, -0.5 * s_2
+                Ls[2, 0], Ls[2, 1], Ls[2, 2] = -s_2, s_2, 2 * c2 - 1
+
+                for a in range(npol):
+                    for b in range(npol):
+                        p[a, b, k, i, j] = Ls[a, 0] * Li[0, b] + Ls[a, 1] * Li[1, b] + Ls[a, 2] * Li[2, b]
+
+                sin_half_T[k, i, j] = math.sqrt(0.5 - 0.5 * cosT)
+
+
+if numba:
+    compiled_rotated_rayleigh_phase_loop = numba.jit(nopython=True, cache=True)(rotated_rayleigh_phase_loop)
+
+
 def Lmatrix(cos_phi, sin_phi_sign, npol):
 
     # Calculate arrays of rotated phase matrix elements
@@ -11,7 +11,7 @@ import numpy as np
 
 from ..core.error import SMRTError
 from ..core.globalconstants import C_SPEED
-from ..core.lib import smrt_matrix
+from ..core.lib import smrt_matrix, array_lru_cache
 
 
 class Rayleigh(object):
@@ -42,6 +42,16 @@ class Rayleigh(object):
         self.ks = f * 2 * abs((eps - e0) / (eps + 2 * e0))**2 * radius**3 * k0**4
         self.ka = f * 9 * k0 * eps.imag / e0 * abs(e0 / (eps + 2 * e0))**2
 
+    @classmethod
+    def from_properties(cls, ks, ka, effective_permittivity):
+        """create an instance directly from its scattering and absorption coefficients and effective permittivity. This is used by the
+        derived emmodels to create the instances of all the layers computed at once."""
+        em = cls.__new__(cls)
+        em.ks = ks
+        em.ka = ka
+        em._effective_permittivity = effective_permittivity
+        return em
+
     def basic_check(self):
         # TODO Ghi: check the microstructure model is compatible.
         # if we want to be strict, only IndependentShpere should be valid, but in practice any
@@ -58,74 +68,21 @@ class Rayleigh(object):
         """
 
         assert mu_s is mu_i  # temporary hack, to be propagated
-        mu = mu_i
 
         if npol is None:
             npol = 2 if m_max == 0 else 3
 
-        P = smrt_matrix.empty((npol, npol, m_max + 1, len(mu_s), len(mu_i)))
-
-        mu2 = mu**2
-
-        v, h, u = 0, 1, 2
-
-        # mode m == 0
-        P[v, v, 0] = 0.5 * np.outer(mu2, mu2) + np.outer(1 - mu2, 1 - mu2)
-        P[v, h, 0] = 0.5 * mu2[:, np.newaxis]  # mu2[:, np.newaxis]  # equiv np.dot(mu2, np.ones_like(mu2.T))
-        if npol >= 3:
-            P[v, u] = 0
-
-        P[h, v, 0] = P[v, h, 0].T
-        P[h, h, 0] = 0.5
-        if npol >= 3:
-            P[h, u, 0] = 0
-
-        if npol >= 3:
-            P[u, v, 0] = 0
-            P[u, h, 0] = 0
-            P[u, u, 0] = 0
-
-        if m_max >= 1:
-            sint = np.sqrt(1. - mu2)
-            cossint = mu * sint
-
-            P[v, v, 1] = 2 * np.outer(cossint, cossint)
-            P[v, h, 1] = 0
-            P[v, u, 1] = np.outer(cossint, sint)
-
-            P[h, v, 1] = 0
-            P[h, h, 1] = 0
-            P[h, u, 1] = 0
-
-            P[u, v, 1] = -2 * P[v, u, 1].T
-
-            P[u, h, 1] = 0
-            P[u, u, 1] = np.outer(sint, sint)
-
-        if m_max >= 2:
-            P[v, v, 2] = 0.5 * np.outer(mu2, mu2)
-            P[v, h, 2] = -0.5 * mu2[:, np.newaxis]
-            P[v, u, 2] = 0.5 * np.outer(mu2, mu)
-
-            P[h, v, 2] = P[v, h, 2].T
-            P[h, h, 2] = 0.5
-            P[h, u, 2] = -0.5 * mu[np.newaxis, :]
-
-            P[u, v, 2] = -2 * P[v, u, 2].T
-            P[u, h, 2] = mu[:, np.newaxis]
-            P[u, u, 2] = np.outer(mu, mu)
-
-        if m_max >=3:
-            P[:, :, 3:, :, :] = 0
-
-        if npol == 3:
-            P[v, u, :] = -P[v, u, :]  # minus comes from even phase function
-            P[h, u, :] = -P[h, u, :]  # minus comes from even phase function
-
         # this normalisation is compatible with the 1/4pi normalisation used for the RT equation.
         coef = 3 * self.ks / 2   # no*fo^2 / Ks (see TsangI 3.2.49)
 
-        return P * coef
+        # the angular part is shared by all the layers with the same streams
+        P = normalized_ft_even_phase_ulaby(np.asarray(mu_i), m_max, npol) * coef
+
+        if m_max == 0 and npol == 3:
+            # the mode m=0 does not couple V and H with U, only the non-null blocks are kept
+            return smrt_matrix((P[0:2, 0:2], P[2, 2]), mtype="blockdiagonal5")
+
+        return smrt_matrix(P)
 
     def ft_even_phase_basedonJin(self, mu_s, mu_i, m_max, npol=None):
         """Rayleigh phase matrix.
@@ -358,3 +315,72 @@ class Rayleigh(object):
 
     def effective_permittivity(self):
         return self._effective_permittivity
+
+
+@array_lru_cache(maxsize=8)
+def normalized_ft_even_phase_ulaby(mu, m_max, npol):
+    """return the Fourier decomposed Rayleigh phase matrix (Ulaby formulation) without the 3 * ks / 2 coefficient. It only depends
+    on the streams and is cached.
+
+    """
+
+    P = smrt_matrix.empty((npol, npol, m_max + 1, len(mu), len(mu)))
+
+    mu2 = mu**2
+
+    v, h, u = 0, 1, 2
+
+    # mode m == 0
+    P[v, v, 0] = 0.5 * np.outer(mu2, mu2) + np.outer(1 - mu2, 1 - mu2)
+    P[v, h, 0] = 0.5 * mu2[:, np.newaxis]  # mu2[:, np.newaxis]  # equiv np.dot(mu2, np.ones_like(mu2.T))
+    if npol >= 3:
+        P[v, u] = 0
+
+    P[h, v, 0] = P[v, h, 0].T
+    P[h, h, 0] = 0.5
+    if npol >= 3:
+        P[h, u, 0] = 0
+
+    if npol >= 3:
+        P[u, v, 0] = 0
+        P[u, h, 0] = 0
+        P[u, u, 0] = 0
+
+    if m_max >= 1:
+        sint = np.sqrt(1. - mu2)
+        cossint = mu * sint
+
+        P[v, v, 1] = 2 * np.outer(cossint, cossint)
+        P[v, h, 1] = 0
+        P[v, u, 1] = np.outer(cossint, sint)
+
+        P[h, v, 1] = 0
+        P[h, h, 1] = 0
+        P[h, u, 1] = 0
+
+        P[u, v, 1] = -2 * P[v, u, 1].T
+
+        P[u, h, 1] = 0
+        P[u, u, 1] = np.outer(sint, sint)
+
+    if m_max >= 2:
+        P[v, v, 2] = 0.5 * np.outer(mu2, mu2)
+        P[v, h, 2] = -0.5 * mu2[:, np.newaxis]
+        P[v, u, 2] = 0.5 * np.outer(mu2, mu)
+
+        P[h, v, 2] = P[v, h, 2].T
+        P[h, h, 2] = 0.5
+        P[h, u, 2] = -0.5 * mu[np.newaxis, :]
+
+        P[u, v, 2] = -2 * P[v, u, 2].T
+        P[u, h, 2] = mu[:, np.newaxis]
+        P[u, u, 2] = np.outer(mu, mu)
+
+    if m_max >=3:
+        P[:, :, 3:, :, :] = 0
+
+    if npol == 3:
+        P[v, u, :] = -P[v, u, :]  # minus comes from even phase function
+        P[h, u, :] = -P[h, u, :]  # minus comes from even phase function
+
+    return P.values
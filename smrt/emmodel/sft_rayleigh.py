@@ -20,32 +20,58 @@ class SFT_Rayleigh(Rayleigh):
 
         # check here the limit of the Rayleigh model
 
-        f = layer.frac_volume
-
         eb = layer.permittivity(0, sensor.frequency)  # background permittivity
         es = layer.permittivity(1, sensor.frequency)  # scatterer permittivity
-        e0 = 1  # always
 
-        lmda = C_SPEED / sensor.frequency
-        k0 = 2 * np.pi / lmda * np.sqrt(e0)
+        self._effective_permittivity, self.ks, self.ka = sft_rayleigh(sensor.frequency, layer.frac_volume, eb, es,
+                                                                      layer.microstructure.corr_length)
+
+    @classmethod
+    def batch(cls, sensor, layers):
+        """create the emmodel instances for all the layers at once. The effective permittivity, ks and ka are computed for all the layers
+        in a single vectorized pass.
+
+        :param sensor: sensor instance
+        :param layers: list of layers
+
+        :returns: list of emmodel instances, one for each layer
+        """
+        if cls.__init__ is not SFT_Rayleigh.__init__:  # a subclass with its own __init__ is created layer by layer
+            return [cls(sensor, layer) for layer in layers]
+
+        f = np.array([layer.frac_volume for layer in layers], dtype=float)
+        eb = np.array([layer.permittivity(0, sensor.frequency) for layer in layers])  # background permittivity
+        es = np.array([layer.permittivity(1, sensor.frequency) for layer in layers])  # scatterer permittivity
+        corr_length = np.array([layer.microstructure.corr_length for layer in layers], dtype=float)
+
+        Eeff, ks, ka = sft_rayleigh(sensor.frequency, f, eb, es, corr_length)
+        return [cls.from_properties(ks[i], ka[i], Eeff[i]) for i in range(len(ks))]
+
+
+def sft_rayleigh(frequency, f, eb, es, corr_length):
+    """compute the effective permittivity, the scattering and the absorption coefficients of the Strong Fluctuation Theory.
+    All the arguments except the frequency can be arrays over the layers."""
+
+    e0 = 1  # always
 
-        corr_length = layer.microstructure.corr_length
+    lmda = C_SPEED / frequency
+    k0 = 2 * np.pi / lmda * np.sqrt(e0)
 
-        self._effective_permittivity = polder_van_santen(f, eb, es)
-        eg = self._effective_permittivity  # short
-        kg = k0 * np.sqrt(eg/e0)
+    eg = polder_van_santen(f, eb, es)
+    kg = k0 * np.sqrt(eg/e0)
 
-        delta = 9 * eg**2/e0**2 * (f * ((es-eg)/(es+2*eg))**2 + (1-f) * ((eb-eg)/(eb+2*eg))**2 )
+    delta = 9 * eg**2/e0**2 * (f * ((es-eg)/(es+2*eg))**2 + (1-f) * ((eb-eg)/(eb+2*eg))**2 )
 
-        beta = 1/corr_length - 1j * kg
+    beta = 1/corr_length - 1j * kg
 
-        I1 = 1/(beta**2 + kg**2)
-        I2 = -3.0/2*beta/kg**2 + 1.0/(2*kg)*(3*beta**2 / kg**2+1) * np.arctan(kg/beta)
-        I3 = 3/kg**2 - 1/(beta**2+kg**2) - 3*beta / kg**3 * np.arctan(kg/beta)
-        I4 = 1.0/3 + beta**2/(2*kg**2) - beta/(2*kg) * (beta**2/kg**2 + 1) * np.arctan(kg/beta)
+    I1 = 1/(beta**2 + kg**2)
+    I2 = -3.0/2*beta/kg**2 + 1.0/(2*kg)*(3*beta**2 / kg**2+1) * np.arctan(kg/beta)
+    I3 = 3/kg**2 - 1/(beta**2+kg**2) - 3*beta / kg**3 * np.arctan(kg/beta)
+    I4 = 1.0/3 + beta**2/(2*kg**2) - beta/(2*kg) * (beta**2/kg**2 + 1) * np.arctan(kg/beta)
 
-        Eeff = eg + k0**2 * delta * (2*I1/3 - 1j*I2/kg - I3/3 + I4/(k0**2 * eg))
+    Eeff = eg + k0**2 * delta * (2*I1/3 - 1j*I2/kg - I3/3 + I4/(k0**2 * eg))
 
-        self.ka = 2 * k0 * np.sqrt(eg).imag
-        self.ks = 2 * k0 * np.sqrt(Eeff).imag - self.ka
+    ka = 2 * k0 * np.sqrt(eg).imag
+    ks = 2 * k0 * np.sqrt(Eeff).imag - ka
 
+    return eg, ks, ka
@@ -0,0 +1,329 @@
+# coding: utf-8
+
+"""Tabulated electromagnetic model. The scattering and absorption coefficients, the effective permittivity and the normalized
+Fourier modes of the phase matrix of any emmodel are precomputed on a grid of layer parameters (e.g. frequency, density,
+corr_length or radius, stickiness, temperature) and are then interpolated for each new layer. This turns the construction of the
+emmodel into a lookup, which is useful when the same emmodel is evaluated many times over a bounded parameter space, as for
+retrievals.
+
+The table is built with :py:func:`tabulate_emmodel`, can be saved and loaded (as a compressed .npz file) and is given to the
+:py:class:`Tabulated` emmodel with the `table` option::
+
+    table = tabulate_emmodel("iba", sensor, "exponential",
+                             density=np.arange(100, 501, 25), corr_length=np.linspace(5e-5, 5e-4, 19), temperature=[250, 260, 270])
+    table.save("iba_table.npz")
+
+    table = TabulatedTable.load("iba_table.npz")
+    m = make_model("tabulated", "dort", emmodel_options=dict(table=table))
+
+The grid parameters are taken from the sensor (frequency), the layer (density, temperature, liquid_water, ...) or its microstructure
+(corr_length, radius, stickiness, ...). A parameter given as a scalar is fixed and must have this value in all the layers.
+The tabulated emmodel refuses to extrapolate outside the grid. The phase matrix is tabulated on a fixed set of `n_mu` cosines and is
+linearly interpolated to the streams requested by the solver (with constant extrapolation near the zenith).
+
+Each emmodel instance carries an `error_estimate` of the relative interpolation error of ks, ka and the effective permittivity,
+estimated from the second differences of the table along each parameter (nan if no parameter has at least 3 values).
+
+"""
+
+import itertools
+import json
+
+import numpy as np
+import scipy.interpolate
+
+from ..core.error import SMRTError
+from ..core.lib import len_atleast_1d, smrt_matrix
+
+
+class Tabulated(object):
+    """Emmodel interpolating a table computed with :py:func:`tabulate_emmodel`.
+
+    :param sensor: sensor instance. The mode must be the same as the sensor used to build the table.
+    :param layer: layer instance. Its microstructure model must be the same as the one used to build the table.
+    :param table: :py:class:`TabulatedTable` instance. If None, the `table` attribute of the class is used (see :py:meth:`TabulatedTable.emmodel`).
+
+"""
+    table = None
+
+    def __init__(self, sensor, layer, table=None):
+
+        if table is None:
+            table = self.table
+        if table is None:
+            raise SMRTError("The tabulated emmodel requires a table. Use the 'table' option of the emmodel.")
+
+        if sensor.mode != table.mode:
+            raise SMRTError("The table has been computed for the sensor mode '%s'" % table.mode)
+
+        microstructure_model = type(getattr(layer, "microstructure", None)).__name__
+        if microstructure_model != table.microstructure_model:
+            raise SMRTError("The table has been computed for the microstructure model '%s' but the layer uses '%s'" %
+                            (table.microstructure_model, microstructure_model))
+
+        point = [layer_parameter(sensor, layer, name) for name in table.axes]
+        properties = table.interpolate(point)
+
+        self.table_ = table
+        self.npol = table.npol
+        self.ks = properties['ks']
+        self.ka = properties['ka']
+        self._effective_permittivity = properties['effective_permittivity']
+        self.error_estimate = properties['error_estimate']
+        self._normalized_phase = properties['normalized_phase']
+
+    def ft_even_phase(self, mu_s, mu_i, m_max, npol=None):
+        """Fourier modes of the phase matrix, interpolated from the table to the cosines mu_s and mu_i.
+
+        :param mu_s: 1-D array of cosine of viewing radiation stream angles (set by solver)
+        :param mu_i: 1-D array of cosine of incident radiation stream angles (set by solver)
+        :param m_max: maximum Fourier decomposition mode needed
+        :param npol: number of polarizations considered (set from sensor characteristics)
+        """
+
+        if npol is None:
+            npol = self.npol
+        if npol > self.npol or m_max > self.table_.m_max:
+            raise SMRTError("The table has been computed for npol <= %i and m_max <= %i. Recompute the table with larger values." %
+                            (self.npol, self.table_.m_max))
+
+        phase = self._normalized_phase[:npol, :npol, :m_max + 1]
+
+        i_s, w_s = linear_weights(self.table_.mu, np.atleast_1d(mu_s))
+        i_i, w_i = linear_weights(self.table_.mu, np.atleast_1d(mu_i))
+
+        i_s, w_s = i_s[:, np.newaxis], w_s[:, np.newaxis]
+        phase = (1 - w_s) * ((1 - w_i) * phase[..., i_s, i_i] + w_i * phase[..., i_s, i_i + 1]) + \
+            w_s * ((1 - w_i) * phase[..., i_s + 1, i_i] + w_i * phase[..., i_s + 1, i_i + 1])
+
+        return smrt_matrix(self.ks * phase)
+
+    def ke(self, mu):
+        """return the extinction coefficient matrix"""
+        return np.full(len_atleast_1d(mu), self.ks + self.ka)
+
+    def effective_permittivity(self):
+        return self._effective_permittivity
+
+
+class TabulatedTable(object):
+    """Table of the properties of an emmodel on a regular grid of layer parameters. It is built with :py:func:`tabulate_emmodel`
+    or loaded from a file with :py:meth:`load`.
+
+    :param axes: dict of the parameter names and their values (1D increasing arrays).
+    :param ks: scattering coefficient on the grid.
+    :param ka: absorption coefficient on the grid.
+    :param effective_permittivity: effective permittivity on the grid.
+    :param normalized_phase: Fourier modes of the phase matrix divided by ks, with shape (grid..., npol, npol, m_max + 1, n_mu, n_mu).
+    :param mu: cosines used for the phase matrix (increasing).
+    :param metadata: dict with the emmodel, microstructure_model, mode and method.
+"""
+
+    def __init__(self, axes, ks, ka, effective_permittivity, normalized_phase, mu, metadata):
+
+        self.axes = {name: np.asarray(values, dtype=float) for name, values in axes.items()}
+        self.ks = np.asarray(ks)
+        self.ka = np.asarray(ka)
+        self.effective_permittivity = np.asarray(effective_permittivity)
+        self.normalized_phase = np.asarray(normalized_phase)
+        self.mu = np.asarray(mu)
+        self.metadata = metadata
+
+        self.emmodel_name = metadata['emmodel']
+        self.microstructure_model = metadata['microstructure_model']
+        self.mode = metadata['mode']
+        self.method = metadata.get('method', 'linear')
+        self.npol, self.m_max = self.normalized_phase.shape[len(self.axes)], self.normalized_phase.shape[len(self.axes) + 2] - 1
+
+        self.error = second_difference_error(np.stack((self.ks, self.ka, np.abs(self.effective_permittivity)), axis=-1))
+        self._interpolators = None
+
+    def emmodel(self):
+        """return an emmodel class bound to this table, to be used with :py:func:`~smrt.core.model.make_model`"""
+        return type("Tabulated_%s" % self.emmodel_name, (Tabulated, ), {'table': self})
+
+    def interpolate(self, point):
+        """interpolate the table at the given point (one value per axis). Raise an error if the point is outside the table.
+
+        :returns: dict with ks, ka, effective_permittivity, normalized_phase and error_estimate
+        """
+
+        variable = []
+        for (name, values), x in zip(self.axes.items(), point):
+            lower, upper = values[0], values[-1]
+            tol = 1e-9 * max(abs(lower), abs(upper), 1e-300)
+            if np.ndim(x) > 0 or not (lower - tol <= x <= upper + tol):
+                raise SMRTError("The value %s of '%s' is outside the range of the table [%g, %g]. The tabulated emmodel does not"
+                                " extrapolate." % (x, name, lower, upper))
+            if len(values) > 1:
+                variable.append(min(max(x, lower), upper))
+
+        if self._interpolators is None:
+            self._interpolators = self.make_interpolators()
+        interpolate_scalars, interpolate_phase = self._interpolators
+
+        if variable:
+            scalars = interpolate_scalars(variable)[0]
+            phase = interpolate_phase(variable)[0]
+        else:
+            scalars, phase = interpolate_scalars, interpolate_phase
+
+        return {'ks': max(scalars[0], 0.),
+                'ka': max(scalars[1], 0.),
+                'effective_permittivity': scalars[2] + 1j * scalars[3],
+                'normalized_phase': phase,
+                'error_estimate': {'ks': scalars[4], 'ka': scalars[5], 'effective_permittivity': scalars[6]}}
+
+    def make_interpolators(self):
+        # interpolate over the axes with more than one value
+        variable_axes = [values for values in self.axes.values() if len(values) > 1]
+        shape = tuple(len(values) if len(values) > 1 else None for values in self.axes.values())
+        squeeze = tuple(i for i, n in enumerate(shape) if n is None)
+
+        scalars = np.stack((self.ks, self.ka, self.effective_permittivity.real, self.effective_permittivity.imag,
+                            self.error[..., 0], self.error[..., 1], self.error[..., 2]), axis=-1)
+        scalars = np.squeeze(scalars, axis=squeeze)
+        phase = np.squeeze(self.normalized_phase, axis=squeeze)
+
+        if not variable_axes:
+            return scalars, phase
+
+        return (scipy.interpolate.RegularGridInterpolator(variable_axes, scalars, method=self.method),
+                scipy.interpolate.RegularGridInterpolator(variable_axes, phase, method=self.method))
+
+    def save(self, filename):
+        """save the table in a compressed .npz file"""
+
+        np.savez_compressed(filename,
+                            metadata=json.dumps(dict(self.metadata, axes=list(self.axes.keys()))),
+                            ks=self.ks, ka=self.ka, effective_permittivity=self.effective_permittivity,
+                            normalized_phase=self.normalized_phase, mu=self.mu,
+                            **{'axis_' + name: values for name, values in self.axes.items()})
+
+    @classmethod
+    def load(cls, filename):
+        """load a table saved with :py:meth:`save`"""
+
+        with np.load(filename) as data:
+            metadata = json.loads(str(data['metadata']))
+            axes = {name: data['axis_' + name] for name in metadata.pop('axes')}
+            return cls(axes, data['ks'], data['ka'], data['effective_permittivity'], data['normalized_phase'], data['mu'], metadata)
+
+
+def tabulate_emmodel(emmodel, sensor, microstructure_model, emmodel_options=None, n_mu=64, m_max=None, method="linear",
+                     phase_dtype=np.float32, **grid):
+    """compute the table of an emmodel on a regular grid of layer parameters.
+
+    :param emmodel: emmodel to tabulate, given by its name or class (e.g. "iba", "dmrt_qca_shortrange").
+    :param sensor: sensor. Only its mode and frequency are used. If the frequency is not given in the grid, the sensor frequency is
+        used and must be the same when the table is used.
+    :param microstructure_model: microstructure model, given by its name or class.
+    :param emmodel_options: options to create the emmodel instances.
+    :param n_mu: number of cosines to tabulate the phase matrix, regularly spaced in angle.
+    :param m_max: maximum mode of the phase matrix. Default is 0 in passive mode and 2 in active mode.
+    :param method: interpolation method ("linear", "cubic", ... see scipy.interpolate.RegularGridInterpolator).
+    :param phase_dtype: type used to store the phase matrix. The default float32 makes the table more compact.
+    :param grid: values of the layer parameters given as arguments to :py:func:`~smrt.inputs.make_medium.make_snow_layer`
+        and of the frequency. Scalars are fixed values.
+
+    :returns: :py:class:`TabulatedTable` instance
+"""
+    # import here to avoid cross-dependencies
+    from ..core.model import get_emmodel, make_emmodel
+    from ..core.layer import get_microstructure_model
+    from ..inputs.make_medium import make_snow_layer
+
+    emmodel = get_emmodel(emmodel)
+    if isinstance(microstructure_model, str):
+        microstructure_model = get_microstructure_model(microstructure_model)
+    if emmodel_options is None:
+        emmodel_options = dict()
+
+    grid.setdefault('frequency', sensor.frequency)
+    axes = {name: np.atleast_1d(np.asarray(values, dtype=float)) for name, values in grid.items()}
+    for name, values in axes.items():
+        if values.ndim != 1 or np.any(np.diff(values) <= 0):
+            raise SMRTError("The values of '%s' must be strictly increasing" % name)
+
+    npol = 2 if sensor.mode == 'P' else 3
+    if m_max is None:
+        m_max = 0 if sensor.mode == 'P' else 2
+
+    # cosines regularly spaced in angle, excluding the zenith and nadir
+    mu = np.cos((np.arange(n_mu) + 0.5) * np.pi / n_mu)[::-1]
+
+    shape = tuple(len(values) for values in axes.values())
+    ks = np.empty(shape)
+    ka = np.empty(shape)
+    effective_permittivity = np.empty(shape, dtype=complex)
+    normalized_phase = np.zeros(shape + (npol, npol, m_max + 1, n_mu, n_mu), dtype=phase_dtype)
+
+    for index in itertools.product(*[range(n) for n in shape]):
+        params = {name: values[i] for (name, values), i in zip(axes.items(), index)}
+
+        node_sensor = _with_frequency(sensor, params.pop('frequency'))
+
+        layer = make_snow_layer(1., microstructure_model, **params)
+        em = make_emmodel(emmodel, node_sensor, layer, **emmodel_options)
+
+        ks[index] = em.ks
+        ka[index] = em.ka
+        effective_permittivity[index] = em.effective_permittivity()
+
+        if em.ks > 0:
+            phase = em.ft_even_phase(mu, mu, m_max, npol=npol).todense()
+            values = np.asarray(phase.values)
+            if values.ndim == 4:  # no mode dimension for dense4
+                values = values[:, :, np.newaxis]
+            normalized_phase[index] = values / em.ks
+
+    metadata = {'emmodel': emmodel.__name__, 'microstructure_model': microstructure_model.__name__,
+                'mode': sensor.mode, 'method': method}
+
+    return TabulatedTable(axes, ks, ka, effective_permittivity, normalized_phase, mu, metadata)
+
+
+def _with_frequency(sensor, frequency):
+    # return a copy of the sensor with a new frequency
+    import copy
+    sensor = copy.copy(sensor)
+    sensor.__dict__.pop('_wls', None)
+    sensor.frequency = frequency
+    return sensor
+
+
+def layer_parameter(sensor, layer, name):
+    """return the value of the parameter name for the layer: the frequency from the sensor, the other parameters from the layer or its
+    microstructure"""
+    if name == 'frequency':
+        return sensor.frequency
+    if hasattr(layer, name):
+        return getattr(layer, name)
+    if hasattr(getattr(layer, 'microstructure', None), name):
+        return getattr(layer.microstructure, name)
+    raise SMRTError("The parameter '%s' of the table is not defined in the layer" % name)
+
+
+def linear_weights(grid, x):
+    """return the indices and weights for the linear interpolation on the increasing grid, with constant extrapolation"""
+    i = np.clip(np.searchsorted(grid, x) - 1, 0, len(grid) - 2)
+    w = np.clip((x - grid[i]) / (grid[i + 1] - grid[i]), 0, 1)
+    return i, w
+
+
+def second_difference_error(f):
+    """estimate the relative error of the linear interpolation of f on a regular grid (the last dimension holds the fields) from
+    the second differences along each axis, |f[i-1] - 2 f[i] + f[i+1]| / 8. Return nan if no axis has at least 3 values."""
+
+    error = np.full(f.shape, np.nan)
+    for axis in range(f.ndim - 1):
+        n = f.shape[axis]
+        if n < 3:
+            continue
+        d2 = np.abs(np.diff(f, n=2, axis=axis)) / 8
+        # assign the second difference of the interior nodes to the neighbouring intervals
+        d2 = np.concatenate((np.take(d2, [0], axis=axis), d2, np.take(d2, [-1], axis=axis)), axis=axis)
+        error = np.fmax(error, d2)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(np.abs(f) > 0, error / np.abs(f), np.where(np.isnan(error), np.nan, 0.))
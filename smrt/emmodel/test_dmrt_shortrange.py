@@ -2,12 +2,14 @@
 
 
 import numpy as np
+import pytest
 
 from smrt.emmodel.dmrt_qcacp_shortrange import DMRT_QCACP_ShortRange
+from smrt.emmodel.dmrt_qca_shortrange import DMRT_QCA_ShortRange
 from smrt.core.error import SMRTError
 from smrt.core.globalconstants import  DENSITY_OF_ICE
 from smrt.inputs.sensor_list import amsre
-from smrt.inputs.make_medium import make_snow_layer
+from smrt.inputs.make_medium import make_snow_layer, make_snowpack
 from smrt.emmodel import commontest
 from smrt.permittivity.ice import ice_permittivity_maetzler06  # default ice permittivity model
 
@@ -73,4 +75,39 @@ def test_invert_dmrt():
 
     em = setup_func_em(setup_func_dense_shs(700))
     em_inv = setup_func_em(setup_func_dense_shs(700, inverse=True))
-    assert (abs(em.ks - em_inv.ks) < 1e-4)
\ No newline at end of file
+    assert (abs(em.ks - em_inv.ks) < 1e-4)
+
+@pytest.mark.parametrize("emmodel", [DMRT_QCACP_ShortRange, DMRT_QCA_ShortRange])
+def test_batch(emmodel):
+
+    sp = make_snowpack([0.1, 0.2, 1], StickyHardSpheres, density=[200, 350, 600], temperature=[250, 260, 270],
+                       radius=[1e-4, 2e-4, 3e-4], stickiness=[0.2, 0.3, 1000])
+    sensor = amsre('37V')
+
+    for em_batch, layer in zip(emmodel.batch(sensor, sp.layers), sp.layers):
+        em = emmodel(sensor, layer)
+        for name in ['_effective_permittivity', 'ks', 'ka']:
+            np.testing.assert_allclose(getattr(em_batch, name), getattr(em, name), rtol=1e-12)
+
+
+def test_batch_reports_invalid_layers():
+
+    sp = make_snowpack([0.1, 0.2, 1], StickyHardSpheres, density=300, radius=[1e-4, 3e-3, 1e-4], stickiness=0.2)
+
+    with pytest.raises(SMRTError, match="Invalid layers: 1"):
+        DMRT_QCA_ShortRange.batch(amsre('89V'), sp.layers)
+
+
+@pytest.mark.parametrize("emmodel", [DMRT_QCACP_ShortRange, DMRT_QCA_ShortRange])
+def test_batch_subclass_init(emmodel):
+
+    class ScaledShortRange(emmodel):
+        def __init__(self, sensor, layer, **kwargs):
+            super().__init__(sensor, layer, **kwargs)
+            self.ks *= 2
+
+    sp = make_snowpack([0.1, 1], StickyHardSpheres, density=[200, 350], radius=[1e-4, 2e-4], stickiness=0.2)
+    sensor = amsre('37V')
+
+    for em_batch, layer in zip(ScaledShortRange.batch(sensor, sp.layers), sp.layers):
+        np.testing.assert_allclose(em_batch.ks, 2 * emmodel(sensor, layer).ks)
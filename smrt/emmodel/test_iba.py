@@ -235,3 +235,98 @@ def test_iba_raise_exception_mu_is_1():
     bad_mu = np.array([0.2, 1])
     with pytest.raises(SMRTError):
         em.ft_even_phase(bad_mu, bad_mu, 2, npol=3)[:, :, 2]
+
+
+def test_phase_geometry_is_shared_between_layers():
+    from smrt.emmodel.iba import rotated_rayleigh_phase
+
+    sensor = active(13e9, 40)
+    mu = np.cos(np.linspace(0.1, 3, 12))
+    em1 = IBA(sensor, setup_func_sp())
+    em2 = IBA(sensor, setup_func_indep())
+
+    rotated_rayleigh_phase.cache_clear()
+    p1 = em1.ft_even_phase(mu, mu, 2, npol=3)
+    p2 = em2.ft_even_phase(mu.copy(), mu.copy(), 2, npol=3)
+
+    geometry = rotated_rayleigh_phase(mu, mu, np.linspace(0, np.pi, 17), 3)
+    assert geometry[0] is rotated_rayleigh_phase(mu.copy(), mu.copy(), np.linspace(0, np.pi, 17), 3)[0]
+    assert not geometry[0].flags.writeable
+
+    # the same results are obtained without the cache
+    rotated_rayleigh_phase.cache_clear()
+    np.testing.assert_array_equal(em2.ft_even_phase(mu, mu, 2, npol=3).values, p2.values)
+    assert not np.allclose(p1.values, p2.values)
+
+
+def test_mode_0_is_blockdiagonal():
+
+    sensor = active(13e9, 35)
+    mu = np.cos(np.linspace(0.1, 3, 12))
+    em = IBA(sensor, setup_func_sp())
+
+    p0 = em.ft_even_phase(mu, mu, 0, npol=3)
+    p = em.ft_even_phase(mu, mu, 2, npol=3)
+
+    assert p0.mtype == "blockdiagonal5"
+    # the VU, HU, UV and UH blocks of the mode m=0 are null (to rounding errors)
+    atol = 1e-8 * np.max(np.abs(p.values))
+    np.testing.assert_allclose(p0.todense().values[:, :, 0], p.values[:, :, 0], atol=atol)
+
+
+@pytest.mark.parametrize("microstructure_model,params", [
+    ("exponential", dict(corr_length=2e-4)),
+    ("independent_sphere", dict(radius=3e-4)),
+    ("teubner_strey", dict(corr_length=2e-4, repeat_distance=1e-3)),
+    ("gaussian_random_field", dict(corr_length=1e-4, repeat_distance=5e-4)),
+])
+def test_analytic_ks(microstructure_model, params):
+    # the analytic integration of the phase function must agree with the numerical integration
+
+    layer = make_snow_layer(0.1, microstructure_model, density=300, temperature=260, **params)
+    em = IBA(amsre('89V'), layer)
+
+    ks = scipy.integrate.quad(lambda mu: em.ks_integrand(np.atleast_1d(mu))[0], -1, 1, epsrel=1e-10, limit=500)[0] / 4
+    np.testing.assert_allclose(em.ks, ks, rtol=1e-6)
+
+
+@pytest.mark.parametrize("microstructure_model, params", [
+    (Exponential, {'corr_length': [1e-4, 3e-4, 5e-4]}),
+    (StickyHardSpheres, {'radius': [1e-4, 3e-4, 5e-4], 'stickiness': [0.2, 0.3, 1000]}),
+])
+@pytest.mark.parametrize("emmodel", ["iba", "iba_original"])
+def test_batch(microstructure_model, params, emmodel):
+
+    from smrt.core.model import get_emmodel
+    from smrt import make_snowpack
+
+    sp = make_snowpack([0.1, 0.2, 1], microstructure_model, density=[200, 300, 350], temperature=[250, 260, 270], **params)
+    sensor = active(13e9, 40)
+
+    cls = get_emmodel(emmodel)
+    batch = cls.batch(sensor, sp.layers)
+
+    mu = np.cos(np.radians([10, 30, 50]))
+    for em_batch, layer in zip(batch, sp.layers):
+        em = cls(sensor, layer)
+        for name in ['_effective_permittivity', 'iba_coeff', 'ka', 'ks']:
+            np.testing.assert_allclose(getattr(em_batch, name), getattr(em, name), rtol=1e-12)
+        np.testing.assert_allclose(em_batch.ft_even_phase(mu, mu, 2).values, em.ft_even_phase(mu, mu, 2).values, rtol=1e-12)
+
+
+@pytest.mark.parametrize("npol", [2, 3])
+def test_rotated_rayleigh_phase_loop(npol):
+
+    from smrt.emmodel.iba import rotated_rayleigh_phase, rotated_rayleigh_phase_loop
+
+    mu = np.array([1., 0.8, 0.3, -0.3, -0.8, -1.])
+    dphi = np.linspace(0, 2 * np.pi, 7)
+
+    p_ref, sin_half_T_ref = rotated_rayleigh_phase.__wrapped__(mu, mu, dphi, npol)
+
+    p = np.empty((npol, npol, len(dphi), len(mu), len(mu)))
+    sin_half_T = np.empty((len(dphi), len(mu), len(mu)))
+    rotated_rayleigh_phase_loop(mu, mu, dphi, npol, p, sin_half_T)
+
+    np.testing.assert_allclose(p, p_ref, atol=1e-12)
+    np.testing.assert_allclose(sin_half_T, np.broadcast_to(sin_half_T_ref, sin_half_T.shape), atol=1e-12)
@@ -36,3 +36,35 @@ def test_energy_conservation():
     em = setup_func_em()
     commontest.test_energy_conservation(em, tolerance_pc)
 
+
+
+def test_phase_is_cached_per_stream_set():
+    import numpy as np
+    from smrt.emmodel.rayleigh import normalized_ft_even_phase_ulaby
+
+    mu = np.cos(np.linspace(0.1, 3, 10))
+    em1 = setup_func_em()
+    em2 = setup_func_em(setup_func_rad(2e-4))
+
+    p1 = em1.ft_even_phase(mu, mu, 2)
+    p2 = em2.ft_even_phase(mu, mu, 2)
+
+    # only the 3 * ks / 2 coefficient differs between the layers
+    np.testing.assert_allclose(p1.values / em1.ks, p2.values / em2.ks)
+    assert normalized_ft_even_phase_ulaby(mu, 2, 3) is normalized_ft_even_phase_ulaby(mu.copy(), 2, 3)
+
+    # the returned matrix is not shared
+    p1.values[:] = 0
+    np.testing.assert_allclose(em2.ft_even_phase(mu, mu, 2).values, p2.values)
+
+
+def test_mode_0_is_blockdiagonal():
+    import numpy as np
+
+    mu = np.cos(np.linspace(0.1, 3, 10))
+    em = setup_func_em()
+
+    p0 = em.ft_even_phase(mu, mu, 0, npol=3)
+
+    assert p0.mtype == "blockdiagonal5"
+    np.testing.assert_allclose(p0.todense().values[:, :, 0], em.ft_even_phase(mu, mu, 2).values[:, :, 0])
@@ -0,0 +1,33 @@
+# coding: utf-8
+
+import numpy as np
+
+from smrt.emmodel.sft_rayleigh import SFT_Rayleigh
+from smrt.inputs.make_medium import make_snowpack
+from smrt.inputs.sensor_list import amsre
+
+
+def test_batch():
+
+    sp = make_snowpack([0.1, 0.2, 1], "exponential", density=[200, 300, 400], temperature=[250, 260, 270],
+                       corr_length=[5e-5, 1e-4, 2e-4])
+    sensor = amsre('37V')
+
+    for em_batch, layer in zip(SFT_Rayleigh.batch(sensor, sp.layers), sp.layers):
+        em = SFT_Rayleigh(sensor, layer)
+        for name in ['_effective_permittivity', 'ks', 'ka']:
+            np.testing.assert_allclose(getattr(em_batch, name), getattr(em, name), rtol=1e-10)
+
+
+def test_batch_subclass_init():
+
+    class ScaledSFT_Rayleigh(SFT_Rayleigh):
+        def __init__(self, sensor, layer):
+            super().__init__(sensor, layer)
+            self.ks *= 2
+
+    sp = make_snowpack([0.1, 1], "exponential", density=[200, 300], corr_length=[5e-5, 1e-4])
+    sensor = amsre('37V')
+
+    for em_batch, layer in zip(ScaledSFT_Rayleigh.batch(sensor, sp.layers), sp.layers):
+        np.testing.assert_allclose(em_batch.ks, 2 * SFT_Rayleigh(sensor, layer).ks)
@@ -0,0 +1,79 @@
+# coding: utf-8
+
+import pytest
+
+import numpy as np
+
+from smrt.emmodel.tabulated import Tabulated, TabulatedTable, tabulate_emmodel
+from smrt.emmodel.iba import IBA
+from smrt.core.error import SMRTError
+from smrt.inputs.sensor_list import amsre
+from smrt import make_snow_layer, make_snowpack, make_model
+from smrt.microstructure_model.exponential import Exponential
+
+
+def setup_table():
+    sensor = amsre('37V')
+    table = tabulate_emmodel("iba", sensor, "exponential", n_mu=32,
+                             density=np.arange(200, 401, 25), corr_length=np.linspace(1e-4, 3e-4, 11), temperature=265)
+    return sensor, table
+
+
+def test_tabulated_iba():
+
+    sensor, table = setup_table()
+
+    layer = make_snow_layer(0.2, Exponential, density=270, temperature=265, corr_length=1.7e-4)
+    em = Tabulated(sensor, layer, table=table)
+    em_iba = IBA(sensor, layer)
+
+    np.testing.assert_allclose(em.ks, em_iba.ks, rtol=1e-2)
+    np.testing.assert_allclose(em.ka, em_iba.ka, rtol=1e-3)
+    np.testing.assert_allclose(em.effective_permittivity(), em_iba.effective_permittivity(), rtol=1e-4)
+    assert em.error_estimate['ks'] < 1e-2
+
+    mu = np.cos(np.radians([10, 35, 60]))
+    np.testing.assert_allclose(em.ft_even_phase(mu, mu, 0).values, em_iba.ft_even_phase(mu, mu, 0).values, rtol=2e-2)
+
+
+def test_tabulated_model():
+
+    sensor, table = setup_table()
+
+    sp = make_snowpack([0.3, 10], Exponential, density=[250, 350], temperature=265, corr_length=[1.5e-4, 2.5e-4])
+
+    tb = make_model(table.emmodel(), "dort").run(sensor, sp).TbV()
+    tb_iba = make_model("iba", "dort").run(sensor, sp).TbV()
+
+    np.testing.assert_allclose(tb, tb_iba, atol=0.25)
+
+
+def test_out_of_range():
+
+    sensor, table = setup_table()
+
+    layer = make_snow_layer(0.2, Exponential, density=500, temperature=265, corr_length=1.7e-4)
+    with pytest.raises(SMRTError, match="density"):
+        Tabulated(sensor, layer, table=table)
+
+    layer = make_snow_layer(0.2, Exponential, density=300, temperature=260, corr_length=1.7e-4)
+    with pytest.raises(SMRTError, match="temperature"):
+        Tabulated(sensor, layer, table=table)
+
+
+def test_save_load(tmp_path):
+
+    sensor, table = setup_table()
+
+    filename = str(tmp_path / "table.npz")
+    table.save(filename)
+    loaded = TabulatedTable.load(filename)
+
+    assert loaded.emmodel_name == "IBA"
+    assert list(loaded.axes) == list(table.axes)
+
+    layer = make_snow_layer(0.2, Exponential, density=310, temperature=265, corr_length=2.2e-4)
+    em = Tabulated(sensor, layer, table=table)
+    em_loaded = Tabulated(sensor, layer, table=loaded)
+    assert em.ks == em_loaded.ks
+    assert em.effective_permittivity() == em_loaded.effective_permittivity()
@@ -7,6 +7,11 @@ This module contains the base classes for the microstructure classes.
 
 
 import copy
+import math
+import threading
+import warnings
+from collections import OrderedDict
+
 import numpy as np
 
 
@@ -69,7 +74,10 @@ to see how to use this class.
 
     """
     args = []
-    optional_args = {'ft_numerical': False, 'real_numerical': False}
+    optional_args = {'ft_numerical': False, 'real_numerical': False, 'ft_numerical_tolerance': 1e-6}
+
+    # True when the numerical parameters can be arrays over the layers (see layer_parameter)
+    vectorized = False
 
     def __init__(self, params):
 
@@ -78,11 +86,19 @@ to see how to use this class.
         # numerical or not
         if not hasattr(self, "ft_autocorrelation_function") or params.get('ft_numerical', False):
             self.ft_autocorrelation_function = self.ft_autocorrelation_function_fft
+            self.ft_autocorrelation_function_moment = self.ft_autocorrelation_function_moment_fft
 
         if not hasattr(self, "autocorrelation_function") or params.get('real_numerical', False):
             self.autocorrelation_function = self.autocorrelation_function_invfft
 
 
+    def layer_parameter(self, x):
+        """return the parameter x ready to be broadcast against the wave vector. Scalar parameters are returned unchanged. Parameters given
+        as arrays over the layers get a trailing axis so that the autocorrelation functions and their fourier transforms have the shape
+        (nlayer, nk) and all the layers are evaluated in a single call.
+        """
+        return x if np.ndim(x) == 0 else np.asarray(x)[..., np.newaxis]
+
     def ft_autocorrelation_function_fft(self, k):
         """compute the fourier transform of the autocorrelation function via fft
         Args:
@@ -94,29 +110,101 @@ to see how to use this class.
         #assert((np.diff(k) > 0).all())  # check k is sorted
         #assert((k > -np.finfo(float).eps).all())  # check k is non-negative
 
-        # re-sampling
-        # number of fourier auxiliary grid points, presently fixed
-        N = 4096
+        k_resampled, ft_resampled = self.resampled_ft_autocorrelation_function(np.max(k_abs, initial=0))
 
-        # grid resolution, fraction of the unique characteristic scale
-        dr = self.inv_slope_at_origin / 20.0
+        # get ft values for input k-values by linear interpolation
+        ft = np.interp(k_abs, k_resampled, ft_resampled)
+        return ft
+
+    def ft_autocorrelation_function_moment_fft(self, k, n):
+        """compute the moment of order n of the fourier transform of the autocorrelation function computed via fft, i.e. the integral
+        of ft(q) * q**n for q from 0 to k. The integral is exact for the linear interpolation used in
+        :py:meth:`ft_autocorrelation_function_fft`.
+        """
+
+        k_abs = np.abs(k)
+        k_resampled, ft_resampled = self.resampled_ft_autocorrelation_function(np.max(k_abs, initial=0))
+        return linear_interpolant_moment(k_resampled, ft_resampled, k_abs, n)
+
+    def resampled_ft_autocorrelation_function(self, kmax=0):
+        """compute the fourier transform of the autocorrelation function via fft on a regular grid of wave vector magnitude
+        extending at least up to kmax. Return the grid and the fourier transform.
+
+        The result is computed once per microstructure instance and is shared between the instances of the same class with
+        identical parameters (see :py:func:`set_shared_ft_cache_size`). It is only recomputed when a larger wave vector is requested.
+        """
 
-        # compute correlation function and auxiliary wave vector arrray
-        points = np.arange(N)
-        r = dr * points
+        key = self.parameter_key()
+
+        cached = getattr(self, "_resampled_ft", None)
+        if cached is not None and cached[0] == key and cached[1][0][-1] >= kmax:
+            return cached[1]
+
+        with _shared_ft_lock:
+            resampled_ft = _shared_ft_cache.get(key)
+            if resampled_ft is not None:
+                _shared_ft_cache.move_to_end(key)
+
+        if resampled_ft is None or resampled_ft[0][-1] < kmax:
+            resampled_ft = self.compute_resampled_ft_autocorrelation_function(kmax)
+            for x in resampled_ft:
+                x.flags.writeable = False
+
+            with _shared_ft_lock:
+                if _shared_ft_cache_size > 0:
+                    _shared_ft_cache[key] = resampled_ft
+                    while len(_shared_ft_cache) > _shared_ft_cache_size:
+                        _shared_ft_cache.popitem(last=False)
+
+        self._resampled_ft = key, resampled_ft
+        return resampled_ft
+
+    def compute_resampled_ft_autocorrelation_function(self, kmax=0):
+        # see resampled_ft_autocorrelation_function
+
+        # re-sampling
+        # grid resolution, fraction of the unique characteristic scale, refined if larger wave vectors are requested
+        dr = self.inv_slope_at_origin / 20.0
+        if kmax > 0.5 * np.pi / dr:
+            dr = 0.5 * np.pi / kmax
+
+        # the extent of the grid sets the resolution in wave vector. It is at least 4096 times the resolution at the
+        # characteristic scale and is extended until the autocorrelation function has vanished relatively to ft_numerical_tolerance
+        N = 2**int(np.ceil(np.log2(4096 * self.inv_slope_at_origin / 20.0 / dr)))
+        if N > _max_resampled_points:
+            N = _max_resampled_points
+            warnings.warn("The wave vector kmax=%g requires more than %i points to resample the autocorrelation function. The grid is "
+                          "truncated, which degrades the resolution in wave vector." % (kmax, _max_resampled_points))
+
+        r = dr * np.arange(N)
         C = self.autocorrelation_function(r)
-        L = N * dr
-        delta_k = np.pi / L
-        k_resampled = delta_k * points
+        C0 = abs(C[0]) if C[0] != 0 else 1.
 
-        # fft for auxiliary wave vector array
-        ft_resampled = np.empty_like(C)
-        ft_resampled[1:] = dst(4 * np.pi * C[1:] * r[1:], type=1) / (2 / dr * k_resampled[1:])
-        ft_resampled[0] = dr * 4 * np.pi * np.sum(C * r**2)
+        previous_tail = np.inf
+        while N < _max_resampled_points:
+            tail = np.max(np.abs(C[N // 2:]))
+            if tail <= self.ft_numerical_tolerance * C0 or tail >= previous_tail:
+                break  # the autocorrelation has vanished or does not decay anymore
+            previous_tail = tail
 
-        # get ft values for input k-values by linear interpolation
-        ft = np.interp(k_abs, k_resampled, ft_resampled)
-        return ft
+            # double the grid, computing the autocorrelation only on the new points
+            r_ext = dr * np.arange(N, 2 * N)
+            C = np.concatenate((C, self.autocorrelation_function(r_ext)))
+            r = np.concatenate((r, r_ext))
+            N *= 2
+
+        return radial_fourier_transform(C, dr)
+
+    def parameter_key(self):
+        """return a hashable key identifying the class and the values of the parameters of this instance"""
+
+        def hashable(x):
+            if isinstance(x, np.ndarray) or isinstance(x, (list, tuple)):
+                x = np.asarray(x)
+                return x.dtype.str, x.shape, x.tobytes()
+            return x
+
+        return (type(self), ) + tuple((arg, hashable(getattr(self, arg))) for arg in self.valid_arguments())
 
     def autocorrelation_function_invfft(self, r):
         """Compute the autocorrelation function from an analytically known FT via fft
@@ -158,3 +246,173 @@ to see how to use this class.
         obj = copy.copy(self)
         obj.frac_volume = 1.0 - self.frac_volume
         return obj
+
+
+def stack_microstructures(microstructures):
+    """return a single microstructure instance whose parameters are arrays over the given microstructures, so that all the layers are
+    evaluated at once (see :py:meth:`Autocorrelation.layer_parameter`). Parameters identical for all the microstructures stay scalar.
+    Return None when the microstructures are not of the same class, when the class does not support array parameters or when the
+    numerical fourier transform is requested.
+    """
+    if len(microstructures) == 0:
+        return None
+
+    cls = type(microstructures[0])
+    if not getattr(cls, "vectorized", False) or any(type(m) is not cls for m in microstructures):
+        return None
+
+    params = dict()
+    for arg in cls.valid_arguments():
+        values = [getattr(m, arg) for m in microstructures]
+        if any(np.ndim(v) > 0 for v in values):
+            return None
+        if all(v == values[0] for v in values):
+            params[arg] = values[0]
+        elif any(isinstance(v, (bool, str)) for v in values):
+            return None  # options must be the same for all the microstructures
+        else:
+            params[arg] = np.array(values)
+
+    if params.get('ft_numerical', False) or params.get('real_numerical', False):
+        return None
+
+    return cls(params)
+
+
+# maximum number of points of the grid used to compute the numerical fourier transform
+_max_resampled_points = 2**18
+
+# numerical fourier transforms shared between the instances with identical parameters
+_shared_ft_cache = OrderedDict()
+_shared_ft_cache_size = 32
+_shared_ft_lock = threading.Lock()
+
+
+def set_shared_ft_cache_size(size):
+    """set the maximum number of numerical fourier transforms shared between the microstructure instances with identical
+    parameters. Use 0 to disable the sharing, each instance then computes its own fourier transform.
+    """
+    global _shared_ft_cache_size
+
+    with _shared_ft_lock:
+        _shared_ft_cache_size = int(size)
+        while len(_shared_ft_cache) > _shared_ft_cache_size:
+            _shared_ft_cache.popitem(last=False)
+
+
+def radial_fourier_transform(C, dr):
+    """compute the 3D fourier transform of the isotropic function C sampled at r = dr * arange(N) along the last axis, using
+    the discrete sine transform. Return the regular grid of wave vector magnitude (with spacing pi / (N * dr)) and the fourier
+    transform along the last axis.
+    """
+
+    N = C.shape[-1]
+    r = dr * np.arange(N)
+
+    # auxiliary wave vector arrray
+    L = N * dr
+    delta_k = np.pi / L
+    k = delta_k * np.arange(N)
+
+    # fft for auxiliary wave vector array
+    ft = np.empty(C.shape)
+    ft[..., 1:] = dst(4 * np.pi * C[..., 1:] * r[1:], type=1, axis=-1) / (2 / dr * k[1:])
+    ft[..., 0] = dr * 4 * np.pi * np.sum(C * r**2, axis=-1)
+
+    return k, ft
+
+
+_gauss_legendre_4 = np.polynomial.legendre.leggauss(4)
+
+
+def rational_moment(S, m, b, c):
+    """compute the integral of s**m / (s**2 + b * s + c) for s from 0 to S, for m = 0, 1 or 2. This is the moment of the fourier transform
+    of the exponential and Teubner-Strey autocorrelation functions in the variable s=(k*corr_length)**2. The denominator must have no
+    real root (4 * c >= b**2).
+    A power series is used for small S where the closed form suffers from cancellation.
+    """
+    if np.ndim(S) == 0 and np.ndim(b) == 0 and np.ndim(c) == 0:
+        # scalar version, this is the common case (one layer)
+        return _rational_moment_scalar(float(S), m, float(b), float(c))
+
+    S = np.asarray(S, dtype=float)
+    small = S < 0.1
+
+    if np.any(small):
+        # power series: 1 / (s**2 + b * s + c) = sum_j a_j s**j / c, used below 0.1
+        Ss = np.where(small, S, 0)
+        a_jm2, a_jm1 = 0, 1
+        series = Ss**(m + 1) / (m + 1)
+        for j in range(1, 24):
+            a_jm2, a_jm1 = a_jm1, -(b * a_jm1 + a_jm2) / c
+            series = series + a_jm1 * Ss**(j + m + 1) / (j + m + 1)
+        series = series / c
+        if np.all(small):
+            return series
+
+    # closed form. The difference of the arctan is written as a single arctan to be accurate when delta -> 0 (exponential model)
+    delta = 4 * c - b**2
+    denom = delta + b * (2 * S + b)
+    sqrt_delta = np.sqrt(delta)
+    t = 2 * S * sqrt_delta / denom
+    with np.errstate(divide='ignore', invalid='ignore'):
+        atanc = np.where(t > 0, np.arctan(t) / t, 1.)   # arctan(t) / t
+        # when denom < 0 (b < 0), the arctan must be taken on the other branch
+        I0 = np.where(denom > 0, 4 * S / denom * atanc, 2 / sqrt_delta * np.arctan2(2 * S * sqrt_delta, denom))
+    if m == 0:
+        closed = I0
+    else:
+        I1 = 0.5 * np.log1p(S * (b + S) / c) - 0.5 * b * I0
+        closed = I1 if m == 1 else S - b * I1 - c * I0
+
+    return np.where(small, series, closed) if np.any(small) else closed
+
+
+def _rational_moment_scalar(S, m, b, c):
+    # see rational_moment
+
+    if S < 0.1:
+        a_jm2, a_jm1 = 0, 1
+        series = S**(m + 1) / (m + 1)
+        for j in range(1, 24):
+            a_jm2, a_jm1 = a_jm1, -(b * a_jm1 + a_jm2) / c
+            series += a_jm1 * S**(j + m + 1) / (j + m + 1)
+        return series / c
+
+    delta = 4 * c - b**2
+    denom = delta + b * (2 * S + b)
+    sqrt_delta = math.sqrt(delta)
+    if denom > 0:
+        t = 2 * S * sqrt_delta / denom
+        I0 = 4 * S / denom * (math.atan(t) / t if t > 0 else 1.)
+    else:
+        I0 = 2 / sqrt_delta * math.atan2(2 * S * sqrt_delta, denom)
+    if m == 0:
+        return I0
+    I1 = 0.5 * math.log1p(S * (b + S) / c) - 0.5 * b * I0
+    return I1 if m == 1 else S - b * I1 - c * I0
+
+
+def linear_interpolant_moment(x, y, k, n):
+    """compute the integral of yi(q) * q**n for q from x[0] to k where yi is the linear interpolation of y sampled at the regularly
+    or irregularly spaced x. As np.interp, the interpolant is constant beyond x[-1].
+    """
+
+    # Gauss-Legendre quadrature with 4 points is exact for the polynomials of degree <= 7
+    t, w = _gauss_legendre_4
+
+    def segment_integral(a, b, ya, slope):
+        q = a[..., np.newaxis] + (b - a)[..., np.newaxis] * (1 + t) / 2
+        return (b - a) / 2 * np.sum(w * (ya[..., np.newaxis] + slope[..., np.newaxis] * (q - a[..., np.newaxis])) * q**n, axis=-1)
+
+    slope = np.diff(y) / np.diff(x)
+    cumulative = np.concatenate(([0], np.cumsum(segment_integral(x[:-1], x[1:], y[:-1], slope))))
+
+    k = np.asarray(k, dtype=float)
+    kc = np.clip(k, x[0], x[-1])
+    i = np.clip(np.searchsorted(x, kc, side='right') - 1, 0, len(x) - 2)
+
+    moment = cumulative[i] + segment_integral(x[i], kc, y[i], slope[i])
+    # constant extrapolation
+    moment += y[-1] * (k**(n + 1) - kc**(n + 1)) / (n + 1)
+    return moment
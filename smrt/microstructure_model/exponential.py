@@ -11,7 +11,7 @@ import numpy as np
 # local import
 from ..core.globalconstants import DENSITY_OF_ICE
 from ..core.error import SMRTError
-from .autocorrelation import Autocorrelation
+from .autocorrelation import Autocorrelation, rational_moment
 
 class Exponential(Autocorrelation):
 
@@ -22,6 +22,7 @@ class Exponential(Autocorrelation):
 
     args = ["frac_volume", "corr_length"]
     optional_args = {}
+    vectorized = True
 
     def __init__(self, params):
 
@@ -43,12 +44,30 @@ class Exponential(Autocorrelation):
 
     def autocorrelation_function(self, r):
         """compute the real space autocorrelation function"""
-        f_real = self.corr_func_at_origin * np.exp(-r / self.corr_length)
+        f_real = self.layer_parameter(self.corr_func_at_origin) * np.exp(-r / self.layer_parameter(self.corr_length))
         return f_real
 
     def ft_autocorrelation_function(self, k):
         """compute the fourier transform of the autocorrelation function analytically"""
-        X = (k * self.corr_length)**2
+        corr_length = self.layer_parameter(self.corr_length)
+        X = (k * corr_length)**2
 
-        ft = self.corr_func_at_origin * 8 * np.pi * self.corr_length**3 / (1. + X)**2
+        ft = self.layer_parameter(self.corr_func_at_origin) * 8 * np.pi * corr_length**3 / (1. + X)**2
         return ft
+
+    def ft_autocorrelation_function_moment(self, k, n):
+        """compute analytically the moment of order n (1, 3 or 5) of the fourier transform of the autocorrelation function, i.e. the
+        integral of ft(q) * q**n for q from 0 to k."""
+        if n not in (1, 3, 5):
+            raise SMRTError("Only the moments of order 1, 3 and 5 are implemented")
+
+        corr_length = self.layer_parameter(self.corr_length)
+        no_scatterer = corr_length == 0
+        if np.all(no_scatterer):
+            return np.zeros(np.broadcast(k, corr_length).shape)
+
+        S = (k * corr_length)**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            moment = self.layer_parameter(self.corr_func_at_origin) * 4 * np.pi * corr_length**(2 - n) * \
+                rational_moment(S, (n - 1) // 2, 2., 1.)
+        return np.where(no_scatterer, 0., moment) if np.any(no_scatterer) else moment
@@ -16,6 +16,7 @@ class Homogeneous(Autocorrelation):
 
     args = []
     optional_args = {}
+    vectorized = True
 
     def __init__(self, params):
 
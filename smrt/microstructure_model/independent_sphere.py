@@ -9,6 +9,7 @@ parameters: frac_volume, radius
 import numpy as np
 
 from ..core.globalconstants import DENSITY_OF_ICE
+from ..core.error import SMRTError
 
 from .autocorrelation import Autocorrelation
 
@@ -17,6 +18,7 @@ class IndependentSphere(Autocorrelation):
 
     args = ["frac_volume", "radius"]
     optional_args = {}
+    vectorized = True
 
     def __init__(self, params):
 
@@ -45,14 +47,12 @@ class IndependentSphere(Autocorrelation):
 
         """
         # spherical correlation function
-        acf = np.empty_like(r)
+        radius = self.layer_parameter(self.radius)
 
         # the Heaviside factor
-        heaviside = r <= 2 * self.radius
+        acf = np.where(r <= 2 * radius, 1 - r / ((4 * radius) / 3) + r**3 / ((2 * radius)**3 * 2), 0.)
 
-        acf[heaviside] = (1 - r[heaviside] / ((4 * self.radius) / 3) + r[heaviside]**3 / ((2*self.radius)**3 * 2))
-
-        return self.corr_func_at_origin * acf
+        return self.layer_parameter(self.corr_func_at_origin) * acf
 
     def ft_autocorrelation_function(self, k):
         """Compute the 3D Fourier transform of the isotropic correlation
@@ -61,15 +61,62 @@ class IndependentSphere(Autocorrelation):
 
         """
 
-        X = self.radius * np.asarray(k)
-        volume_sphere = 4.0 / 3 * np.pi * self.radius**3
+        radius = self.layer_parameter(self.radius)
+        volume_sphere = 4.0 / 3 * np.pi * radius**3
+
+        return self.layer_parameter(self.corr_func_at_origin) * volume_sphere * bessel_term(radius * np.asarray(k))
+
+    def ft_autocorrelation_function_moment(self, k, n):
+        """compute the moment of order n of the fourier transform of the autocorrelation function, i.e. the
+        integral of ft(q) * q**n for q from 0 to k. It uses a tabulation of the integral of the dimensionless bessel term."""
+        if n < 0:
+            raise SMRTError("The order of the moment must be positive")
+
+        radius = self.layer_parameter(self.radius)
+        no_scatterer = radius == 0
+        if np.all(no_scatterer):
+            return np.zeros(np.broadcast(k, radius).shape)
+
+        volume_sphere = 4.0 / 3 * np.pi * radius**3
+        with np.errstate(divide='ignore', invalid='ignore'):
+            moment = self.layer_parameter(self.corr_func_at_origin) * volume_sphere * radius**(-n - 1) * \
+                bessel_term_moment(radius * np.asarray(k), n)
+        return np.where(no_scatterer, 0., moment) if np.any(no_scatterer) else moment
+
+
+def bessel_term(X):
+    """return 9 * ((sin(X) - X cos(X)) / X**3)**2 with a series expansion for small X. X can be complex."""
+    X = np.asarray(X)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        b = 3 * (np.sin(X) - X * np.cos(X)) / X**3
+    X2 = X**2
+    b = np.where(np.abs(X) < 1e-2, 1 - X2 / 10 + X2**2 / 280 - X2**3 / 15120, b)
+    return b**2
+
+
+_BESSEL_TERM_TABLE_STEP = 0.5
+_bessel_term_table = dict()
+_gauss_legendre_16 = np.polynomial.legendre.leggauss(16)
+
+
+def bessel_term_moment(U, n):
+    """return the integral of bessel_term(X) * X**n for X from 0 to U. The integral between the multiples of the table step is tabulated
+    (the table is extended when necessary) and the remaining part is computed with a Gauss-Legendre quadrature."""
+
+    t, w = _gauss_legendre_16
+
+    def integral(a, b):
+        # the integrand is smooth, 16 points are sufficient on an interval of the table step
+        X = a[..., np.newaxis] + (b - a)[..., np.newaxis] * (1 + t) / 2
+        return (b - a) / 2 * np.sum(w * bessel_term(X) * X**n, axis=-1)
+
+    U = np.asarray(U, dtype=float)
+    i = (U // _BESSEL_TERM_TABLE_STEP).astype(int)
 
-        bessel_term = np.empty_like(X)
-        zero_X = np.isclose(X, 0)
-        non_zero_X = np.logical_not(zero_X)
-        X_non_zero = X[non_zero_X]
+    table = _bessel_term_table.get(n)
+    if table is None or len(table) <= np.max(i, initial=0):
+        nodes = _BESSEL_TERM_TABLE_STEP * np.arange(max(2 * np.max(i, initial=0), 64) + 1)
+        table = np.concatenate(([0], np.cumsum(integral(nodes[:-1], nodes[1:]))))
+        _bessel_term_table[n] = table
 
-        bessel_term[non_zero_X] = (9 * ((np.sin(X_non_zero) - X_non_zero * np.cos(X_non_zero))
-                                        / X_non_zero**3)**2)
-        bessel_term[zero_X] = 1.0
-        return self.corr_func_at_origin * volume_sphere * bessel_term
+    return table[i] + integral(_BESSEL_TERM_TABLE_STEP * i, U)
@@ -5,7 +5,16 @@ the values of the autocorrelation function (`acf`) is known at a series of `lag`
 
 parameters: frac_volume, lag, acf
 
-`acf` contains the values at different `lag`. These parameters must be lists or arrays.
+`acf` contains the values at different `lag`. These parameters must be lists or arrays. The autocorrelation function is
+linearly interpolated between the lags and is zero beyond the last lag, it should therefore have decayed to zero at the last lag.
+
+The fourier transform is computed once when the microstructure is created and its moments are computed exactly, so that IBA
+runs as fast as with the analytical microstructure models. For profiles with many layers, the autocorrelation functions
+measured at the same lags can be given as a single array (possibly memory-mapped from a .npy file) with
+:py:class:`SampledAutocorrelationSet`, which computes all the fourier transforms at once::
+
+    acf_set = SampledAutocorrelationSet(lag, "acf.npy")  # acf.npy contains an array of shape (nlayer, nlag)
+    sp = make_snowpack(thickness, SampledAutocorrelation, density=density, **acf_set.layer_parameters())
 
 """
 
@@ -13,7 +22,8 @@ import numpy as np
 import warnings
 
 # local import
-from .autocorrelation import Autocorrelation
+from ..core.error import SMRTError
+from .autocorrelation import Autocorrelation, radial_fourier_transform, linear_interpolant_moment
 
 
 class SampledAutocorrelation(Autocorrelation):
@@ -21,29 +31,148 @@ class SampledAutocorrelation(Autocorrelation):
     # TODO. Make 3D
     # TODO. Think about density - currently required
     # TODO. SSA as an alternative input or calculated
-    # TODO. Make tests
 
     args = ["frac_volume", "lag", "acf"]
-    optional_args = {}
+    optional_args = {"precomputed_ft": None}
 
     def __init__(self, params):
 
         super(SampledAutocorrelation, self).__init__(params)  # don't forget this line in our classes!
         self.corr_func_at_origin = self.frac_volume * (1.0 - self.frac_volume)
 
+        self.lag = np.asarray(self.lag, dtype=float)
+        self.acf = np.asarray(self.acf)
+        self.basic_check()
+
+        if self.precomputed_ft is None:
+            self.precomputed_ft = sampled_ft_autocorrelation_function(self.lag, self.acf)
+            check_decay(self.acf)
+
     def basic_check(self):
         """check consistency between the parameters"""
-        pass
+        if self.lag.ndim != 1 or self.acf.shape != self.lag.shape:
+            raise SMRTError("lag and acf must be one-dimensional and have the same length")
+        if len(self.lag) < 2 or np.any(np.diff(self.lag) <= 0):
+            raise SMRTError("lag must contain at least two values sorted in increasing order")
 
     def compute_ssa(self):
         """compute the ssa according to Debye 1957. See also Maetzler 2002 Eq. 11"""
         pass
 
+    @property
+    def inv_slope_at_origin(self):
+        """inverse of the slope of the normalized autocorrelation function at the origin, estimated from the first two lags"""
+        slope = (self.acf[1] - self.acf[0]) / (self.lag[1] - self.lag[0])
+        return -self.acf[0] / slope
+
     def autocorrelation_function(self, r):
         """compute the real space autocorrelation function by interpolation of requested values from known values"""
-        if(r[-1] > self.lag[-1]):
-            warnings.warn("Warning: Autocorrelation function is computed out of range of known values")
+        return np.interp(r, self.lag, self.acf, right=0.)
+
+    def ft_autocorrelation_function(self, k):
+        """compute the fourier transform of the autocorrelation function by interpolation of the precomputed fourier transform"""
+        k_sampled, ft_sampled = self.precomputed_ft
+        return np.interp(np.abs(k), k_sampled, ft_sampled)
+
+    def ft_autocorrelation_function_moment(self, k, n):
+        """compute the moment of order n of the fourier transform of the autocorrelation function, i.e. the integral
+        of ft(q) * q**n for q from 0 to k. The integral is exact for the interpolation used in :py:meth:`ft_autocorrelation_function`.
+        """
+        k_sampled, ft_sampled = self.precomputed_ft
+        return linear_interpolant_moment(k_sampled, ft_sampled, np.abs(k), n)
+
+
+class SampledAutocorrelationSet(object):
+    """Set of autocorrelation functions sampled at the same lags, typically for the layers of a measured profile. The
+    fourier transforms of all the autocorrelation functions are computed at once when the set is created and are stored as a
+    single array on a common grid of wave vector magnitude.
+
+    :param lag: lags (1D array).
+    :param acf: autocorrelation functions with shape (nlayer, nlag), or the name of a .npy file containing this array. The file
+        is memory-mapped and is processed by chunks of rows to limit the memory usage.
+    :param kmax: if given, the fourier transforms are only stored up to this wave vector magnitude to save memory. Beyond kmax,
+        the fourier transforms are zero.
+    :param chunk_size: number of autocorrelation functions transformed at once.
+"""
+
+    def __init__(self, lag, acf, kmax=None, chunk_size=256):
+
+        self.lag = np.asarray(lag, dtype=float)
+        if isinstance(acf, str):
+            acf = np.load(acf, mmap_mode='r')
+        self.acf = acf
+
+        if self.acf.ndim != 2 or self.acf.shape[1] != len(self.lag):
+            raise SMRTError("acf must be a two-dimensional array of shape (nlayer, nlag)")
+
+        k = None
+        ft = []
+        for i in range(0, len(self.acf), chunk_size):
+            acf_chunk = np.asarray(self.acf[i:i + chunk_size], dtype=float)
+            check_decay(acf_chunk)
+            k, ft_chunk = sampled_ft_autocorrelation_function(self.lag, acf_chunk, kmax=kmax)
+            ft.append(ft_chunk)
+
+        self.k = k
+        self.ft = np.concatenate(ft) if ft else np.empty((0, 0))
+
+    def __len__(self):
+        return len(self.acf)
+
+    def layer_parameters(self):
+        """return the lag, acf and precomputed_ft parameters for each layer, to be given as arguments to
+        :py:func:`~smrt.inputs.make_medium.make_snowpack`."""
+
+        n = len(self)
+        return {'lag': [self.lag] * n,
+                'acf': [self.acf[i] for i in range(n)],
+                'precomputed_ft': [(self.k, self.ft[i]) for i in range(n)]}
+
+    def microstructure(self, i, frac_volume):
+        """return the :py:class:`SampledAutocorrelation` instance of the i-th layer"""
+        return SampledAutocorrelation({'frac_volume': frac_volume, 'lag': self.lag, 'acf': self.acf[i],
+                                       'precomputed_ft': (self.k, self.ft[i])})
+
+
+def sampled_ft_autocorrelation_function(lag, acf, kmax=None):
+    """compute the fourier transform of the autocorrelation function(s) acf sampled at lag (along the last axis) and linearly
+    interpolated in between. The autocorrelation function is resampled on a regular grid with the smallest lag spacing,
+    zero-padded to refine the wave vector resolution and transformed with the discrete sine transform. A zero is
+    appended at the end of the grid of wave vector so that the interpolation of the fourier transform vanishes beyond.
+
+    Return the grid of wave vector magnitude and the fourier transform(s).
+    """
+
+    dr = np.min(np.diff(lag))
+
+    # zero-padding, at least as many points as the numerical fourier transform of the analytical models
+    nr = int(np.ceil(lag[-1] / dr)) + 1
+    N = max(4096, 2**int(np.ceil(np.log2(4 * nr))))
+
+    uniform = np.allclose(np.diff(lag), dr) and np.isclose(lag[0], 0)
+
+    C = np.zeros(acf.shape[:-1] + (N, ))
+    if uniform:
+        C[..., :len(lag)] = acf
+    else:
+        r = dr * np.arange(nr)
+        C[..., :nr] = np.apply_along_axis(lambda a: np.interp(r, lag, a, right=0.), -1, acf)
+
+    k, ft = radial_fourier_transform(C, dr)
+
+    if kmax is not None:
+        n = min(np.searchsorted(k, kmax) + 1, N)
+        k, ft = k[:n], ft[..., :n]
+
+    k = np.append(k, 2 * k[-1] - k[-2])
+    ft = np.concatenate((ft, np.zeros(ft.shape[:-1] + (1, ))), axis=-1)
+
+    return k, ft
 
-        return np.interp(r, self.lag, self.acf)
 
-    #def ft_autocorrelation_function(self, k):
+def check_decay(acf, threshold=0.05):
+    # warn if the autocorrelation function has not decayed at the last lag, as it is truncated there
+    acf = np.atleast_2d(acf)
+    if np.any(np.abs(acf[:, -1]) > threshold * np.abs(acf[:, 0])):
+        warnings.warn("The autocorrelation function has not decayed to zero at the last lag. It is truncated there which "
+                      "biases its fourier transform.")
@@ -24,6 +24,7 @@ class StickyHardSpheres(Autocorrelation):
     """
     args = ["frac_volume", "radius"]
     optional_args = {"stickiness": 1000}
+    vectorized = True
 
     def __init__(self, params):
 
@@ -38,7 +39,7 @@ class StickyHardSpheres(Autocorrelation):
 
     def basic_check(self):
         """check consistency between the parameters"""
-        if( self.stickiness < self.tau_min(self.frac_volume)):
+        if np.any(self.stickiness < self.tau_min(self.frac_volume)):
             raise SMRTError("For volume fraction " + str(self.frac_volume)
                             + " the stickiness must be greater than "
                             + str(self.tau_min(self.frac_volume)))
@@ -65,19 +66,19 @@ class StickyHardSpheres(Autocorrelation):
         # and volume fraction is admissible.
         # * check if k is positive (maybe not required since the function is even in k)
 
-        d = 2 * self.radius
-        phi_2 = self.frac_volume
-        tau = self.stickiness
+        d = 2 * self.layer_parameter(self.radius)
+        phi_2 = self.layer_parameter(self.frac_volume)
+        tau = self.layer_parameter(self.stickiness)
 
         # scaling variable, Eq 32, LP2015
         X = np.atleast_1d(k) * d / 2.0
 
         # solution of the quadratic equation, Eq. 32, LP2015
-        if np.isfinite(tau):
-            t = ((6 * tau * phi_2 - 6 * phi_2 - 6 * tau + (36 * tau**2 * phi_2**2 - 72 * tau * phi_2**2
-                - 72 * tau**2 * phi_2 + 30 * phi_2**2 + 72 * tau * phi_2 + 36 * tau**2 - 12 * phi_2)**0.5) / (phi_2 * (-1 + phi_2)))
-        else:
-            t = 0
+        with np.errstate(invalid='ignore'):
+            t = np.where(np.isfinite(tau),
+                         (6 * tau * phi_2 - 6 * phi_2 - 6 * tau + (36 * tau**2 * phi_2**2 - 72 * tau * phi_2**2
+                          - 72 * tau**2 * phi_2 + 30 * phi_2**2 + 72 * tau * phi_2 + 36 * tau**2 - 12 * phi_2)**0.5) / (phi_2 * (-1 + phi_2)),
+                         0)
         # sphere volume
         vd = 4.0 / 3 * np.pi * (d / 2.0)**3
 
@@ -85,11 +86,10 @@ class StickyHardSpheres(Autocorrelation):
         n = phi_2 / vd
 
         # intersection volume, Eq. 27, LP2015
-        sqrt_vint = np.empty_like(X)
         zerok = np.isclose(X, 0, atol=1e-03)
-        nzerok = ~zerok
-        sqrt_vint[nzerok] = vd * 3 * (np.sinc(X[nzerok] / np.pi) - np.cos(X[nzerok])) / X[nzerok]**2  # sqrt(intersection volume )* X²
-        sqrt_vint[zerok] = vd
+        X_nonzero = np.where(zerok, 1., X)
+        sqrt_vint = np.where(zerok, vd,
+                             vd * 3 * (np.sinc(X_nonzero / np.pi) - np.cos(X_nonzero)) / X_nonzero**2)  # sqrt(intersection volume )* X²
 
         # Ghislain says: the following quantities are already multiplied by the sqrt_vint_X2 to avoid singularity in 0.
         # this differs from the original equations where the vint is multiplied at the end.
@@ -112,14 +112,16 @@ class StickyHardSpheres(Autocorrelation):
         # set limit value at k=0 manually, Eq. 33, LP2015
         # zerok = np.isclose(X, 0)
         # Ctilde[zerok] = (n * vd**2 / (phi_2 / (1-phi_2) * ((1 - t*phi_2 + 3 * phi_2 / (1 - phi_2)) + (3 - t * (1 - phi_2))) + 1)**2)
-        Ctilde[zerok] = (phi_2 * vd / (phi_2 / (1 - phi_2) * ((1 - t * phi_2 + 3 * phi_2 / (1 - phi_2)) + (3 - t * (1 - phi_2))) + 1)**2)
+        Ctilde = np.where(zerok,
+                          phi_2 * vd / (phi_2 / (1 - phi_2) * ((1 - t * phi_2 + 3 * phi_2 / (1 - phi_2)) + (3 - t * (1 - phi_2))) + 1)**2,
+                          Ctilde)
 
         return Ctilde
 
     def compute_t(self):
         """compute the t parameter used in the stickiness"""
 
-        if self.stickiness == np.inf:  # none-sticky case
+        if np.all(self.stickiness == np.inf):  # none-sticky case
             return 0
 
         f = self.frac_volume
@@ -144,15 +146,15 @@ class StickyHardSpheres(Autocorrelation):
         mhu = t * f * (1 - f)
         mhulim = 1 + 2 * f
 
-        if mhu > mhulim:
-            t = (-b + discr) / (2 * a)
+        if np.any(mhu > mhulim):
+            t = np.where(mhu > mhulim, (-b + discr) / (2 * a), t)
             mhu = t * f * (1 - f)
 
-        if mhu > mhulim:
-            print(mhu, mhulim)
+        if np.any(mhu > mhulim):
             raise SMRTError("no solution for the t parameter. Revise the stickiness")
 
-        return t
+        # none-sticky layers
+        return np.where(self.stickiness == np.inf, 0, t) if np.ndim(t) > 0 else t
 
     def tau_min(self, frac_volume):
         """compute the minimum possible stickiness value for given ice volume
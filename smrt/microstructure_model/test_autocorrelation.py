@@ -1 +1,107 @@
 
+import numpy as np
+import pytest
+import scipy.integrate
+
+from .exponential import Exponential
+from .independent_sphere import IndependentSphere
+from .teubner_strey import TeubnerStrey
+from .gaussian_random_field import GaussianRandomField
+from .sticky_hard_spheres import StickyHardSpheres
+
+
+@pytest.mark.parametrize("microstructure", [
+    Exponential({'corr_length': 2e-4, 'frac_volume': 0.3}),
+    IndependentSphere({'radius': 3e-4, 'frac_volume': 0.3}),
+    TeubnerStrey({'corr_length': 2e-4, 'repeat_distance': 1e-3, 'frac_volume': 0.3}),
+    TeubnerStrey({'corr_length': 2e-4, 'repeat_distance': 3e-4, 'frac_volume': 0.3}),
+    GaussianRandomField({'corr_length': 1e-4, 'repeat_distance': 5e-4, 'frac_volume': 0.3}),
+])
+def test_ft_autocorrelation_function_moment(microstructure):
+
+    for k in [50., 2e3, 3e4]:
+        for n in [1, 3, 5]:
+            ref = scipy.integrate.quad(lambda q: microstructure.ft_autocorrelation_function(np.atleast_1d(q))[0] * q**n, 0, k,
+                                       epsrel=1e-10, limit=500)[0]
+            np.testing.assert_allclose(microstructure.ft_autocorrelation_function_moment(k, n), ref, rtol=1e-5)
+
+
+def test_numerical_ft_is_shared_between_identical_instances():
+
+    params = {'corr_length': 2e-4, 'frac_volume': 0.3, 'ft_numerical': True}
+    m1 = Exponential(params)
+    m2 = Exponential(params)
+
+    k = np.linspace(0, 1e4, 20)
+    m1.ft_autocorrelation_function(k)
+    m2.ft_autocorrelation_function(k)
+    assert m1.resampled_ft_autocorrelation_function() is m2.resampled_ft_autocorrelation_function()
+
+    m3 = Exponential(dict(params, corr_length=3e-4))
+    assert m3.resampled_ft_autocorrelation_function() is not m1.resampled_ft_autocorrelation_function()
+
+    # the inverted medium must not reuse the fourier transform of the original medium
+    inverted = m1.inverted_medium()
+    assert inverted.resampled_ft_autocorrelation_function() is not m1.resampled_ft_autocorrelation_function()
+
+
+def test_numerical_ft_grid_adapts_to_k():
+
+    microstructure = Exponential({'corr_length': 1e-4, 'frac_volume': 0.3, 'ft_numerical': True})
+    kmax = microstructure.resampled_ft_autocorrelation_function()[0][-1]
+
+    # request beyond the default grid
+    k = np.array([0, 2 * kmax, 3 * kmax])
+    ft = microstructure.ft_autocorrelation_function(k)
+    assert microstructure.resampled_ft_autocorrelation_function()[0][-1] >= 3 * kmax
+
+    # the spectrum is tiny there, the check is only that it is not clamped to the value at the end of the default grid
+    np.testing.assert_allclose(ft, Exponential({'corr_length': 1e-4, 'frac_volume': 0.3}).ft_autocorrelation_function(k),
+                               rtol=5e-2)
+
+
+def test_numerical_ft_grid_extends_with_slow_decay():
+
+    # a long repeat distance makes the autocorrelation function decay slowly
+    microstructure = TeubnerStrey({'corr_length': 1e-3, 'repeat_distance': 1e-2, 'frac_volume': 0.3, 'ft_numerical': True})
+    analytic = TeubnerStrey({'corr_length': 1e-3, 'repeat_distance': 1e-2, 'frac_volume': 0.3})
+
+    k = np.linspace(0, 5e3, 50)
+    np.testing.assert_allclose(microstructure.ft_autocorrelation_function(k), analytic.ft_autocorrelation_function(k),
+                               rtol=1e-3)
+
+
+def test_numerical_ft_grid_is_bounded():
+
+    microstructure = Exponential({'corr_length': 1e-4, 'frac_volume': 0.3, 'ft_numerical': True})
+
+    with pytest.warns(UserWarning, match="truncated"):
+        k, ft = microstructure.resampled_ft_autocorrelation_function(kmax=1e8)
+    assert len(k) <= 2**18
+    assert k[-1] >= 1e8
+
+
+@pytest.mark.parametrize("cls, params", [
+    (Exponential, {'corr_length': [1e-4, 2e-4, 0.], 'frac_volume': [0.2, 0.3, 0.4]}),
+    (IndependentSphere, {'radius': [1e-4, 3e-4, 5e-4], 'frac_volume': [0.2, 0.3, 0.4]}),
+    (TeubnerStrey, {'corr_length': [1e-4, 2e-4, 3e-4], 'repeat_distance': [1e-3, 3e-4, 8e-4], 'frac_volume': 0.3}),
+    (StickyHardSpheres, {'radius': [1e-4, 3e-4, 5e-4], 'stickiness': [0.2, 0.5, np.inf], 'frac_volume': [0.2, 0.3, 0.4]}),
+])
+def test_vectorized_layers(cls, params):
+
+    nlayer = 3
+    vectorized = cls({name: np.asarray(value) for name, value in params.items()})
+
+    k = np.linspace(0, 3e4, 25)
+    ft = vectorized.ft_autocorrelation_function(k)
+    assert ft.shape == (nlayer, len(k))
+
+    for i in range(nlayer):
+        layer = cls({name: np.broadcast_to(value, nlayer)[i] for name, value in params.items()})
+        np.testing.assert_allclose(ft[i], layer.ft_autocorrelation_function(k), rtol=1e-12)
+
+        if hasattr(cls, "ft_autocorrelation_function_moment"):
+            np.testing.assert_allclose(vectorized.ft_autocorrelation_function_moment(k, 3)[i],
+                                       layer.ft_autocorrelation_function_moment(k, 3), rtol=1e-10)
+        if cls is StickyHardSpheres:
+            np.testing.assert_allclose(vectorized.compute_t()[i], layer.compute_t(), rtol=1e-12)
@@ -0,0 +1,62 @@
+
+import numpy as np
+import pytest
+
+from smrt import make_snowpack, sensor_list, make_model
+from .exponential import Exponential
+from .sampled_autocorrelation import SampledAutocorrelation, SampledAutocorrelationSet
+
+
+corr_length = 2e-4
+frac_volume = 0.3
+lag = np.arange(0, 40 * corr_length, corr_length / 50)
+
+
+def exponential_acf(corr_length):
+    return frac_volume * (1 - frac_volume) * np.exp(-lag / corr_length)
+
+
+def test_ft_autocorrelation_function():
+
+    sampled = SampledAutocorrelation({'frac_volume': frac_volume, 'lag': lag, 'acf': exponential_acf(corr_length)})
+    exp = Exponential({'frac_volume': frac_volume, 'corr_length': corr_length})
+
+    k = np.linspace(0, 5e3, 30)
+    np.testing.assert_allclose(sampled.ft_autocorrelation_function(k), exp.ft_autocorrelation_function(k), rtol=1e-3)
+    np.testing.assert_allclose(sampled.ft_autocorrelation_function_moment(5e3, 3),
+                               exp.ft_autocorrelation_function_moment(5e3, 3), rtol=1e-3)
+    np.testing.assert_allclose(sampled.inv_slope_at_origin, corr_length, rtol=2e-2)
+
+
+def test_truncated_acf_warns():
+
+    with pytest.warns(UserWarning):
+        SampledAutocorrelation({'frac_volume': frac_volume, 'lag': lag, 'acf': exponential_acf(100 * corr_length)})
+
+
+def test_sampled_set_from_file(tmp_path):
+
+    corr_lengths = np.array([1e-4, 2e-4, 3e-4])
+    filename = str(tmp_path / "acf.npy")
+    np.save(filename, np.array([exponential_acf(l) for l in corr_lengths]))
+
+    acf_set = SampledAutocorrelationSet(lag, filename, kmax=1e4)
+    assert len(acf_set) == 3
+
+    k = np.linspace(0, 5e3, 30)
+    for i, l in enumerate(corr_lengths):
+        exp = Exponential({'frac_volume': frac_volume, 'corr_length': l})
+        np.testing.assert_allclose(acf_set.microstructure(i, frac_volume).ft_autocorrelation_function(k),
+                                   exp.ft_autocorrelation_function(k), rtol=1e-3)
+
+    # the fourier transform vanishes beyond kmax
+    assert acf_set.microstructure(0, frac_volume).ft_autocorrelation_function(2e4) == 0
+
+    thickness = [0.1, 0.2, 1]
+    density = frac_volume * 917
+    sp_sampled = make_snowpack(thickness, SampledAutocorrelation, density=density, **acf_set.layer_parameters())
+    sp_exp = make_snowpack(thickness, "exponential", density=density, corr_length=corr_lengths)
+
+    m = make_model("iba", "dort")
+    sensor = sensor_list.passive(37e9, 55)
+    np.testing.assert_allclose(m.run(sensor, sp_sampled).TbV(), m.run(sensor, sp_exp).TbV(), atol=0.05)
@@ -8,7 +8,8 @@ parameters: frac_volume, corr_length, repeat_distance
 
 import numpy as np
 
-from .autocorrelation import Autocorrelation
+from ..core.error import SMRTError
+from .autocorrelation import Autocorrelation, rational_moment
 
 
 class TeubnerStrey(Autocorrelation):
@@ -16,6 +17,7 @@ class TeubnerStrey(Autocorrelation):
     """
     args = ["frac_volume", "corr_length", "repeat_distance"]
     optional_args = {}
+    vectorized = True
 
     def __init__(self, params):
 
@@ -41,7 +43,9 @@ class TeubnerStrey(Autocorrelation):
 
         """
 
-        acf = self.corr_func_at_origin * np.exp(-r / self.corr_length) * np.sinc(2 * r / self.repeat_distance)
+        corr_length = self.layer_parameter(self.corr_length)
+        acf = self.layer_parameter(self.corr_func_at_origin) * np.exp(-r / corr_length) * \
+            np.sinc(2 * r / self.layer_parameter(self.repeat_distance))
         return acf
 
     def ft_autocorrelation_function(self, k):
@@ -51,8 +55,27 @@ class TeubnerStrey(Autocorrelation):
 
         """
 
-        X = (k * self.corr_length)**2
-        Y = (2 * np.pi * self.corr_length / self.repeat_distance)**2
-        ft_acf_normalized = 8 * np.pi * self.corr_length**3 / ((1 + Y)**2 + 2 * (1 - Y) * X + X**2)
-
-        return self.corr_func_at_origin * ft_acf_normalized
+        corr_length = self.layer_parameter(self.corr_length)
+        X = (k * corr_length)**2
+        Y = (2 * np.pi * corr_length / self.layer_parameter(self.repeat_distance))**2
+        ft_acf_normalized = 8 * np.pi * corr_length**3 / ((1 + Y)**2 + 2 * (1 - Y) * X + X**2)
+
+        return self.layer_parameter(self.corr_func_at_origin) * ft_acf_normalized
+
+    def ft_autocorrelation_function_moment(self, k, n):
+        """compute analytically the moment of order n (1, 3 or 5) of the fourier transform of the autocorrelation function, i.e. the
+        integral of ft(q) * q**n for q from 0 to k."""
+        if n not in (1, 3, 5):
+            raise SMRTError("Only the moments of order 1, 3 and 5 are implemented")
+
+        corr_length = self.layer_parameter(self.corr_length)
+        no_scatterer = corr_length == 0
+        if np.all(no_scatterer):
+            return np.zeros(np.broadcast(k, corr_length).shape)
+
+        S = (k * corr_length)**2
+        Y = (2 * np.pi * corr_length / self.layer_parameter(self.repeat_distance))**2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            moment = self.layer_parameter(self.corr_func_at_origin) * 4 * np.pi * corr_length**(2 - n) * \
+                rational_moment(S, (n - 1) // 2, 2 * (1 - Y), (1 + Y)**2)
+        return np.where(no_scatterer, 0., moment) if np.any(no_scatterer) else moment
@@ -31,6 +31,10 @@ E.g. ice.py contains formulation for pure ice permittivity.
     This complication is necessary because there is no way in Python to inspect the name of the arguments of
     a function, so the need for explicit declaration.
 
+    The functions should use numpy (np.exp, np.where, ...) rather than math and if statements so that they accept arrays of
+    frequency and layer properties and broadcast them. This allows to evaluate the permittivity of all the layers of a snowpack at once
+    by calling the function with the snowpack (or a list of layers) instead of a layer.
+
     3. to use the new function, import the module (e.g. from smrt.permittivity.ice import permittivity_something) and
     pass this function to :py:func:`smrt.core.snowpack.make_snowpack` or :py:func:`smrt.core.layer:make_snow_layer`.
 
@@ -13,10 +13,9 @@ def brine_conductivity(temperature):
     :param temperature: thermometric temperature [K]"""
 
     tempC = temperature - FREEZING_POINT  # temperature in deg Celsius
-    if tempC >= -22.9:
-        sigma = -tempC * np.exp(0.5193 + 0.08755 * tempC)
-    else: # tempC < -22.9
-        sigma = -tempC * np.exp(1.0334 + 0.1100 * tempC)
+    sigma = -tempC * np.where(tempC >= -22.9,
+                              np.exp(0.5193 + 0.08755 * tempC),
+                              np.exp(1.0334 + 0.1100 * tempC))  # tempC < -22.9
     return sigma
 
 
@@ -51,12 +50,10 @@ def calculate_brine_salinity(temperature):
     """
     tempC = temperature - FREEZING_POINT
 
-    if tempC > -2:
-        salinity_brine = 0.02515 - 17.787 * tempC
-    elif tempC >= -8.2:
-        salinity_brine = 1.725 - 18.756 * tempC - 0.3946 * tempC ** 2
-    else:
-        salinity_brine = 57.041 - 9.929 * tempC - 0.16204 * tempC ** 2 - 0.002396 * tempC ** 3
+    salinity_brine = np.select([tempC > -2, tempC >= -8.2],
+                               [0.02515 - 17.787 * tempC,
+                                1.725 - 18.756 * tempC - 0.3946 * tempC ** 2],
+                               57.041 - 9.929 * tempC - 0.16204 * tempC ** 2 - 0.002396 * tempC ** 3)[()]
 
     return salinity_brine
 
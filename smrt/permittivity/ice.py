@@ -2,11 +2,8 @@
 
 from __future__ import print_function
 
-# Stdlib import
-import math
-
 # other import
-# import numpy as np
+import numpy as np
 
 # local import
 # from ..core.error import SMRTError
@@ -48,13 +45,13 @@ def ice_permittivity_maetzler06(frequency, temperature):
     Ereal = 3.1884 + 9.1e-4 * (temperature - FREEZING_POINT)
 
     theta = 300.0 / temperature - 1.0
-    alpha = (0.00504 + 0.0062 * theta) * math.exp(-22.1 * theta)
+    alpha = (0.00504 + 0.0062 * theta) * np.exp(-22.1 * theta)
 
     B1 = 0.0207
     B2 = 1.16e-11
     b = 335.
-    deltabeta = math.exp(- 9.963 + 0.0372 * (temperature - FREEZING_POINT))
-    betam = (B1 / temperature) * (math.exp(b / temperature) / ((math.exp(b / temperature) - 1)**2)) + B2 * freqGHz**2
+    deltabeta = np.exp(- 9.963 + 0.0372 * (temperature - FREEZING_POINT))
+    betam = (B1 / temperature) * (np.exp(b / temperature) / ((np.exp(b / temperature) - 1)**2)) + B2 * freqGHz**2
     beta = betam + deltabeta
 
     Eimag = alpha / freqGHz + beta * freqGHz
@@ -74,7 +71,7 @@ def ice_permittivity_maetzler98(frequency, temperature):
 
     # The Hufford model for the imaginary part:
     theta = 300. / temperature - 1.
-    alpha = (0.00504 + 0.0062 * theta) * math.exp(-22.1 * theta)
+    alpha = (0.00504 + 0.0062 * theta) * np.exp(-22.1 * theta)
     beta = (0.502 - 0.131 * theta / (1 + theta)) * 1e-4 + \
         (0.542e-6 * ((1 + theta) / (theta + 0.0073))**2)
 
@@ -111,18 +108,14 @@ def ice_permittivity_maetzler87(frequency, temperature):
     # Equation 10
     Ereal = 3.1884 + 9.1e-4 * (temperature - FREEZING_POINT)
 
-    if (temperature - FREEZING_POINT) < -10:
-        A = 3.5e-4
-        B = 3.6e-5
-        C = 1.2
-    else:
-        A = 6e-4
-        B = 6.5e-5
-        C = 1.07
+    cold = (temperature - FREEZING_POINT) < -10
+    A = np.where(cold, 3.5e-4, 6e-4)
+    B = np.where(cold, 3.6e-5, 6.5e-5)
+    C = np.where(cold, 1.2, 1.07)
     # Equation 13
     Eimag = A / freqGHz + B * freqGHz**C
     # Issue warning if temperature different from values in paper
-    if temperature not in [FREEZING_POINT-5, FREEZING_POINT-15]:
+    if not np.all(np.isin(temperature, [FREEZING_POINT-5, FREEZING_POINT-15])):
         warnings.warn("Strictly, this permittivity formulation was proposed for -5 and -15 deg C. It is recommended to use another formulation if this is not for testing purpose")
 
     return Ereal + Eimag * 1j
@@ -156,7 +149,7 @@ def ice_permittivity_tiuri84(frequency, temperature):
     # Eq (6) - Imaginary part
     Eimag = 1.59e6 * \
             (0.52 * density_gm3 + 0.62*density_gm3**2) * \
-            (frequency**-1 + 1.23e-14 * frequency**.5) * math.exp(0.036 * temp_degC)
+            (frequency**-1 + 1.23e-14 * frequency**.5) * np.exp(0.036 * temp_degC)
 
     return Ereal + 1j * Eimag
 
@@ -182,9 +175,9 @@ def _ice_permittivity_HUT(frequency, temperature):
     # NB frequencies in original equations are in GHz, here in Hz.
     freqGHz = frequency * 1e-9
     theta = (300.0 / temperature) - 1.0  # Floats needed for correct calculation in py2.7 but not needed in 3.x
-    alpha = (0.00504 + 0.0062 * theta) * math.exp(-22.1 * theta)
-    beta = (0.0207 / temperature) * (math.exp(335.0 / temperature) / (math.exp(335.0 / temperature) - 1.0)**2) + (
-        1.16e-11 * (freqGHz)**2 + math.exp(-10.02 + 0.0364 * (temperature - 273.0)))
+    alpha = (0.00504 + 0.0062 * theta) * np.exp(-22.1 * theta)
+    beta = (0.0207 / temperature) * (np.exp(335.0 / temperature) / (np.exp(335.0 / temperature) - 1.0)**2) + (
+        1.16e-11 * (freqGHz)**2 + np.exp(-10.02 + 0.0364 * (temperature - 273.0)))
     imag_permittivity_ice = alpha / freqGHz + beta * freqGHz
 
     return real_permittivity_ice + 1j * imag_permittivity_ice
@@ -211,9 +204,9 @@ def _ice_permittivity_DMRTML(frequency, temperature):
     # NB frequencies in original equations are in GHz, here in Hz.
     freqGHz = frequency * 1e-9
     theta = (300.0 / temperature) - 1.0  # Floats needed for correct calculation in py2.7 but not needed in 3.x
-    alpha = (0.00504 + 0.0062 * theta) * math.exp(-22.1 * theta)
-    beta = (0.0207 / temperature) * (math.exp(335.0 / temperature) / (math.exp(335.0 / temperature) - 1.0)**2) + (
-        1.16e-11 * (freqGHz)**2 + math.exp(-9.963 + 0.0372 * (temperature - 273.16)))
+    alpha = (0.00504 + 0.0062 * theta) * np.exp(-22.1 * theta)
+    beta = (0.0207 / temperature) * (np.exp(335.0 / temperature) / (np.exp(335.0 / temperature) - 1.0)**2) + (
+        1.16e-11 * (freqGHz)**2 + np.exp(-9.963 + 0.0372 * (temperature - 273.16)))
     imag_permittivity_ice = alpha / freqGHz + beta * freqGHz
 
     return real_permittivity_ice + 1j * imag_permittivity_ice
@@ -241,11 +234,11 @@ def _ice_permittivity_MEMLS(frequency, temperature, salinity):
     # NB frequencies in original equations are in GHz, here in Hz.
     freqGHz = frequency * 1e-9
     theta = (300.0 / temperature) - 1.0  # Floats needed for correct calculation in py2.7 but not needed in 3.x
-    alpha = (0.00504 + 0.0062 * theta) * math.exp(-22.1 * theta)
-    beta = (0.0207 / temperature) * (math.exp(335.0 / temperature) / (math.exp(335.0 / temperature) - 1.0)**2) + (
-        1.16e-11 * (freqGHz)**2 + math.exp(-9.963 + 0.0372 * (temperature - 273.0)))
+    alpha = (0.00504 + 0.0062 * theta) * np.exp(-22.1 * theta)
+    beta = (0.0207 / temperature) * (np.exp(335.0 / temperature) / (np.exp(335.0 / temperature) - 1.0)**2) + (
+        1.16e-11 * (freqGHz)**2 + np.exp(-9.963 + 0.0372 * (temperature - 273.0)))
     # Salinity modifications from equations 5.36 and 5.37 in Mätzler (2006)
-    salinity_effect = 1866.0 * math.exp(-0.317 * freqGHz) + (72.2 + 6.02 * freqGHz) * (273.16 - temperature)
+    salinity_effect = 1866.0 * np.exp(-0.317 * freqGHz) + (72.2 + 6.02 * freqGHz) * (273.16 - temperature)
     imag_permittivity_ice = alpha / freqGHz + beta * freqGHz + salinity / (0.013 * salinity_effect)
 
     return real_permittivity_ice + 1j * imag_permittivity_ice
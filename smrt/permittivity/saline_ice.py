@@ -25,7 +25,7 @@ def impure_ice_permittivity_maetzler06(frequency, temperature, salinity):
     """
 
     # Issue warning if salinity > 0.013 PSU
-    if salinity > 0.013e-3:
+    if np.any(salinity > 0.013e-3):
         warnings.warn(
             "This permittivity model was developed for saline impurities of around 0.013 10^-3 kg/kg (or 0.013 PSU)")
 
@@ -114,20 +114,14 @@ def saline_snow_permittivity_scharien(density, temperature, salinity, brine_perm
     density_brine = 1000 + 0.8 * salinity_brine
 
     # initial brine volume
-    if tempC >= -0.1:
-        initial_brine_volume = Sppt * 500.9
-    elif tempC >= -0.2:
-        initial_brine_volume = Sppt * 250.5
-    elif tempC >= -0.3:
-        initial_brine_volume = Sppt * 167.1
-    elif tempC >= -0.4:
-        initial_brine_volume = Sppt * 125.4
-    else:
-        initial_brine_volume = Sppt * (-49.185 / tempC + 0.532)
-
-    initial_brine_volume *= PSU
-
-    if (tempC < -22.9) and (salinity == 0):
+    with np.errstate(divide='ignore'):
+        initial_brine_volume = Sppt * np.select([tempC >= -0.1, tempC >= -0.2, tempC >= -0.3, tempC >= -0.4],
+                                                [500.9, 250.5, 167.1, 125.4],
+                                                -49.185 / tempC + 0.532)
+
+    initial_brine_volume = initial_brine_volume * PSU
+
+    if np.any((tempC < -22.9) & (salinity == 0)):
         raise SMRTError(
                 'Snow temperatures may be too low to be valid for calculating correct brine density and volume in snow.')
 
@@ -140,10 +134,9 @@ def saline_snow_permittivity_scharien(density, temperature, salinity, brine_perm
     density_drysnow = density - true_brine_volume * density_brine
 
     # Permittivity of dry snow; density dependent
-    if density_drysnow <= 500:
-        eps_drysnow = 1 + 1.9 * (density_drysnow / 1000)
-    else:
-        eps_drysnow = 0.51 + 2.88 * (density_drysnow / 1000)
+    eps_drysnow = np.where(density_drysnow <= 500,
+                           1 + 1.9 * (density_drysnow / 1000),
+                           0.51 + 2.88 * (density_drysnow / 1000))
 
     depolarization_factor = 0.053
     coupling_factor = 0.667
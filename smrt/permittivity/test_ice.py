@@ -13,7 +13,6 @@ from smrt.permittivity.ice import ice_permittivity_maetzler06, \
 
 from smrt.core.error import SMRTError
 
-# Input temperature array functionality removed. If ever needed, use numpy instead of math in ice.py, but slower.
 
 # @raises(SMRTError)
 # def test_zero_temperature_exception_raised():
@@ -167,3 +166,16 @@ def test_imaginary_ice_permittivity_output_matzler_temp_270_freq_10GHz():
 def test_salty_imaginary_ice_permittivity_output_matzler_temp_270_freq_10GHz():
     eps = _ice_permittivity_MEMLS(10e9, 270, 50)
     np.testing.assert_allclose(eps.imag, 7.74334595964606, atol=1e-8)
+
+
+def test_ice_permittivity_arrays():
+    temperature = np.array([250., 260., 270.])
+    frequency = np.array([10e9, 37e9])[:, np.newaxis]
+
+    for permittivity in [ice_permittivity_maetzler06, ice_permittivity_tiuri84, _ice_permittivity_HUT, _ice_permittivity_DMRTML]:
+        eps = permittivity(frequency, temperature)
+        assert eps.shape == (2, 3)
+        np.testing.assert_allclose(eps[1, 2], permittivity(37e9, 270.))
+
+    eps = _ice_permittivity_MEMLS(10e9, temperature, np.array([0, 10, 50]))
+    np.testing.assert_allclose(eps[2], _ice_permittivity_MEMLS(10e9, 270, 50))
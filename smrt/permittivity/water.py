@@ -26,6 +26,6 @@ def water_permittivity(frequency, temperature):
     #  % version of Liebe MPM 1993 uses: e2=3.52
     f2 = 39.8 * f1
 
-    Ew = e2 + (e1-e2)/complex(1,-freqGHz/f2) + (e0-e1)/complex(1,-freqGHz/f1)
+    Ew = e2 + (e1-e2)/(1 - 1j * freqGHz/f2) + (e0-e1)/(1 - 1j * freqGHz/f1)
 
     return Ew
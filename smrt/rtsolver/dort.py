@@ -9,6 +9,7 @@ function in Legendre polynomia on theta. The version used in DMRT-QMS (L. Tsang'
 it uses spline interpolation to connect constant-angle streams between the layers although we use direct connection by varying the angle 
 according to Snell's law. A practical consequence is that the number of streams vary (due to internal reflection) and the value `n_max_stream`
 only applies in the most refringent layer. The number of outgoing streams in the air is usually smaller, sometimes twice smaller (depends on the density profile).
+The interpolation approach of DMRT-QMS is available with `stream_mode="interpolated"`.
 It is important not to set too low a value for n_max_streams. E.g. 32 is usually fine, 64 or 128 are better but simulations will be much slower.
 
 """
@@ -16,18 +17,23 @@ It is important not to set too low a value for n_max_streams. E.g. 32 is usually
 
 # Stdlib import
 import math
+import concurrent.futures
+import threading
+from collections import OrderedDict
 from warnings import warn
 
 # other import
 import numpy as np
+import xarray as xr
 import scipy.special.orthogonal
 import scipy.linalg
 import scipy.interpolate
+import scipy.optimize
 
 # local import
 from ..core.error import SMRTError
-from ..core.result import make_result
-from smrt.core.lib import smrt_matrix, smrt_diag, isnull
+from ..core.result import make_result, concat_results
+from smrt.core.lib import smrt_matrix, smrt_diag, isnull, generic_ft_even_matrix, generic_ft_even_mode
 from smrt.core.optional_numba import numba
 # Lazy import: from smrt.interface.coherent_flat import process_coherent_layers
 
@@ -35,8 +41,16 @@ from smrt.core.optional_numba import numba
 class DORT(object):
     """Discrete Ordinate and Eigenvalue Solver
 
-        :param n_max_stream: number of stream in the most refringent layer
+        :param n_max_stream: number of stream in the most refringent layer. If set to "auto", the RT equation is solved with an increasing
+        number of streams until the intensity at the sensor angles changes by less than `auto_stream_tolerance`.
         :param m_max: number of mode (azimuth)
+        :param stream_mode: If set to "most_refringent" (the default), `n_max_stream` is the number of streams in the most refringent layer,
+        and the number of outgoing streams in the air is smaller because of the total internal reflection. If set to "air", the number of streams
+        in the most refringent layer is automatically increased so that `n_max_stream` streams emerge in the air. This is the recommended
+        mode to control the output angular resolution, the cost then scales with the resolution needed in the air. If set to "interpolated",
+        all the layers use the same `n_max_stream` Gauss nodes and the intensity transmitted through the interfaces between layers is
+        linearly interpolated between the streams, as in DMRT-QMS. All the layers then have the same number of streams, which makes the
+        boundary system regular (same block size for all the layers) at the cost of the interpolation error.
         :param phase_normalization: the integral of the phase matrix should in principe be equal to the scattering coefficient.
         However, some emmodels do not respect this strictly. In general a small difference is due to numerical rounding and is acceptable,
         but a large difference rather indicates either a bug in the emmodel or input parameters that breaks the
@@ -55,12 +69,63 @@ class DORT(object):
         :param prune_deep_snowpack: this value is the optical depth from which the layers are discarded in the calculation. It is to be use to accelerate the calculations
         for deep snowpacks or at high frequencies when the contribution of the lowest layers is neglegible. The optical depth is a good criteria to determine this limit.
         A value of about 6 is recommended. Use with care, especially values lower than 6.
+        :param phase_truncation: truncate the forward peak of the phase matrix (delta-M like approach, Potter 1970). Large grains compared
+        to the wavelength produce forward-peaked phase functions that are poorly sampled by the streams, requiring large `n_max_stream`.
+        When this option is set, the phase matrix is clipped in the forward cone, the scattering coefficient is reduced by the truncated
+        fraction f, and the extinction coefficient is reduced by f * ks, so that the truncated energy is treated as unscattered.
+        If True, the truncated fraction f is given in each layer by the Legendre moment of order 2 * n of the phase function (n is the
+        number of streams in the layer), as in the delta-M method (Wiscombe 1977), and the half-angle of the cone is then searched so
+        that the clipped energy equals f. No truncation is applied when f is negligible (< 1e-6), that is when the phase function is
+        smooth enough for the streams. A number gives directly the half-angle of the cone in degree, the same in all the layers.
+        This option requires emmodels that implement the `phase` method (e.g. IBA, Rayleigh).
+        :param add_sensor_streams: add the sensor viewing angles (refracted in each layer according to Snell's law) to the streams
+        computed by the quadrature. The weights of all the streams are adjusted accordingly. The intensity is then computed exactly at the
+        requested angles, without interpolation, and a much smaller `n_max_stream` gives the same accuracy when only a few viewing angles
+        are needed. The nadir direction is never added, it is extrapolated as usual.
+        :param auto_stream_tolerance: convergence criteria when `n_max_stream` is "auto", in K in passive mode and in dB in active mode.
+        :param auto_stream_max: maximum number of streams when `n_max_stream` is "auto".
+        :param auto_stream_memory: if True and `n_max_stream` is "auto", the selected number of streams is remembered for the following
+        simulations with the same sensor (mode, frequency and angles), emmodels and solver options (`stream_mode`, `m_max`,
+        `auto_stream_tolerance` and `auto_stream_max`), so that in a batch of simulations only the first one searches from a low number
+        of streams. The search then starts from the remembered value and may select more streams than a search from scratch. The memory
+        is shared by all the DORT instances and bounded to the last `DORT._auto_n_max_stream_size` configurations.
+        :param precision: floating point precision of the computation. "float64" (default) is the full double precision. "mixed" solves
+        the eigenvalue problems in single precision and the boundary system in double precision. "float32" solves both in single
+        precision. In all cases, the transmittances through the layers (exponentials) and the emerging intensities are computed in
+        double precision. The single precision reduces the computation time and memory for large numbers of streams and layers at the
+        cost of an accuracy of the order of 0.01 K in passive mode and 0.01 dB in active mode.
+        :param temperature_weighting_functions: if True (passive mode only), return the brightness temperature as a linear function of
+        the temperature profile instead of the brightness temperature. The result has an additional dimension 'source'. The
+        coordinate 'sky' holds the contribution of the atmosphere (or 0), the coordinates 'layer0', 'layer1', ... the derivative of the
+        brightness temperature with respect to the temperature of each layer and 'substrate' the derivative with respect to the
+        substrate temperature. All are computed with a single solve. Use :py:func:`apply_temperature_weighting_functions` to compute
+        the brightness temperature for any number of temperature profiles.
+        :param sky_response: if True (passive mode only), return the emission of the snowpack and its reflectivity matrix for a unit
+        downwelling radiance in each stream, instead of the brightness temperature. The result has an additional dimension 'source'.
+        The first element is the emission of the snowpack under a black sky, the others the reflectivities for the incident streams
+        whose cosine and polarization are given by the coordinates 'source_mu' and 'source_polarization'. The atmosphere of the snowpack
+        is ignored. Use :py:func:`apply_sky_radiance` to compute the brightness temperature for any number of atmospheres.
+        :param n_mode_threads: number of threads used to solve the azimuthal modes m > 0 concurrently (active mode only). The modes are
+        independent and the numerical libraries release the GIL, which speeds up large simulations (many streams or layers). The modes
+        are summed in the same order as with a single thread so that the result is identical. When running many simulations, it is
+        more efficient to use a parallel runner instead (see :py:mod:`smrt.core.model`).
+        :param lazy_phase: if True, each mode of the Fourier decomposition of the phase matrix is computed alone when needed and released
+        after use, instead of being stored for all the modes and all the layers during the whole solve. The mode is computed from the
+        `phase` method of the emmodel, evaluated one azimuth at a time, which bounds the memory to a single mode of a single layer for
+        large active simulations (many streams, layers and modes), at the cost of evaluating the phase function for each mode. The result
+        is identical to rounding errors. For the emmodels without the `phase` method, the modes 0 to m are computed by `ft_even_phase`
+        for the mode m.
     """
 
     # this specifies which dimension this solver is able to deal with. Those not in this list must be managed by the called (Model object)
     # e.g. here, frequency, time, ... are not managed
     _broadcast_capability = {"theta_inc", "polarization_inc", "theta", "phi", "polarization"}
 
+    # number of streams selected by the "auto" mode for each configuration, when auto_stream_memory is set
+    _auto_n_max_stream = OrderedDict()
+    _auto_n_max_stream_size = 64
+    _auto_n_max_stream_lock = threading.Lock()
+
     def __init__(self,
                  n_max_stream=32,
                  m_max=2,
@@ -68,7 +133,17 @@ class DORT(object):
                  phase_normalization=True,
                  error_handling="exception",
                  process_coherent_layers=False,
-                 prune_deep_snowpack=None):
+                 prune_deep_snowpack=None,
+                 phase_truncation=False,
+                 add_sensor_streams=False,
+                 auto_stream_tolerance=0.1,
+                 auto_stream_max=256,
+                 auto_stream_memory=False,
+                 precision="float64",
+                 temperature_weighting_functions=False,
+                 sky_response=False,
+                 n_mode_threads=1,
+                 lazy_phase=False):
         # """
         # :param n_max_stream: number of stream in the most refringent layer
         # :param m_max: number of mode (azimuth)
@@ -84,6 +159,22 @@ class DORT(object):
         if prune_deep_snowpack is True:
             prune_deep_snowpack = 6
         self.prune_deep_snowpack = prune_deep_snowpack
+        self.phase_truncation = phase_truncation
+        self.add_sensor_streams = add_sensor_streams
+        self.auto_stream_tolerance = auto_stream_tolerance
+        self.auto_stream_max = auto_stream_max
+        self.auto_stream_memory = auto_stream_memory
+
+        if precision not in ("float64", "float32", "mixed"):
+            raise SMRTError("precision must be 'float64', 'float32' or 'mixed'")
+        self.precision = precision
+        self.temperature_weighting_functions = temperature_weighting_functions
+        self.sky_response = sky_response
+        self.n_mode_threads = n_mode_threads
+        self.lazy_phase = lazy_phase
+
+        if temperature_weighting_functions and sky_response:
+            raise SMRTError("The options temperature_weighting_functions and sky_response can not be used together")
 
     def solve(self, snowpack, emmodels, sensor, atmosphere=None):
         """solve the radiative transfer equation for a given snowpack, emmodels and sensor configuration.
@@ -114,20 +205,69 @@ class DORT(object):
         if self.sensor.mode == 'P':
             pola = ['V', 'H']
             self.temperature = [layer.temperature for layer in self.snowpack.layers]
+            self.substrate_temperature = self.snowpack.substrate.temperature if self.snowpack.substrate is not None else None
+            if self.temperature_weighting_functions:
+                # each layer and the substrate get a unit temperature in its own column of the right-hand side (after the sky)
+                nlayer = len(self.snowpack.layers)
+                sources = np.eye(nlayer + 2)
+                self.temperature = list(sources[1:nlayer + 1])
+                self.substrate_temperature = sources[nlayer + 1]
             m_max = 0  # force m_max=0 for passive microwave
         else:
             pola = ['V', 'H', 'U']
             self.temperature = None
+            self.substrate_temperature = None
             m_max = self.m_max
+            if self.temperature_weighting_functions or self.sky_response:
+                raise SMRTError("The temperature weighting functions and the sky response are only available in passive mode")
+
+        if self.sky_response:
+            self.atmosphere = None
+            if self.n_max_stream == "auto":
+                raise SMRTError("The sky response requires a fixed number of streams, n_max_stream='auto' is not possible")
 
         # solve the RT equation
-        outmu, intensity = self.dort(m_max=m_max)
+        npol = len(pola)
+        if self.n_max_stream == "auto":
+            intensity = self.dort_auto_stream(m_max, npol)
+        else:
+            outmu, intensity = self.dort(m_max=m_max)
+            if self.sky_response:
+                # the reflectivities are the difference between the responses to unit sky radiances and the emission
+                intensity[:, 1:] -= intensity[:, 0:1]
+            intensity = self.interpolate_intensity(outmu, intensity, npol)
+
+        # if sensor.mode == 'A':
+        #    # reshape the outer/first dimension in two dimensions (theta_inc, pola_inc)
+        #    intensity = intensity.reshape(list(intensity.shape[:-1]) + [intensity.shape[-1] // npol, npol])
+
+        #  describe the results list of (dimension name, dimension array of value)
+        if sensor.mode == 'P':
+            coords = [('theta', sensor.theta_deg), ('polarization', pola)]
+            if self.temperature_weighting_functions:
+                layers = ['layer%i' % l for l in range(len(snowpack.layers))]
+                coords += [('source', ['sky'] + layers + ['substrate'])]
+            if self.sky_response:
+                coords += [('source', np.arange(intensity.shape[-1]))]
+
+        else:  # sensor.mode == 'A':
+            #coords = [('theta_inc', sensor.theta_inc_deg), ('polarization_inc', pola)] + coords
+            coords = [('theta_inc', sensor.theta_inc_deg), ('polarization_inc', pola), ('polarization', pola)]
+
+        result = make_result(sensor, intensity, coords)
+
+        if self.sky_response:
+            result.data = result.data.assign_coords(source_mu=('source', np.insert(np.repeat(outmu, npol), 0, np.nan)),
+                                                    source_polarization=('source', [''] + pola * len(outmu)))
+        return result
+
+    def interpolate_intensity(self, outmu, intensity, npol):
+        # interpolate the intensity computed at the outgoing streams to the sensor viewing angles
 
         # reshape the first dimension in two dimensions (theta, pola)
-        npol = len(pola)
         intensity = intensity.reshape([intensity.shape[0] // npol, npol] + list(intensity.shape[1:]))
 
-        mu = np.cos(sensor.theta)
+        mu = np.cos(self.sensor.theta)
 
         fill_value = None
         if np.max(mu) > np.max(outmu):
@@ -159,21 +299,55 @@ class DORT(object):
         i = np.argsort(mu)
         intensity = intfct(mu[i])[np.argsort(i)]  # mu[i] sort mu, and [np.argsort(i)] put in back
 
-        # if sensor.mode == 'A':
-        #    # reshape the outer/first dimension in two dimensions (theta_inc, pola_inc)
-        #    intensity = intensity.reshape(list(intensity.shape[:-1]) + [intensity.shape[-1] // npol, npol])
+        return intensity
 
-        #  describe the results list of (dimension name, dimension array of value)
-        if sensor.mode == 'P':
-            coords = [('theta', sensor.theta_deg), ('polarization', pola)]
+    def dort_auto_stream(self, m_max, npol):
+        # solve the RT equation with increasing number of streams until the intensity at the sensor angles converges.
+        # The selected number of streams is remembered for the next simulations with the same configuration if auto_stream_memory is set.
 
-        else:  # sensor.mode == 'A':
-            #coords = [('theta_inc', sensor.theta_inc_deg), ('polarization_inc', pola)] + coords
-            coords = [('theta_inc', sensor.theta_inc_deg), ('polarization_inc', pola), ('polarization', pola)]
+        key = (self.sensor.mode, float(self.sensor.frequency), tuple(np.atleast_1d(self.sensor.theta).tolist()),
+               tuple(sorted(set(type(em).__name__ for em in self.emmodels))),
+               self.stream_mode, m_max, self.auto_stream_tolerance, self.auto_stream_max)
+
+        def solve_n(n):
+            outmu, intensity = self.dort(m_max=m_max, n_max_stream=n)
+            return self.interpolate_intensity(outmu, intensity, npol)
 
-        return make_result(sensor, intensity, coords)
+        def difference(x1, x2):
+            if self.sensor.mode == 'P':
+                return np.max(np.abs(x1 - x2))  # in K
+            else:
+                positive = (x1 > 0) & (x2 > 0)
+                return np.max(np.abs(10 * np.log10(x1[positive] / x2[positive])), initial=0)  # in dB
+
+        n = 8
+        if self.auto_stream_memory:
+            with DORT._auto_n_max_stream_lock:
+                if key in DORT._auto_n_max_stream:
+                    DORT._auto_n_max_stream.move_to_end(key)
+                    n = DORT._auto_n_max_stream[key]
+        intensity = solve_n(n)
+
+        while True:
+            n_next = n + max(n // 2, 2)
+            if n_next > self.auto_stream_max:
+                warn("DORT has not converged with %i streams. Increase auto_stream_max or auto_stream_tolerance." % n)
+                break
+            previous_intensity, intensity = intensity, solve_n(n_next)
+            if difference(intensity, previous_intensity) < self.auto_stream_tolerance:
+                break
+            n = n_next
 
-    def dort(self, m_max=0, special_return=False):
+        if self.auto_stream_memory:
+            with DORT._auto_n_max_stream_lock:
+                DORT._auto_n_max_stream[key] = n
+                while len(DORT._auto_n_max_stream) > DORT._auto_n_max_stream_size:
+                    DORT._auto_n_max_stream.popitem(last=False)
+        self.selected_n_max_stream = n
+
+        return intensity
+
+    def dort(self, m_max=0, special_return=False, n_max_stream=None):
         # not to be called by the user
         #     """
         #     :param incident_intensity: give either the intensity (array of size 2) at incident_angle (radar) or isotropic or a function
@@ -187,7 +361,17 @@ class DORT(object):
         #   compute the cosine of the angles in all layers
         # first compute the permittivity of the ground
 
-        streams = compute_stream(self.n_max_stream, self.effective_permittivity, self.substrate_permittivity, mode=self.stream_mode)
+        if self.add_sensor_streams:
+            sensor_theta = self.sensor.theta_inc if self.sensor.mode == 'A' else self.sensor.theta
+            extra_outmu = np.cos(np.atleast_1d(sensor_theta))
+        else:
+            extra_outmu = None
+
+        if n_max_stream is None:
+            n_max_stream = self.n_max_stream
+
+        streams = compute_stream(n_max_stream, self.effective_permittivity, self.substrate_permittivity,
+                                 mode=self.stream_mode, extra_outmu=extra_outmu)
 
         #
         # compute the incident intensity array depending on the sensor
@@ -209,25 +393,41 @@ class DORT(object):
                                               streams.mu[l],
                                               streams.weight[l],
                                               m_max,
-                                              self.phase_normalization) for l in range(len(self.emmodels))]
+                                              self.phase_normalization,
+                                              phase_function=getattr(self.emmodels[l], "phase", None),
+                                              truncation=self.phase_truncation,
+                                              dtype=np.float64 if self.precision == "float64" else np.float32,
+                                              lazy_phase=self.lazy_phase)
+                             for l in range(len(self.emmodels))]
 
         #
         # compute the outgoing intensity for each mode
 
-        for m in range(0, m_max + 1):
+        def solve_mode(m):
             intensity_down_m = intensity_0 if m == 0 else intensity_higher
 
             # compute the upwelling intensity for mode m
             intensity_up_m = self.dort_modem_banded(m, streams, eigenvalue_solver, interfaces, intensity_down_m,
                                                     special_return=special_return)
 
-            if special_return:  # debuging
-                return intensity_up_m
-
-            if self.sensor.mode == 'A':
+            if self.sensor.mode == 'A' and not special_return:
                 # substrate the coherent contribution
                 intensity_up_m -= self.dort_modem_banded(m, streams, eigenvalue_solver, interfaces, intensity_down_m,
                                                          compute_coherent_only=True)
+            return intensity_up_m
+
+        if self.n_mode_threads > 1 and m_max > 1 and not special_return:
+            # the mode m=0 is solved first because it computes the normalization of the phase function used by the other modes
+            intensity_up_modes = [solve_mode(0)]
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.n_mode_threads) as executor:
+                intensity_up_modes += executor.map(solve_mode, range(1, m_max + 1))  # the results are in the order of the modes
+        else:
+            intensity_up_modes = (solve_mode(m) for m in range(0, m_max + 1))
+
+        for m, intensity_up_m in enumerate(intensity_up_modes):
+
+            if special_return:  # debuging
+                return intensity_up_m
 
             # reconstruct the intensity
             if m == 0:
@@ -241,8 +441,13 @@ class DORT(object):
                 # when self.m_max is too high for the phase function.
 
         if self.sensor.mode == 'P' and self.atmosphere is not None:
-            intensity_up = self.atmosphere.tbup(self.sensor.frequency, streams.outmu, npol) + \
-                self.atmosphere.trans(self.sensor.frequency, streams.outmu, npol) * intensity_up
+            if self.temperature_weighting_functions:
+                # only the sky column receives the atmospheric emission
+                intensity_up = self.atmosphere.trans(self.sensor.frequency, streams.outmu, npol)[:, np.newaxis] * intensity_up
+                intensity_up[:, 0] += self.atmosphere.tbup(self.sensor.frequency, streams.outmu, npol)
+            else:
+                intensity_up = self.atmosphere.tbup(self.sensor.frequency, streams.outmu, npol) + \
+                    self.atmosphere.trans(self.sensor.frequency, streams.outmu, npol) * intensity_up
 
         if self.sensor.mode == 'A':
             # compress to get only the backscatter
@@ -303,7 +508,12 @@ class DORT(object):
             npol = 2
             incident_streams = []
 
-            if self.atmosphere is not None:
+            if self.sky_response:
+                # emission (black sky), then a unit radiance in each stream and polarization
+                intensity_0 = np.hstack((np.zeros((len(streams.outmu) * npol, 1)), np.eye(len(streams.outmu) * npol)))
+                intensity_higher = np.zeros_like(intensity_0)
+
+            elif self.atmosphere is not None:
 
                 # incident radiation is a function of frequency and incidence angle
                 # assume azimuthally symmetric
@@ -313,8 +523,14 @@ class DORT(object):
             else:
                 intensity_0 = np.zeros((len(streams.outmu) * npol, 1))
                 intensity_higher = intensity_0
-                intensity_0.flags.writeable = False  # make immutable
-                intensity_higher.flags.writeable = False  # make immutable
+
+            if self.temperature_weighting_functions:
+                # add a column (without incident radiation) for each layer and the substrate temperature
+                intensity_0 = np.pad(intensity_0, ((0, 0), (0, len(self.substrate_temperature) - 1)))
+                intensity_higher = np.zeros_like(intensity_0)
+
+            intensity_0.flags.writeable = False  # make immutable
+            intensity_higher.flags.writeable = False  # make immutable
 
         else:
             raise SMRTError("Unknow sensor mode")
@@ -350,16 +566,32 @@ class DORT(object):
         # (bottom, top of the current layer, and top of layer below (for downward directons) and
         # bottom of the layer above (for upward directions)
 
+        # the boundary system is solved in single precision only in float32 mode
+        dtype = np.float32 if self.precision == "float32" else np.float64
+
         # Boundary condition matrix
-        bBC = np.zeros((2 * nband + 1, nboundary))  # we use banded Boundary condition matrix
+        bBC = np.zeros((2 * nband + 1, nboundary), dtype=dtype)  # we use banded Boundary condition matrix
 
         # rhs vector size
         assert(len(intensity_down_m.shape) == 2)
         nvector = intensity_down_m.shape[1]
-        b = np.zeros((nboundary, nvector))
+        b = np.zeros((nboundary, nvector), dtype=dtype)
 
         nlayer = len(eigenvalue_solver)
 
+        if self.prune_deep_snowpack is None:
+            # solve the eigenvalue problems of all the layers at once, grouping the layers with the same number of streams
+            eigen_solutions = solve_eigenvalue_problems(eigenvalue_solver, m, compute_coherent_only)
+        else:
+            eigen_solutions = None  # the deep layers may not be needed, solve layer by layer
+
+        def solve_layer(l):
+            if eigen_solutions is None:
+                return eigenvalue_solver[l].solve(m, compute_coherent_only)
+            if isinstance(eigen_solutions[l], SMRTError):
+                raise eigen_solutions[l]
+            return eigen_solutions[l]
+
         # used to estimate if the medium is deep enough
         optical_depth = 0
 
@@ -379,12 +611,13 @@ class DORT(object):
             if self.error_handling == 'nan':
                 try:
                     # run in a try to catch the exception
-                    beta, Eu, Ed = eigenvalue_solver[l].solve(m, compute_coherent_only)
+                    beta, Eu, Ed = solve_layer(l)
                 except SMRTError:
                     return np.full_like(intensity_down_m, np.nan).squeeze()
             else:
-                beta, Eu, Ed = eigenvalue_solver[l].solve(m, compute_coherent_only)
+                beta, Eu, Ed = solve_layer(l)
             assert(Eu.shape[0] == npol * nsl)
+            beta = beta.astype(np.float64)  # the exponentials are always computed in double precision
 
             # deduce the transmittance through the layers
             # positive beta, reference at the bottom
@@ -424,16 +657,17 @@ class DORT(object):
                     todiag(bBC, il_top[l + 1], j, -matmul(Tbottom_lp1, Ed, transb)[:ns_npol_common_bottom, :])
 
             # fill the vector
-            if m == 0 and self.temperature is not None and self.temperature[l] > 0:
+            if m == 0 and self.temperature is not None and np.any(self.temperature[l] > 0):
                 if isnull(Rtop_l):
                     b[il_topl:il_topl + nsl_npol, :] -= self.temperature[l]  # to be put at layer (l)
                 else:
-                    b[il_topl:il_topl + nsl_npol, :] -= ((1.0 - muleye(Rtop_l)) * self.temperature[l])[:, np.newaxis]  # a mettre en (l)
+                    b[il_topl:il_topl + nsl_npol, :] -= (1.0 - muleye(Rtop_l))[:, np.newaxis] * self.temperature[l]  # a mettre en (l)
                 # the muleye comes from the isotropic emission of the black body
 
-                if l < nlayer - 1 and self.temperature[l] > 0 and not isnull(Tbottom_lp1):
+                if l < nlayer - 1 and not isnull(Tbottom_lp1):
                     b[il_top[l + 1]:il_top[l + 1] + ns_npol_common_bottom, :] += \
-                        (muleye(Tbottom_lp1) * self.temperature[l])[:ns_npol_common_bottom, np.newaxis]     # to be put at layer (l + 1)
+                        interfaces.transmission_bottom_emission(l, m, compute_coherent_only)[:ns_npol_common_bottom, np.newaxis] * \
+                        self.temperature[l]     # to be put at layer (l + 1)
 
             if l == 0:  # Air-snow interface
                 Tbottom_air_down = interfaces.transmission_bottom(-1, m, compute_coherent_only)
@@ -457,23 +691,25 @@ class DORT(object):
                     todiag(bBC, il_bottom[l - 1], j, -matmul(Ttop_lm1, Eu, transt)[:ns_npol_common_top, :])   # to be put at layer (l - 1)
 
             # fill the vector
-            if m == 0 and self.temperature is not None and self.temperature[l] > 0:
+            if m == 0 and self.temperature is not None and np.any(self.temperature[l] > 0):
                 if isnull(Rbottom_l):
                     b[il_bottoml:il_bottoml + nsl_npol, :] -= self.temperature[l]   # to be put at layer (l)
                 else:
                     b[il_bottoml:il_bottoml + nsl_npol, :] -= \
-                        ((1.0 - muleye(Rbottom_l)) * self.temperature[l])[:, np.newaxis]  # to be put at layer (l)
+                        (1.0 - muleye(Rbottom_l))[:, np.newaxis] * self.temperature[l]  # to be put at layer (l)
                 if l > 0 and not isnull(Ttop_lm1):
                     b[il_bottom[l - 1]:il_bottom[l - 1] + ns_npol_common_top, :] += \
-                        (muleye(Ttop_lm1) * self.temperature[l])[:ns_npol_common_top, np.newaxis]  # to be put at layer (l - 1)
+                        interfaces.transmission_top_emission(l, m, compute_coherent_only)[:ns_npol_common_top, np.newaxis] * \
+                        self.temperature[l]  # to be put at layer (l - 1)
 
             if m == 0 and l == nlayer - 1 and self.snowpack.substrate is not None and \
-                    self.snowpack.substrate.temperature is not None and self.temperature is not None:
+                    self.substrate_temperature is not None and self.temperature is not None:
                 Tbottom_sub = interfaces.transmission_bottom(l, m, compute_coherent_only)
                 ns_npol_common_bottom = min(Tbottom_sub.shape[0], nsl_npol)  # see the comment on Tbottom_lp1
                 if not isnull(Tbottom_sub):
                     b[il_bottoml:il_bottoml + ns_npol_common_bottom, :] += \
-                        (muleye(Tbottom_sub) * self.snowpack.substrate.temperature)[:ns_npol_common_bottom, np.newaxis]   # to be put at layer  (l)
+                        interfaces.transmission_bottom_emission(l, m, compute_coherent_only)[:ns_npol_common_bottom, np.newaxis] * \
+                        self.substrate_temperature   # to be put at layer  (l)
 
             # Finalize
             optical_depth += np.min(np.abs(beta)) * self.snowpack.layers[l].thickness
@@ -505,9 +741,9 @@ class DORT(object):
         j = jl[l]  # should be 0
         nsl_npol = streams.n[l] * npol
         nsl2_npol = 2 * nsl_npol
-        I1up_m = Eu_0 @ transt_0 @ x[j:j + nsl2_npol, :]
+        I1up_m = Eu_0.astype(np.float64) @ transt_0 @ x[j:j + nsl2_npol, :].astype(np.float64)
 
-        if m == 0 and self.temperature is not None and self.temperature[0] > 0:
+        if m == 0 and self.temperature is not None and np.any(self.temperature[0] > 0):
             I1up_m += self.temperature[0]  # just under the interface
 
         Rbottom_air_down = interfaces.reflection_bottom(-1, m, compute_coherent_only)
@@ -518,6 +754,76 @@ class DORT(object):
         return np.array(I0up_m).squeeze()
 
 
+def apply_temperature_weighting_functions(result, temperature, substrate_temperature=0):
+    """compute the brightness temperature for one or several temperature profiles from the weighting functions computed by DORT
+    with the option `temperature_weighting_functions=True`. This is a matrix product, much faster than running DORT for each profile.
+
+    :param result: result returned by the DORT solver with the option `temperature_weighting_functions=True`.
+    :param temperature: temperature of the layers (array of size nlayer) or of several profiles (array of shape (nprofile, nlayer)).
+    :param substrate_temperature: temperature of the substrate, a scalar or an array of size nprofile.
+
+    :returns: :py:class:`Result` instance. It has an additional dimension 'profile' if several profiles are given.
+"""
+    if 'source' not in result.data.dims:
+        raise SMRTError("The result does not contain temperature weighting functions. "
+                        "Use the option temperature_weighting_functions=True of the DORT solver.")
+
+    temperature = np.asarray(temperature, dtype=np.float64)
+    single_profile = temperature.ndim == 1
+    nprofile = 1 if single_profile else temperature.shape[0]
+    temperature = temperature.reshape((nprofile, -1))
+
+    if temperature.shape[1] != len(result.data.coords['source']) - 2:
+        raise SMRTError("The number of temperatures is not equal to the number of layers")
+
+    substrate_temperature = np.broadcast_to(substrate_temperature, (nprofile,))
+    sources = np.column_stack((np.ones(nprofile), temperature, substrate_temperature))
+    sources = xr.DataArray(sources, coords=[('profile', np.arange(nprofile)), ('source', result.data.coords['source'].values)])
+
+    tb = xr.dot(result.data, sources, dims='source')
+    tb = tb.transpose(*[d for d in result.data.dims if d != 'source'], 'profile')
+    if single_profile:
+        tb = tb.isel(profile=0, drop=True)
+
+    return type(result)(tb, channel_map=result.channel_map)
+
+
+def apply_sky_radiance(result, atmosphere, frequency):
+    """compute the brightness temperature for one or several atmospheres from the sky response computed by DORT
+    with the option `sky_response=True`. This only requires matrix products, much faster than running DORT for each atmosphere.
+
+    :param result: result returned by the DORT solver with the option `sky_response=True`.
+    :param atmosphere: an atmosphere (e.g. :py:class:`SimpleIsotropicAtmosphere`) or a sequence of atmospheres.
+    :param frequency: frequency of the sensor.
+
+    :returns: :py:class:`Result` instance. It has an additional dimension 'atmosphere' if a sequence of atmospheres is given.
+"""
+    if 'source_mu' not in result.data.coords:
+        raise SMRTError("The result does not contain the sky response. Use the option sky_response=True of the DORT solver.")
+
+    if isinstance(atmosphere, (list, tuple)):
+        return concat_results([apply_sky_radiance(result, atmos, frequency) for atmos in atmosphere],
+                              ('atmosphere', np.arange(len(atmosphere))))
+
+    npol = 2
+    data = result.data.drop_vars(['source_mu', 'source_polarization'])
+
+    # upwelling intensity at the top of the snowpack
+    source_mu = result.data.coords['source_mu'].values[1::npol]
+    tbdown = xr.DataArray(atmosphere.tbdown(frequency, source_mu, npol), coords=[('source', data.coords['source'].values[1:])])
+    intensity_up = data.isel(source=0, drop=True) + xr.dot(data.isel(source=slice(1, None)), tbdown, dims='source')
+
+    # propagate through the atmosphere
+    mu = np.cos(np.deg2rad(data.coords['theta'].values))
+    coords = [data.coords['theta'], data.coords['polarization']]
+    tbup = xr.DataArray(np.reshape(atmosphere.tbup(frequency, mu, npol), (-1, npol)), coords=coords)
+    trans = xr.DataArray(np.reshape(atmosphere.trans(frequency, mu, npol), (-1, npol)), coords=coords)
+
+    tb = (tbup + trans * intensity_up).transpose(*intensity_up.dims)
+
+    return type(result)(tb, channel_map=result.channel_map)
+
+
 def muleye(x):
     #  """multiply x * 1v """
 
@@ -590,11 +896,16 @@ def extend_2pol_npol(x, npol):
 
 class EigenValueSolver(object):
 
-    def __init__(self, ke, ks, ft_even_phase_function, mu, weight, m_max, normalization):
+    def __init__(self, ke, ks, ft_even_phase_function, mu, weight, m_max, normalization,
+                 phase_function=None, truncation=False, dtype=np.float64, lazy_phase=False):
         # :param Ke: extinction coefficient of the layer for mode m
         # :param ft_even_phase: ft_even_phase function of the layer for mode m
         # :param mu: cosines
         # :param weight: weights
+        # :param phase_function: phase function of the layer (not decomposed), only required for the truncation
+        # :param truncation: False, True or the half-angle in degree of the truncated forward cone
+        # :param dtype: floating point type used to solve the eigenvalue problem
+        # :param lazy_phase: if True, the phase matrix is computed for each mode when needed instead of being stored for all modes
 
         self.ke = ke
         self.ks = ks
@@ -603,12 +914,94 @@ class EigenValueSolver(object):
         self.normalization = normalization
         self.norm_0 = None
         self.norm_m = None
+        self.truncated_fraction = 0
+        self.dtype = dtype
 
-        if ft_even_phase_function is not None:
-            mu = np.concatenate((self.mu, -self.mu))
-            self.ft_even_phase = ft_even_phase_function(mu, mu, m_max)
+        truncated_phase = None
+        if truncation and self.ks > 0:
+            if phase_function is None:
+                raise SMRTError("The truncation of the phase matrix requires an emmodel implementing the 'phase' method.")
+            truncated_phase = self.truncate_forward_peak(phase_function, truncation, m_max)
+
+        mu = np.concatenate((self.mu, -self.mu))
+
+        if truncated_phase is not None:
+            compute_ft_even_phase = lambda: generic_ft_even_matrix(truncated_phase, m_max, nsamples=64)
+            compute_phase_mode = lambda m: generic_ft_even_mode(truncated_phase, m, m_max, nsamples=64)
+        elif ft_even_phase_function is None:
+            compute_ft_even_phase = compute_phase_mode = lambda *args: smrt_matrix(0)
         else:
-            self.ft_even_phase = smrt_matrix(0)
+            compute_ft_even_phase = lambda: ft_even_phase_function(mu, mu, m_max)
+            if phase_function is not None:
+                # the mode is computed alone, with the same sampling in dphi as generic_ft_even_matrix
+                compute_phase_mode = lambda m: generic_ft_even_mode(lambda dphi: phase_function(mu, mu, dphi, 2 if m == 0 else 3),
+                                                                    m, m_max)
+            else:
+                # the emmodel can only compute the modes from 0, the lower modes are discarded
+                compute_phase_mode = lambda m: ft_even_phase_function(mu, mu, m)
+
+        if lazy_phase:
+            # the phase matrix of all the modes is not stored, each mode is computed when needed and released after use
+            self.compute_phase_mode = compute_phase_mode
+            self.ft_even_phase = None
+        else:
+            self.ft_even_phase = compute_ft_even_phase()
+
+    def truncate_forward_peak(self, phase_function, truncation, m_max):
+        # delta-M like truncation: the phase matrix is clipped in the forward cone mu > mu_c (Potter 1970) and the clipped energy
+        # (fraction f of ks) is considered as not scattered. The scattering and extinction coefficients are reduced accordingly.
+        # Return the truncated phase matrix as a function of dphi, or None if no truncation is needed.
+
+        # tabulate the unpolarized phase function as a function of the cosine of the scattering angle
+        x, w = scipy.special.p_roots(max(256, 8 * len(self.mu)))
+        p = unpolarized_phase(phase_function, x)
+        p_integral = np.sum(w * p)
+
+        def clipped_fraction(mu_c):
+            p_c = np.interp(mu_c, x, p)
+            incone = x > mu_c
+            return np.sum(w[incone] * np.maximum(p[incone] - p_c, 0)) / p_integral
+
+        if truncation is True:
+            # the fraction is given by the Legendre moment of order 2n as in the delta-M method (Wiscombe 1977)
+            f = np.sum(w * p * scipy.special.eval_legendre(2 * len(self.mu), x)) / p_integral
+            if f < 1e-6:
+                return None  # the phase function is smooth enough for the streams in this layer, no truncation
+            # search the cone with the same truncated fraction
+            if clipped_fraction(0) <= f:
+                mu_c = 0
+            else:
+                mu_c = scipy.optimize.brentq(lambda mu_c: clipped_fraction(mu_c) - f, 0, x[-1])
+        else:
+            mu_c = np.cos(np.deg2rad(truncation))
+
+        f = clipped_fraction(mu_c)
+        p_c = np.interp(mu_c, x, p)
+
+        ks, ke = self.ks, self.ke
+        self.ks = ks * (1 - f)
+        self.ke = lambda mu: ke(mu) - f * ks
+        self.truncated_fraction = f
+
+        mu = np.concatenate((self.mu, -self.mu))
+        sint = np.sqrt(1 - mu**2)
+        npol = 2 if m_max == 0 else 3
+
+        def truncated_phase(dphi):
+            p_m = phase_function(mu, mu, dphi, npol)
+
+            cosT = mu[np.newaxis, :, np.newaxis] * mu[np.newaxis, np.newaxis, :] + \
+                sint[np.newaxis, :, np.newaxis] * sint[np.newaxis, np.newaxis, :] * np.cos(dphi)[:, np.newaxis, np.newaxis]
+
+            # ratio between the clipped and the original phase function in the forward cone
+            ratio = np.ones_like(cosT)
+            incone = cosT > mu_c
+            ratio[incone] = np.minimum(p_c / np.interp(cosT[incone], x, p), 1)
+
+            p_m.values = p_m.values * ratio
+            return p_m
+
+        return truncated_phase
 
     def solve(self, m, compute_coherent_only):
         # solve the homogeneous equation for a single layer and return eigne value and eigen vector
@@ -617,6 +1010,11 @@ class EigenValueSolver(object):
         # :returns: beta, E, Q
         #
 
+        return self.eigen_solution(m, self.matrix(m, compute_coherent_only))
+
+    def matrix(self, m, compute_coherent_only):
+        # compute the matrix of the eigenvalue problem for the mode m, or None if the solution is trivial
+
         npol = 2 if m == 0 else 3
 
         n = npol * len(self.mu)
@@ -633,47 +1031,65 @@ class EigenValueSolver(object):
         mu = np.concatenate((self.mu, -self.mu))
 
         # calculate the A matrix. Eq (12),  or 0 if compute_coherent_only
-        A = self.ft_even_phase.compress(mode=m, auto_reduce_npol=True) if not compute_coherent_only else 0
+        A = self.phase_mode(m) if not compute_coherent_only else 0
 
         if isnull(A):
-            # the solution is trivial
-            beta = invmu * np.repeat(self.ke(mu), npol)
-            E = np.eye(2 * n, 2 * n)
-        else:
-            # solve the eigen value problem
-            coef_weight = np.tile(np.repeat(-coef * self.weight, npol), 2)    # could be cached (per layer) because same for each mode
+            return None
+
+        coef_weight = np.tile(np.repeat(-coef * self.weight, npol), 2)    # could be cached (per layer) because same for each mode
+
+        A *= coef_weight[np.newaxis, :]
+
+        # normalize
+        if self.normalization and self.ks > 0:
+            A = self.normalize(m, A)
+        # normalization is done
+
+        A[np.diag_indices(2 * n)] += np.repeat(self.ke(mu), npol)
+        A = invmu[:, np.newaxis] * A
+
+        return A
 
-            A *= coef_weight[np.newaxis, :]
+    def phase_mode(self, m):
+        # return the phase matrix of the mode m in the compressed format
 
-            # normalize
-            if self.normalization and self.ks > 0:
-                A = self.normalize(m, A)
-            # normalization is done
+        ft_even_phase = self.ft_even_phase if self.ft_even_phase is not None else self.compute_phase_mode(m)
+        return ft_even_phase.compress(mode=m, auto_reduce_npol=True)
 
-            A[np.diag_indices(2 * n)] += np.repeat(self.ke(mu), npol)
-            A = invmu[:, np.newaxis] * A
+    def eigen_solution(self, m, A, eigen=None):
+        # diagonalize the matrix A returned by `matrix` and return the eigenvalues and the upwelling and downwelling eigenvectors
+        # :param eigen: (beta, E) if A has already been diagonalized (see `solve_eigenvalue_problems`). It is checked as if
+        # computed here.
 
+        npol = 2 if m == 0 else 3
+
+        n = npol * len(self.mu)
+
+        if A is None:
+            # the solution is trivial
+            mu = np.concatenate((self.mu, -self.mu))
+            invmu = np.concatenate((np.repeat(1.0 / self.mu, npol), -np.repeat(1.0 / self.mu, npol)))
+            beta = invmu * np.repeat(self.ke(mu), npol)
+            E = np.eye(2 * n, 2 * n, dtype=self.dtype)
+        else:
             # diagonalise the matrix. Eq (13)
-            try:
-                beta, E = scipy.linalg.eig(A, overwrite_a=True)
-            except scipy.linalg.LinAlgError:
-                diagonalization_failed = True
-                reason = "eig method"
+            if eigen is not None:
+                beta, E = eigen
+                diagonalization_failed, reason = check_eigen_solution(beta, E)
+            elif self.dtype != np.float64:
+                beta, E, diagonalization_failed, reason = diagonalize(A.astype(np.complex64 if np.iscomplexobj(A) else self.dtype))
             else:
-                notclose_beta = not np.allclose(beta.imag, 0, atol=1e-06)
-                notclose_E = not np.allclose(E.imag, 0, atol=1e-06)
-                diagonalization_failed = notclose_beta or notclose_E
+                beta, E, diagonalization_failed, reason = diagonalize(A)
 
-                reason = ""
-                if notclose_beta:
-                    reason += "not close beta "
-                if notclose_E:
-                    reason += "not close E "
+            if diagonalization_failed and (eigen is not None or self.dtype != np.float64):
+                # nearly degenerated eigenvalues may not be resolved in a stack or in single precision, solve again in double precision
+                beta, E, diagonalization_failed, reason = diagonalize(A)
 
             if diagonalization_failed:
                 print("Reason: ", reason, " ks:", self.ks)
-                mask = np.abs(E.imag) > 1e-8
-                print("Info:", m, E[mask], beta[np.any(mask, axis=0)])
+                if E is not None:
+                    mask = np.abs(E.imag) > 1e-8
+                    print("Info:", m, E[mask], beta[np.any(mask, axis=0)])
                 raise SMRTError("""The diagonalization failed in DORT which is possibly caused by single scattering albedo larger than 1.
 It is often due to grain size too large (or too low stickiness parameter) to respect the Rayleigh/low-frequency assumption required by
 some emmodel (DMRT ShortRange, IBA, ...). It is recommended to reduce the size of the bigger grains. It is possible to disable this error
@@ -727,18 +1143,98 @@ to disable this error raise and return NaN instead by adding the argument rtsolv
                 if self.norm_0 is None:  # be careful, this code is not re-entrant
                     raise Exception("For the normalization, it is necessary to call this function for the mode m=0 first.")
                 # transform the norm_0 for npol
-                self.norm_m = np.empty(len(self.norm_0) // 2 * npol)
-                self.norm_m[0::npol] = self.norm_0[0::2]
-                self.norm_m[1::npol] = self.norm_0[1::2]
+                # (the attribute is set once complete, because the modes m > 0 can be solved concurrently)
+                norm_m = np.empty(len(self.norm_0) // 2 * npol)
+                norm_m[0::npol] = self.norm_0[0::2]
+                norm_m[1::npol] = self.norm_0[1::2]
                 for ipol in range(2, npol):
                     # this approach is empirical
-                    self.norm_m[ipol::npol] = np.sqrt(self.norm_0[0::2] * self.norm_0[1::2])
+                    norm_m[ipol::npol] = np.sqrt(self.norm_0[0::2] * self.norm_0[1::2])
+                self.norm_m = norm_m
             norm = self.norm_m
 
         A *= norm[:, np.newaxis]
         return A
 
 
+def diagonalize(A):
+    # diagonalize A (which is overwritten) and check that the eigenvalues and eigenvectors are real
+    # :returns: beta, E, diagonalization_failed, reason
+
+    try:
+        beta, E = scipy.linalg.eig(A, overwrite_a=True)
+    except scipy.linalg.LinAlgError:
+        return None, None, True, "eig method"
+
+    return (beta, E) + check_eigen_solution(beta, E)
+
+
+def check_eigen_solution(beta, E):
+    # check that the eigenvalues and eigenvectors are real
+    # :returns: diagonalization_failed, reason
+
+    notclose_beta = not np.allclose(beta.imag, 0, atol=1e-06)
+    notclose_E = not np.allclose(E.imag, 0, atol=1e-06)
+
+    reason = ""
+    if notclose_beta:
+        reason += "not close beta "
+    if notclose_E:
+        reason += "not close E "
+
+    return notclose_beta or notclose_E, reason
+
+
+def solve_eigenvalue_problems(eigenvalue_solvers, m, compute_coherent_only):
+    # solve the eigenvalue problems of all the layers for the mode m. The matrices of the layers with the same number of streams
+    # are diagonalized with a single stacked call.
+    # :returns: a list with for each layer (beta, Eu, Ed) or the SMRTError raised for this layer
+
+    matrices = []
+    for solver in eigenvalue_solvers:
+        try:
+            matrices.append(solver.matrix(m, compute_coherent_only))
+        except SMRTError as e:
+            matrices.append(e)
+
+    # group the layers by matrix size and type
+    groups = dict()
+    for l, (solver, A) in enumerate(zip(eigenvalue_solvers, matrices)):
+        if isinstance(A, np.ndarray):
+            dtype = solver.dtype if not np.iscomplexobj(A) else np.result_type(solver.dtype, np.complex64)
+            groups.setdefault((A.shape, dtype), []).append(l)
+
+    eigens = [None] * len(eigenvalue_solvers)
+    for (shape, dtype), layers in groups.items():
+        if len(layers) < 2:
+            continue  # diagonalize as usual
+        try:
+            beta, E = np.linalg.eig(np.stack([matrices[l] for l in layers]).astype(dtype, copy=False))
+        except np.linalg.LinAlgError:
+            continue  # one of the matrices can not be diagonalized, diagonalize each matrix separately
+        for i, l in enumerate(layers):
+            eigens[l] = beta[i], E[i]
+
+    solutions = []
+    for solver, A, eigen in zip(eigenvalue_solvers, matrices, eigens):
+        if isinstance(A, SMRTError):
+            solutions.append(A)
+            continue
+        try:
+            solutions.append(solver.eigen_solution(m, A, eigen=eigen))
+        except SMRTError as e:
+            solutions.append(e)
+
+    return solutions
+
+
+def unpolarized_phase(phase_function, cosT):
+    # return the phase function for unpolarized incident radiation, as a function of the cosine of the scattering angle.
+    # The incident direction is set to the vertical so that the scattering angle is the zenith angle.
+    p = phase_function(cosT, np.array([1.]), np.array([0.]), 2)
+    return 0.5 * np.sum(p.values[:, :, 0, :, 0], axis=(0, 1)).real
+
+
 class InterfaceProperties(object):
 
     def __init__(self, frequency, interfaces, substrate, permittivity, streams, m_max, npol):
@@ -756,6 +1252,9 @@ class InterfaceProperties(object):
         self.Tbottom_coh = dict()
         self.Tbottom_diff = dict()
         self.full_weight = dict()
+        # interpolation between the streams of adjacent layers (only in the "interpolated" stream mode)
+        self.Ttop_interpolation = dict()
+        self.Tbottom_interpolation = dict()
 
         for l in range(nlayer):
             eps_lm1 = permittivity[l - 1] if l > 0 else 1
@@ -785,8 +1284,12 @@ class InterfaceProperties(object):
 
             # compute transmission coefficient between l and l - 1 UP
             # snow-snow or air UP
+            if streams.interpolated and l > 0:
+                mu_l, self.Ttop_interpolation[l] = stream_interpolation(streams.mu[l], eps_l, eps_lm1)
+            else:
+                mu_l = streams.mu[l]
             self.Ttop_coh[l] = interfaces[l].coherent_transmission_matrix(frequency, eps_l, eps_lm1,
-                                                                          streams.mu[l],
+                                                                          mu_l,
                                                                           npol)
             mu_t = streams.mu[l - 1] if l > 1 else streams.outmu
             self.Ttop_diff[l] = interfaces[l].ft_even_diffuse_transmission_matrix(frequency, eps_l, eps_lm1,
@@ -800,8 +1303,12 @@ class InterfaceProperties(object):
         # compute transmission coefficient between l and l + 1  DOWN
             if l < nlayer - 1:
                 # snow-snow DOWN
+                if streams.interpolated:
+                    mu_l, self.Tbottom_interpolation[l] = stream_interpolation(streams.mu[l], eps_l, eps_lp1)
+                else:
+                    mu_l = streams.mu[l]
                 self.Tbottom_coh[l] = interfaces[l + 1].coherent_transmission_matrix(frequency, eps_l, eps_lp1,
-                                                                                     streams.mu[l], npol)
+                                                                                     mu_l, npol)
 
                 self.Tbottom_diff[l] = interfaces[l + 1].ft_even_diffuse_transmission_matrix(frequency, eps_l, eps_lp1,
                                                                                              streams.mu[l + 1],
@@ -872,17 +1379,58 @@ class InterfaceProperties(object):
 
     def transmission_top(self, l, m, compute_coherent_only):
         return InterfaceProperties.combine_coherent_diffuse_matrix(self.Ttop_coh[l], self.Ttop_diff[l],
-                                                                   m, compute_coherent_only)
+                                                                   m, compute_coherent_only,
+                                                                   interpolation=self.Ttop_interpolation.get(l))
 
     def transmission_bottom(self, l, m, compute_coherent_only):
         return InterfaceProperties.combine_coherent_diffuse_matrix(self.Tbottom_coh[l], self.Tbottom_diff[l],
-                                                                   m, compute_coherent_only)
+                                                                   m, compute_coherent_only,
+                                                                   interpolation=self.Tbottom_interpolation.get(l))
+
+    def transmission_top_emission(self, l, m, compute_coherent_only):
+        # muleye of the transmission_top matrix, accounting for the interpolation of the coherent transmission
+        return InterfaceProperties.combine_coherent_diffuse_muleye(self.Ttop_coh[l], self.Ttop_diff[l],
+                                                                   m, compute_coherent_only,
+                                                                   interpolation=self.Ttop_interpolation.get(l))
+
+    def transmission_bottom_emission(self, l, m, compute_coherent_only):
+        # muleye of the transmission_bottom matrix, accounting for the interpolation of the coherent transmission
+        return InterfaceProperties.combine_coherent_diffuse_muleye(self.Tbottom_coh[l], self.Tbottom_diff[l],
+                                                                   m, compute_coherent_only,
+                                                                   interpolation=self.Tbottom_interpolation.get(l))
+
+    @staticmethod
+    def interpolated_coherent_matrix(mat_coh, interpolation):
+        # the coherent matrix is computed for the directions refracted into the streams, return the (dense) operator interpolating
+        # from the streams. Rows are the streams of the destination layer and columns the streams of the source layer.
+        t = mat_coh.diagonal()
+        npol = len(t) // len(interpolation)
+        return t[:, np.newaxis] * np.kron(interpolation, np.eye(npol))
+
+    @staticmethod
+    def combine_coherent_diffuse_muleye(coh, diff, m, compute_coherent_only, interpolation=None):
+        # the interpolation operator is not a scattering matrix, muleye can not be applied to it (see muleye). It is applied to
+        # an isotropic intensity by summing over the source streams instead.
+
+        if interpolation is None:
+            return muleye(InterfaceProperties.combine_coherent_diffuse_matrix(coh, diff, m, compute_coherent_only))
+
+        mat_coh = coh.compress(mode=m, auto_reduce_npol=True)
+        mat_diff = InterfaceProperties.combine_coherent_diffuse_matrix(smrt_matrix(0), diff, m, compute_coherent_only)
+
+        emission = 0 if isnull(mat_diff) else muleye(mat_diff)
+        if not isnull(mat_coh):
+            emission = emission + np.sum(InterfaceProperties.interpolated_coherent_matrix(mat_coh, interpolation), axis=1)
+        return emission
 
     @staticmethod
-    def combine_coherent_diffuse_matrix(coh, diff, m, compute_coherent_only):
+    def combine_coherent_diffuse_matrix(coh, diff, m, compute_coherent_only, interpolation=None):
 
         mat_coh = coh.compress(mode=m, auto_reduce_npol=True)
 
+        if interpolation is not None and not isnull(mat_coh):
+            mat_coh = InterfaceProperties.interpolated_coherent_matrix(mat_coh, interpolation)
+
         if (not compute_coherent_only) and (diff is not 0) and (not diff.isnull()):
             # the coef comes from the integration of \int dphi' cos(m (phi-phi')) cos(n phi')
             # m=n=0 --> 2*np.pi
@@ -904,7 +1452,7 @@ def normalize_diffuse_matrix(mat, mu_st, mu_i, weights):
     if mat.isnull():
         return mat
 
-    if mat.mtype == "dense5":
+    if mat.mtype in ["dense5", "blockdiagonal5"]:
         mat *= mu_i * weights        # the last dimension
         mat /= mu_st[:, np.newaxis]  # before the last dimension
     elif mat.mtype == "diagonal5":
@@ -916,21 +1464,28 @@ def normalize_diffuse_matrix(mat, mu_st, mu_i, weights):
 
 
 class Streams(object):
-    __slot__ = 'n', 'mu', 'weight', 'outmu', 'outweight', 'n_substrate', 'n_air'
+    __slot__ = 'n', 'mu', 'weight', 'outmu', 'outweight', 'n_substrate', 'n_air', 'interpolated'
 
 
-def compute_stream(n_max_stream, permittivity, permittivity_substrate, mode="most_refringent"):
+def compute_stream(n_max_stream, permittivity, permittivity_substrate, mode="most_refringent", extra_outmu=None):
     #     """Compute the optimal angles of each layer. Use for this a Gauss-Legendre quadrature for the most refringent layer and
     # use Snell-law to prograpate the direction in the other layers takig care of the total reflection.
 
-    #     :param n_max_stream: number of stream
+    #     :param n_max_stream: number of stream in the most refringent layer (mode="most_refringent") or in the air (mode="air")
     #     :param permittivity: permittivity of each layer
     #     :type permittivity: ndarray
+    #     :param mode: "most_refringent", "air" or "interpolated". See the `stream_mode` argument of DORT.
+    #     :param extra_outmu: cosines of angles in the air to add to the streams (e.g. the sensor viewing angles)
     #     :returns: mu, weight, outmu
     # """
 
     streams = Streams()
 
+    if mode == "interpolated":
+        return compute_interpolated_stream(n_max_stream, permittivity, permittivity_substrate, extra_outmu=extra_outmu)
+
+    streams.interpolated = False
+
     #  ### search and proceed with the most refringent layer
     k_most_refringent = np.argmax(permittivity)
     real_index_air = np.real(np.sqrt(permittivity[k_most_refringent] / 1.0))
@@ -940,20 +1495,40 @@ def compute_stream(n_max_stream, permittivity, permittivity_substrate, mode="mos
         mu_most_refringent, weight_most_refringent = gaussquad(n_max_stream)
 
     elif mode == "air":
-
-        raise Warning("This code has not been tested yet. Use with caution.")
-
+        # search the number of streams in the most refringent layer so that n_max_stream streams reach the air.
         def number_stream_in_air(n_stream_densest_layer):
-            mu_most_refringent, weight_most_refringent = gaussquad(int(n_stream_densest_layer))
+            mu_most_refringent, weight_most_refringent = gaussquad(n_stream_densest_layer)
             relsin = real_index_air * np.sqrt(1 - mu_most_refringent ** 2)
-            return np.sum(relsin < 1) - n_max_stream
+            return np.sum(relsin < 1)
+
+        # bracket the solution, n_low gives too few streams in the air, n_high gives enough
+        n_low, n_high = n_max_stream - 1, n_max_stream
+        while number_stream_in_air(n_high) < n_max_stream:
+            n_low, n_high = n_high, 2 * n_high
+            if n_high > 8192:
+                raise SMRTError("Unable to find a number of streams giving %i streams in the air" % n_max_stream)
+
+        # bisection to get the smallest number of streams
+        while n_high - n_low > 1:
+            n_mid = (n_low + n_high) // 2
+            if number_stream_in_air(n_mid) >= n_max_stream:
+                n_high = n_mid
+            else:
+                n_low = n_mid
 
-        streams.n = scipy.optimize.brentq(n_max_stream, 2 * n_max_stream)
-        mu_most_refringent, weight_most_refringent = gaussquad(streams.n)
+        mu_most_refringent, weight_most_refringent = gaussquad(n_high)
 
     else:
         raise RuntimeError("Unknow mode to compute the number of stream")
 
+    if extra_outmu is not None:
+        # refract the extra angles in the most refringent layer and insert them in the quadrature nodes
+        extra_mu = np.sqrt(1 - (1 - np.asarray(extra_outmu)**2) / real_index_air**2)
+        extra_mu = extra_mu[extra_outmu < 1 - 1e-6]  # the nadir is not added
+        # avoid duplicate with the existing nodes
+        extra_mu = extra_mu[np.all(np.abs(extra_mu[:, np.newaxis] - mu_most_refringent[np.newaxis, :]) > 1e-8, axis=1)]
+        mu_most_refringent = np.unique(np.concatenate((mu_most_refringent, extra_mu)))[::-1]  # decreasing order as the quadrature
+
     nlayer = len(permittivity)
 
     #  calculate the nodes and weights of all the other layers
@@ -967,7 +1542,7 @@ def compute_stream(n_max_stream, permittivity, permittivity_substrate, mode="mos
 
     real_reflection = relsin < 1  # mask where real reflection occurs
 
-    mu = np.zeros((nlayer, n_max_stream), dtype=np.float64)
+    mu = np.zeros((nlayer, len(mu_most_refringent)), dtype=np.float64)
     mu[real_reflection] = np.sqrt(1 - relsin[real_reflection]**2)
 
     # calculate the number of streams per layer
@@ -1018,6 +1593,87 @@ def compute_stream(n_max_stream, permittivity, permittivity_substrate, mode="mos
     return streams
 
 
+def compute_interpolated_stream(n_max_stream, permittivity, permittivity_substrate, extra_outmu=None):
+    #     """Compute the angles of each layer for the "interpolated" mode. All the layers use the same Gauss-Legendre quadrature and
+    # the angles in the air are obtained by Snell-law from the first layer. The streams of the other layers are connected by interpolation
+    # (see InterfaceProperties).
+    #
+    #     :param n_max_stream: number of stream in each layer
+    #     :param permittivity: permittivity of each layer
+    #     :param extra_outmu: cosines of angles in the air to add to the streams (e.g. the sensor viewing angles)
+    # """
+
+    streams = Streams()
+    streams.interpolated = True
+
+    mu, _ = gaussquad(n_max_stream)
+
+    real_index_air = np.real(np.sqrt(permittivity[0] / 1.0))
+
+    if extra_outmu is not None:
+        # refract the extra angles in the first layer and insert them in the quadrature nodes
+        extra_mu = np.sqrt(1 - (1 - np.asarray(extra_outmu)**2) / real_index_air**2)
+        extra_mu = extra_mu[extra_outmu < 1 - 1e-6]  # the nadir is not added
+        # avoid duplicate with the existing nodes
+        extra_mu = extra_mu[np.all(np.abs(extra_mu[:, np.newaxis] - mu[np.newaxis, :]) > 1e-8, axis=1)]
+        mu = np.unique(np.concatenate((mu, extra_mu)))[::-1]  # decreasing order as the quadrature
+
+    nlayer = len(permittivity)
+
+    weight = np.empty_like(mu)
+    weight[0] = 1 - 0.5 * (mu[0] + mu[1])
+    weight[-1] = np.abs(0.5 * (mu[-2] + mu[-1]))
+    weight[1:-1] = np.abs(0.5 * (mu[0:-2] - mu[2:]))
+
+    streams.mu = [mu] * nlayer
+    streams.weight = [weight] * nlayer
+    streams.n = np.full(nlayer, len(mu))
+
+    # calculate the angles (=node) in the air
+    relsin = real_index_air * np.sqrt(1 - mu**2)
+    streams.outmu = np.sqrt(1 - relsin[relsin < 1]**2)
+    streams.n_air = len(streams.outmu)
+
+    assert streams.n_air > 2
+
+    streams.outweight = np.empty_like(streams.outmu)
+    streams.outweight[0] = 1 - 0.5 * (streams.outmu[0] + streams.outmu[1])
+    streams.outweight[-1] = 0.5 * (streams.outmu[-2] + streams.outmu[-1])
+    streams.outweight[1:-1] = 0.5 * (streams.outmu[0:-2] - streams.outmu[2:])
+
+    # compute the number of stream in the substrate
+    if permittivity_substrate is None:
+        streams.n_substrate = streams.n[-1]  # same as last layer
+    else:
+        real_index = np.real(np.sqrt(permittivity_substrate / permittivity[-1]))
+        streams.n_substrate = np.sum(real_index * np.sqrt(1 - mu**2) < 1)   # count where real reflection occurs
+
+    return streams
+
+
+def stream_interpolation(mu, eps_1, eps_2):
+    #     """Compute the operator interpolating the intensity transmitted from the medium 1 to the medium 2 when both use the
+    # same streams mu (see the "interpolated" stream mode).
+    #
+    #     :returns: the cosines in the medium 1 of the directions refracted into the streams of the medium 2 (or 1 when no direction
+    # is refracted into a stream), and the linear interpolation matrix from the streams of medium 1 to these directions.
+    # """
+    relsin2 = (eps_2.real / eps_1.real) * (1 - mu**2)
+    refracted = relsin2 < 1   # streams of the medium 2 receiving a refracted direction
+
+    mu_1 = np.ones_like(mu)
+    mu_1[refracted] = np.sqrt(1 - relsin2[refracted])
+
+    # linear interpolation, constant beyond the first and last streams
+    order = np.argsort(mu)
+    interpolation = np.zeros((len(mu), len(mu)))
+    for j, unit in enumerate(np.eye(len(mu))[order].T):
+        interpolation[:, j] = np.interp(mu_1, mu[order], unit)
+    interpolation[~refracted, :] = 0
+
+    return mu_1, interpolation
+
+
 def gaussquad(n):
     #     """return the gauss-legendre roots and weight, only the positive roots are return.
 
@@ -4,13 +4,17 @@ import warnings
 
 import pytest
 
-from smrt import make_snowpack
+from smrt import make_snowpack, make_interface, make_emmodel
 from smrt.core.sensor import passive, active
 from smrt.core.model import Model
+from smrt.core.error import SMRTError
 
 from smrt.interface.transparent import Transparent
 from smrt.emmodel.nonscattering import NonScattering
-from smrt.rtsolver.dort import DORT
+from smrt.emmodel.rayleigh import Rayleigh
+from smrt.emmodel.iba import IBA
+from smrt.core.lib import generic_ft_even_matrix, smrt_matrix
+from smrt.rtsolver.dort import DORT, unpolarized_phase, compute_stream, InterfaceProperties, stream_interpolation, muleye, matmul
 
 
 def setup_snowpack():
@@ -90,3 +94,462 @@ def test_shallow_snowpack():
         sensor = active(13e9, 45)
         m = Model(NonScattering, DORT)
         m.run(sensor, sp).sigmaVV()
+
+
+class ForwardPeakedRayleigh(Rayleigh):
+    # Rayleigh phase matrix modulated by a Henyey-Greenstein function to produce a strong forward peak
+    g = 0.95
+
+    def __init__(self, sensor, layer):
+        self.npol = 2 if sensor.mode == 'P' else 3
+        self.ks, self.ka = 1., 0.1
+        self._effective_permittivity = 1.5
+        # compute ks consistently with the phase function
+        x, w = np.polynomial.legendre.leggauss(1024)
+        self.ks = 0.5 * np.sum(w * unpolarized_phase(self.phase, x))
+
+    def phase(self, mu_s, mu_i, dphi, npol=2):
+        mu_s1 = np.atleast_1d(mu_s)[np.newaxis, :, np.newaxis]
+        mu_i1 = np.atleast_1d(mu_i)[np.newaxis, np.newaxis, :]
+        cosT = mu_s1 * mu_i1 + np.sqrt(1 - mu_s1**2) * np.sqrt(1 - mu_i1**2) * np.cos(np.atleast_1d(dphi))[:, np.newaxis, np.newaxis]
+        hg = (1 - self.g**2) / (1 + self.g**2 - 2 * self.g * cosT)**1.5
+        return Rayleigh.phase(self, mu_s, mu_i, dphi, npol) * hg
+
+    def ft_even_phase(self, mu_s, mu_i, m_max, npol=None):
+        return generic_ft_even_matrix(lambda dphi: self.phase(mu_s, mu_i, dphi, npol or self.npol), m_max, nsamples=256)
+
+
+def run_forward_peaked(sensor, n_max_stream, phase_truncation):
+    sp = make_snowpack([100], "homogeneous", density=300, temperature=250)
+    m = Model(ForwardPeakedRayleigh, DORT, rtsolver_options=dict(n_max_stream=n_max_stream, m_max=8,
+                                                                 phase_normalization="forced", phase_truncation=phase_truncation))
+    return m.run(sensor, sp)
+
+
+def test_phase_truncation_active():
+
+    sensor = active(13e9, [20, 40])
+
+    ref = run_forward_peaked(sensor, 64, False).sigmaVV_dB()
+
+    error = np.abs(run_forward_peaked(sensor, 8, False).sigmaVV_dB() - ref)
+    error_truncated = np.abs(run_forward_peaked(sensor, 8, True).sigmaVV_dB() - ref)
+
+    assert np.all(error > 1)
+    assert np.all(error_truncated < 0.2)
+
+
+def test_phase_truncation_passive():
+
+    sensor = passive(37e9, [20, 40, 55])
+
+    ref = run_forward_peaked(sensor, 64, False).TbV()
+
+    error = np.abs(run_forward_peaked(sensor, 12, False).TbV() - ref)
+    error_truncated = np.abs(run_forward_peaked(sensor, 12, True).TbV() - ref)
+
+    assert np.max(error_truncated) < np.max(error)
+    assert np.all(error_truncated < 1.5)
+
+
+def test_phase_truncation_smooth_phase():
+    # the truncation must have no effect for smooth phase functions (Rayleigh)
+    sp = make_snowpack([100], "independent_sphere", density=300, temperature=250, radius=0.1e-3)
+    sensor = passive(37e9, [20, 40, 55])
+
+    res = Model(Rayleigh, DORT, rtsolver_options=dict(n_max_stream=16)).run(sensor, sp)
+    res_truncated = Model(Rayleigh, DORT, rtsolver_options=dict(n_max_stream=16, phase_truncation=True)).run(sensor, sp)
+
+    np.testing.assert_allclose(res_truncated.TbV(), res.TbV())
+
+
+def test_air_stream_mode():
+
+    permittivity = np.array([1.5 + 0.001j, 2.2 + 0.001j, 1.8 + 0.001j])
+
+    for n_air in [8, 16, 32]:
+        streams = compute_stream(n_air, permittivity, None, mode="air")
+        assert streams.n_air >= n_air
+        assert streams.n_air <= n_air + 1
+        # all the streams are in the most refringent layer, more than in the air
+        assert streams.n[1] > streams.n_air
+
+        # the requested number of streams is the minimum to get n_air streams in the air
+        streams_less = compute_stream(streams.n[1] - 1, permittivity, None)
+        assert streams_less.n_air < n_air
+
+
+def test_air_stream_mode_run():
+
+    sp = setup_2layer_snowpack()
+    sensor = passive(37e9, theta=[30, 40])
+
+    res = Model(NonScattering, DORT, rtsolver_options=dict(n_max_stream=16, stream_mode="air")).run(sensor, sp)
+    np.testing.assert_allclose(res.TbV(), sp.layers[0].temperature)
+
+
+def test_compute_stream_extra_outmu():
+
+    permittivity = np.array([1.5 + 0.001j, 2.2 + 0.001j])
+    extra_outmu = np.cos(np.radians([0, 37, 55]))
+
+    streams = compute_stream(8, permittivity, None)
+    streams_extra = compute_stream(8, permittivity, None, extra_outmu=extra_outmu)
+
+    # the nadir is not added
+    assert streams_extra.n_air == streams.n_air + 2
+    for mu in extra_outmu[1:]:
+        assert np.any(np.isclose(streams_extra.outmu, mu))
+    # the weights are adjusted
+    np.testing.assert_allclose(np.sum(streams_extra.outweight), np.sum(streams.outweight), rtol=1e-2)
+
+
+def test_add_sensor_streams_active():
+
+    sp = make_snowpack([0.3, 0.5, 10], "exponential", density=[250, 350, 300], temperature=[250, 255, 260],
+                       corr_length=[0.1e-3, 0.2e-3, 0.15e-3])
+    sensor = active(13e9, [35, 55])
+
+    def run(n_max_stream, add_sensor_streams):
+        m = Model("iba", DORT, rtsolver_options=dict(n_max_stream=n_max_stream, add_sensor_streams=add_sensor_streams))
+        return m.run(sensor, sp).sigmaHH_dB()
+
+    ref = run(64, False)
+
+    error = np.abs(run(8, False) - ref)
+    error_added = np.abs(run(8, True) - ref)
+
+    assert np.max(error_added) < 0.5
+    assert np.max(error_added) < np.max(error)
+
+
+def test_auto_stream():
+
+    sp = make_snowpack([0.3, 0.5, 10], "exponential", density=[250, 350, 300], temperature=[250, 255, 260],
+                       corr_length=[0.1e-3, 0.2e-3, 0.15e-3])
+    sensor = passive(19e9, [30, 50])
+
+    DORT._auto_n_max_stream.clear()
+
+    m = Model("iba", DORT, rtsolver_options=dict(n_max_stream="auto", auto_stream_tolerance=0.05))
+    res = m.run(sensor, sp)
+
+    assert len(DORT._auto_n_max_stream) == 0  # no memory by default
+
+    ref = Model("iba", DORT, rtsolver_options=dict(n_max_stream=128)).run(sensor, sp)
+    np.testing.assert_allclose(res.TbV(), ref.TbV(), atol=0.2)
+
+    m = Model("iba", DORT, rtsolver_options=dict(n_max_stream="auto", auto_stream_tolerance=0.05, auto_stream_memory=True))
+    m.run(sensor, sp)
+
+    assert len(DORT._auto_n_max_stream) == 1
+    n_auto = list(DORT._auto_n_max_stream.values())[0]
+    assert n_auto > 8
+
+    # the second run starts from the selected number of streams
+    m.run(sensor, sp)
+    assert list(DORT._auto_n_max_stream.values()) == [n_auto]
+
+    DORT._auto_n_max_stream.clear()
+
+
+def test_auto_stream_memory_depends_on_tolerance():
+
+    sp = make_snowpack([0.3, 0.5, 10], "exponential", density=[250, 350, 300], temperature=[250, 255, 260],
+                       corr_length=[0.1e-3, 0.2e-3, 0.15e-3])
+    sensor = passive(19e9, [30, 50])
+
+    emmodels = [make_emmodel("iba", sensor, layer) for layer in sp.layers]
+
+    def selected_n(tolerance):
+        solver = DORT(n_max_stream="auto", auto_stream_tolerance=tolerance, auto_stream_memory=True)
+        solver.solve(sp, emmodels, sensor)
+        return solver.selected_n_max_stream
+
+    DORT._auto_n_max_stream.clear()
+    n_strict = selected_n(0.01)
+
+    DORT._auto_n_max_stream.clear()
+    n_loose = selected_n(1)
+    assert n_loose < n_strict
+
+    # the tolerances do not share the remembered number of streams
+    assert selected_n(0.01) == n_strict
+    assert selected_n(1) == n_loose
+    assert len(DORT._auto_n_max_stream) == 2
+
+    DORT._auto_n_max_stream.clear()
+
+
+@pytest.mark.parametrize("precision", ["mixed", "float32"])
+def test_single_precision(precision):
+
+    sp = make_snowpack([0.3, 0.5, 10], "exponential", density=[250, 350, 300], temperature=[250, 255, 260],
+                       corr_length=[0.1e-3, 0.2e-3, 0.15e-3])
+
+    def run(sensor, precision):
+        return Model("iba", DORT, rtsolver_options=dict(n_max_stream=32, precision=precision)).run(sensor, sp)
+
+    sensor = passive(37e9, [30, 50])
+    np.testing.assert_allclose(run(sensor, precision).TbV(), run(sensor, "float64").TbV(), atol=0.01)
+
+    sensor = active(13e9, [30, 50])
+    np.testing.assert_allclose(run(sensor, precision).sigmaVV_dB(), run(sensor, "float64").sigmaVV_dB(), atol=0.01)
+
+
+def test_temperature_weighting_functions():
+
+    from smrt import make_soil
+    from smrt.atmosphere.simple_isotropic_atmosphere import make_atmosphere
+    from smrt.rtsolver.dort import apply_temperature_weighting_functions
+
+    atmosphere = make_atmosphere(tbdown=20, tbup=10, trans=0.9)
+
+    def snowpack(temperature, substrate_temperature):
+        # constant permittivities so that the emmodels do not depend on the temperature
+        substrate = make_soil("flat", complex(6, 0.5), temperature=substrate_temperature)
+        return make_snowpack([0.3, 0.5, 0.4], "exponential", density=[250, 350, 300], temperature=temperature,
+                             corr_length=[0.1e-3, 0.2e-3, 0.15e-3], ice_permittivity_model=complex(3.18, 0.001),
+                             substrate=substrate, atmosphere=atmosphere)
+
+    sensor = passive(37e9, [30, 50])
+    wf = Model("iba", DORT, rtsolver_options=dict(temperature_weighting_functions=True)).run(sensor, snowpack([250, 255, 260], 270))
+
+    assert wf.data.dims == ('theta', 'polarization', 'source')
+
+    temperature = np.array([[240, 250, 260], [260, 262, 265]])
+    substrate_temperature = [270, 268]
+    tb = apply_temperature_weighting_functions(wf, temperature, substrate_temperature)
+
+    for i in range(len(temperature)):
+        ref = Model("iba", DORT).run(sensor, snowpack(temperature[i], substrate_temperature[i]))
+        np.testing.assert_allclose(tb.TbV(profile=i), ref.TbV())
+        np.testing.assert_allclose(tb.TbH(profile=i), ref.TbH())
+
+    # single profile
+    tb = apply_temperature_weighting_functions(wf, temperature[0], substrate_temperature[0])
+    ref = Model("iba", DORT).run(sensor, snowpack(temperature[0], substrate_temperature[0]))
+    np.testing.assert_allclose(tb.TbV(), ref.TbV())
+
+
+def test_sky_response():
+
+    from smrt import make_soil
+    from smrt.atmosphere.simple_isotropic_atmosphere import make_atmosphere
+    from smrt.rtsolver.dort import apply_sky_radiance
+
+    def snowpack(atmosphere):
+        substrate = make_soil("flat", complex(6, 0.5), temperature=265)
+        return make_snowpack([0.3, 0.5, 0.4], "exponential", density=[250, 350, 300], temperature=[250, 255, 260],
+                             corr_length=[0.1e-3, 0.2e-3, 0.15e-3], substrate=substrate, atmosphere=atmosphere)
+
+    sensor = passive(37e9, [0, 30, 50])
+    response = Model("iba", DORT, rtsolver_options=dict(sky_response=True)).run(sensor, snowpack(None))
+
+    atmospheres = [make_atmosphere(tbdown=20, tbup=10, trans=0.9), make_atmosphere(tbdown=40, tbup=15, trans=0.8)]
+    tb = apply_sky_radiance(response, atmospheres, 37e9)
+
+    for i, atmosphere in enumerate(atmospheres):
+        ref = Model("iba", DORT).run(sensor, snowpack(atmosphere))
+        np.testing.assert_allclose(tb.TbV(atmosphere=i), ref.TbV())
+        np.testing.assert_allclose(tb.TbH(atmosphere=i), ref.TbH())
+
+    # single atmosphere
+    np.testing.assert_allclose(apply_sky_radiance(response, atmospheres[0], 37e9).TbV(), tb.TbV(atmosphere=0))
+
+
+def test_mode_threads():
+
+    sp = make_snowpack([0.3, 0.5, 10], "exponential", density=[250, 350, 300], temperature=[250, 255, 260],
+                       corr_length=[0.1e-3, 0.2e-3, 0.15e-3])
+    sensor = active(13e9, [30, 50])
+
+    def run(n_mode_threads):
+        m = Model("iba", DORT, rtsolver_options=dict(n_max_stream=16, m_max=4, n_mode_threads=n_mode_threads))
+        return m.run(sensor, sp).data.values
+
+    assert np.array_equal(run(1), run(3))
+
+
+def test_batched_eigenvalue_problems():
+
+    sp = make_snowpack([0.1, 0.2, 0.1, 0.3, 10], "exponential", density=[300, 300, 250, 300, 250], temperature=250,
+                       corr_length=[0.1e-3, 0.2e-3, 0.15e-3, 0.3e-3, 0.2e-3])
+    sensor = active(13e9, [30, 50])
+
+    def run(**kwargs):
+        return Model("iba", DORT, rtsolver_options=dict(n_max_stream=16, **kwargs)).run(sensor, sp).data.values
+
+    # with prune_deep_snowpack the layers are solved one by one
+    np.testing.assert_allclose(run(), run(prune_deep_snowpack=1000), rtol=1e-12)
+
+
+def test_batched_eigenvalue_problems_error_handling():
+
+    from smrt.emmodel.iba import IBA
+
+    class OverScatteringIBA(IBA):
+        # the scattering coefficient is inconsistent with the phase function in the layers with large grains
+        def __init__(self, sensor, layer):
+            super().__init__(sensor, layer)
+            if layer.microstructure.corr_length > 0.15e-3:
+                self.ks *= 2
+
+    sp = make_snowpack([0.1, 0.2, 0.1, 10], "exponential", density=300, temperature=250,
+                       corr_length=[0.1e-3, 0.2e-3, 0.1e-3, 0.1e-3])
+    sensor = passive(37e9, [30, 50])
+
+    with pytest.raises(SMRTError):
+        Model(OverScatteringIBA, DORT, rtsolver_options=dict(n_max_stream=16)).run(sensor, sp)
+
+    res = Model(OverScatteringIBA, DORT, rtsolver_options=dict(n_max_stream=16, error_handling="nan")).run(sensor, sp)
+    assert np.all(np.isnan(res.TbV()))
+
+
+def test_interpolated_stream_mode():
+
+    permittivity = np.array([1.3 + 0.001j, 2.2 + 0.001j, 1.8 + 0.001j])
+    streams = compute_stream(16, permittivity, None, mode="interpolated")
+
+    assert np.all(streams.n == 16)
+    assert streams.interpolated
+    assert streams.n_air < 16
+
+
+def test_interpolated_stream_mode_same_permittivity():
+
+    # the interpolation is exact when there is no refraction between the layers
+    sp = make_snowpack([0.3, 0.5, 10], "exponential", density=300, temperature=250, corr_length=[0.1e-3, 0.2e-3, 0.25e-3])
+    sensor = passive(37e9, [30, 50])
+
+    def run(stream_mode):
+        return Model("iba", DORT, rtsolver_options=dict(n_max_stream=16, stream_mode=stream_mode)).run(sensor, sp).data.values
+
+    np.testing.assert_allclose(run("interpolated"), run("most_refringent"), rtol=1e-8)
+
+
+@pytest.mark.parametrize("sensor", [passive(37e9, [30, 50]), active(13e9, [30, 50])])
+def test_interpolated_stream_mode_accuracy(sensor):
+
+    sp = make_snowpack([0.3, 0.5, 0.2, 0.4, 10], "exponential", density=[150, 350, 250, 400, 300],
+                       temperature=[250, 255, 260, 262, 265], corr_length=[0.1e-3, 0.2e-3, 0.15e-3, 0.2e-3, 0.25e-3])
+
+    def run(n_max_stream, stream_mode):
+        m = Model("iba", DORT, rtsolver_options=dict(n_max_stream=n_max_stream, stream_mode=stream_mode))
+        res = m.run(sensor, sp)
+        return res.TbV() if sensor.mode == 'P' else res.sigmaVV_dB()
+
+    ref = run(128, "most_refringent")
+
+    # accuracy in K or dB
+    np.testing.assert_allclose(run(32, "interpolated"), ref, atol=0.5)
+
+
+def test_interpolated_stream_mode_rough_interface():
+
+    go = make_interface("geometrical_optics", mean_square_slope=0.05)
+    sp = make_snowpack([0.3, 0.5, 10], "exponential", density=[200, 350, 300], temperature=[250, 255, 260],
+                       corr_length=[0.1e-3, 0.2e-3, 0.25e-3], interface=[None, go, None])
+    sensor = active(13e9, [30, 50])
+
+    def run(n_max_stream, stream_mode):
+        m = Model("iba", DORT, rtsolver_options=dict(n_max_stream=n_max_stream, stream_mode=stream_mode))
+        return m.run(sensor, sp).sigmaVV_dB()
+
+    np.testing.assert_allclose(run(32, "interpolated"), run(128, "most_refringent"), atol=0.2)
+
+
+def test_interpolated_transmission_with_diffuse_part():
+
+    # a coherent transmission interpolated between the streams combined with a dense diffuse transmission
+    mu = np.cos(np.radians(np.linspace(5, 85, 8)))
+    _, interpolation = stream_interpolation(mu, 1.5, 1.8)
+
+    coh = smrt_matrix(np.full((2, len(mu)), 0.9))
+    diff = smrt_matrix(np.random.RandomState(0).uniform(0, 0.01, (2, 2, 1, len(mu), len(mu))))
+
+    mat = InterfaceProperties.combine_coherent_diffuse_matrix(coh, diff, 0, False, interpolation=interpolation)
+    assert type(mat) is np.ndarray
+
+    mat_coh = 0.9 * np.kron(interpolation, np.eye(2))
+    np.testing.assert_allclose(mat, 2 * np.pi * diff.compress(mode=0) + mat_coh)
+
+    # the interpolation operator is summed over the source streams, the diffuse part with the muleye convention
+    emission = InterfaceProperties.combine_coherent_diffuse_muleye(coh, diff, 0, False, interpolation=interpolation)
+    np.testing.assert_allclose(emission, muleye(2 * np.pi * diff.compress(mode=0)) + np.sum(mat_coh, axis=1))
+
+
+def test_lazy_phase():
+
+    sp = make_snowpack([0.3, 0.5, 10], "exponential", density=[250, 350, 300], temperature=[250, 255, 260],
+                       corr_length=[0.1e-3, 0.2e-3, 0.15e-3])
+    sensor = active(13e9, [30, 50])
+
+    def run(lazy_phase):
+        m = Model("iba", DORT, rtsolver_options=dict(n_max_stream=16, m_max=3, lazy_phase=lazy_phase))
+        return m.run(sensor, sp).data.values
+
+    np.testing.assert_allclose(run(True), run(False), rtol=1e-10)
+
+
+def test_lazy_phase_computes_single_modes():
+    # with lazy_phase, the phase matrix of all the modes is never computed
+
+    class SingleModeIBA(IBA):
+        def ft_even_phase(self, mu_s, mu_i, m_max, npol=None):
+            raise AssertionError("all the modes are computed")
+
+    sp = make_snowpack([0.3, 10], "exponential", density=[250, 300], temperature=255, corr_length=[0.1e-3, 0.2e-3])
+    sensor = active(13e9, 40)
+
+    res = Model(SingleModeIBA, DORT, rtsolver_options=dict(n_max_stream=16, lazy_phase=True)).run(sensor, sp)
+    ref = Model(IBA, DORT, rtsolver_options=dict(n_max_stream=16)).run(sensor, sp)
+
+    np.testing.assert_allclose(res.sigmaVV(), ref.sigmaVV(), rtol=1e-10)
+
+
+def test_blockdiagonal_phase_is_not_densified(monkeypatch):
+    # the phase matrix of the mode m=0 is block diagonal in polarization, DORT uses the V and H block without densifying
+
+    class DenseIBA(IBA):
+        def ft_even_phase(self, *args, **kwargs):
+            return super().ft_even_phase(*args, **kwargs).todense()
+
+    sp = make_snowpack([0.3, 10], "exponential", density=[250, 300], temperature=255, corr_length=[0.1e-3, 0.2e-3])
+    sensor = active(13e9, 40)
+
+    ref = Model(DenseIBA, DORT, rtsolver_options=dict(n_max_stream=16, m_max=0)).run(sensor, sp)
+
+    mtypes = []
+    compress = smrt_matrix.compress
+
+    def spy_compress(self, *args, **kwargs):
+        mtypes.append(self.mtype)
+        return compress(self, *args, **kwargs)
+
+    def todense(self):
+        raise AssertionError("the matrix has been densified")
+
+    monkeypatch.setattr(smrt_matrix, "compress", spy_compress)
+    monkeypatch.setattr(smrt_matrix, "todense", todense)
+
+    res = Model(IBA, DORT, rtsolver_options=dict(n_max_stream=16, m_max=0)).run(sensor, sp)
+
+    assert "blockdiagonal5" in mtypes
+    np.testing.assert_allclose(res.sigmaVV(), ref.sigmaVV(), rtol=1e-12)
+    np.testing.assert_allclose(res.sigmaHH(), ref.sigmaHH(), rtol=1e-12)
+
+
+def test_blockdiagonal_muleye_matmul():
+
+    rng = np.random.default_rng(0)
+    mat = smrt_matrix((rng.random((2, 2, 1, 4, 4)), rng.random((1, 4, 4))), mtype="blockdiagonal5")
+    dense = mat.todense()
+
+    for auto_reduce_npol in [True, False]:
+        cmat = mat.compress(mode=0, auto_reduce_npol=auto_reduce_npol)
+        cdense = dense.compress(mode=0, auto_reduce_npol=auto_reduce_npol)
+        x = rng.random((cmat.shape[1], 2))
+
+        np.testing.assert_allclose(muleye(cmat), muleye(cdense))
+        np.testing.assert_allclose(matmul(cmat, x), matmul(cdense, x))